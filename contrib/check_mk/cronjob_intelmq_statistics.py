@@ -21,12 +21,14 @@
 with open('/var/lib/check_mk_agent/spool/70_intelmq-statistics.txt', 'w') as handle:
     handle.write("<<<local>>>\nP intelmq-statistics ")
     stats = []
-    for key in db.keys():
-        value = db.get(key)
-        if value is None:
-            value = '0'
-        else:
-            value = value.decode()
-        stats.append("%s=%s" % (key.decode(), value))
+    keys = list(db.scan_iter(count=1000))
+    for index in range(0, len(keys), 1000):
+        chunk = keys[index:index + 1000]
+        for key, value in zip(chunk, db.mget(chunk)):
+            if value is None:
+                value = '0'
+            else:
+                value = value.decode()
+            stats.append("%s=%s" % (key.decode(), value))
     handle.write("|".join(stats))
     handle.write('\n')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark for intelmq.lib.harmonization.IPAddress.
+
+Compares the time per call with implementations based on the ipaddress
+module (as used by IntelMQ up to 2.2), once with distinct addresses (more
+than the cache holds) and once with one hot address.
+
+Usage: ipaddress-benchmark.py [NUMBER_OF_CALLS]
+"""
+import binascii
+import ipaddress
+import itertools
+import random
+import socket
+import sys
+import timeit
+
+import dns.reversename
+
+from intelmq.lib.harmonization import GenericType, IPAddress
+
+
+def is_valid_ipaddress(value):
+    if not GenericType().is_valid(value):
+        return False
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return address != ipaddress.ip_address('0.0.0.0')
+
+
+def sanitize_ipaddress(value):
+    value = GenericType().sanitize(value).split('%')[0]
+    try:
+        network = ipaddress.ip_network(str(value))
+    except ValueError:
+        return None
+    if network.num_addresses == 1:
+        return GenericType().sanitize(str(network.network_address))
+
+
+def to_int_ipaddress(value):
+    try:
+        packed = socket.inet_pton(socket.AF_INET, value)
+    except OSError:
+        packed = socket.inet_pton(socket.AF_INET6, value)
+    return int(binascii.hexlify(packed), 16)
+
+
+def version_ipaddress(value):
+    return ipaddress.ip_address(value).version
+
+
+def to_reverse_ipaddress(value):
+    return str(dns.reversename.from_address(value))
+
+
+FUNCTIONS = (('is_valid', IPAddress.is_valid, is_valid_ipaddress),
+             ('sanitize', IPAddress.sanitize, sanitize_ipaddress),
+             ('to_int', IPAddress.to_int, to_int_ipaddress),
+             ('version', IPAddress.version, version_ipaddress),
+             ('to_reverse', IPAddress.to_reverse, to_reverse_ipaddress),
+             )
+
+
+def main(number: int = 100000):
+    random.seed(0)
+    addresses = ['.'.join(str(random.randint(1, 254)) for _ in range(4)) for _ in range(9000)]
+    addresses += [str(ipaddress.IPv6Address(random.getrandbits(128))) for _ in range(1000)]
+    random.shuffle(addresses)
+
+    print('%-12s %-8s %12s %12s %8s' % ('function', 'values', 'ipaddress', 'IPAddress', 'speedup'))
+    for name, function, reference in FUNCTIONS:
+        for kind, values in (('distinct', addresses), ('hot', addresses[:1])):
+            timings = []
+            for implementation in (reference, function):
+                cycle = itertools.cycle(values)
+                timings.append(timeit.timeit(lambda: implementation(next(cycle)), number=number) / number)
+            print('%-12s %-8s %10.2fus %10.2fus %7.1fx' % (name, kind, timings[0] * 1e6,
+                                                          timings[1] * 1e6, timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    main(*(int(argument) for argument in sys.argv[1:2]))
@@ -3,8 +3,10 @@
 import argparse
 import datetime
 import distutils.version
+import fcntl
 import getpass
 import http.client
+import http.server
 import importlib
 import json
 import logging
@@ -28,7 +30,7 @@
                      RUNTIME_CONF_FILE, VAR_RUN_PATH, STATE_FILE_PATH,
                      DEFAULT_LOGGING_PATH, __version_info__,
                      CONFIG_DIR, ROOT_DIR)
-from intelmq.lib import utils
+from intelmq.lib import cache, utils
 from intelmq.lib.bot_debugger import BotDebugger
 from intelmq.lib.exceptions import MissingDependencyError
 from intelmq.lib.pipeline import PipelineFactory
@@ -45,6 +47,9 @@ class Parameters(object):
     pass
 
 
+QUEUE_STATUS_CACHE_FILE = os.path.join(VAR_RUN_PATH, 'queue-status.json')
+
+
 STATUSES = {
     'starting': 0,
     'running': 1,
@@ -91,6 +96,22 @@ class Parameters(object):
 
 BOT_GROUP = {"collectors": "Collector", "parsers": "Parser", "experts": "Expert", "outputs": "Output"}
 
+# name in the statistics database: (metric name, type, help)
+STATISTICS_METRICS = OrderedDict([
+    ('total', ('intelmq_bot_messages_sent', 'counter', 'Messages sent to the destination queues of a path.')),
+    ('success', ('intelmq_bot_messages_processed', 'counter', 'Messages processed successfully.')),
+    ('failure', ('intelmq_bot_messages_failed', 'counter', 'Messages whose processing failed.')),
+    ('backpressure', ('intelmq_bot_backpressure_seconds', 'counter',
+                      'Time paused because of full destination queues.')),
+    ('cache_hits', ('intelmq_bot_cache_hits', 'counter', 'Cache lookups with result.')),
+    ('cache_misses', ('intelmq_bot_cache_misses', 'counter', 'Cache lookups without cached value.')),
+    ('cache_negative_hits', ('intelmq_bot_cache_negative_hits', 'counter',
+                             'Cache lookups answered by a negative entry.')),
+    ('cache_latency', ('intelmq_bot_cache_lookup_seconds', 'counter', 'Time spent in cache lookups.')),
+])
+QUEUE_METRIC = ('intelmq_queue_messages', 'gauge', 'Messages in the queue.')
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
 
 def log_bot_error(status, *args):
     if RETURN_TYPE == 'text':
@@ -241,6 +262,8 @@ def bot_stop(self, bot_id, getstatus=True):
         log_bot_message('stopping', bot_id)
         proc = psutil.Process(int(pid))
         try:
+            # worker processes of bots using instances_processes
+            workers = proc.children()
             proc.send_signal(signal.SIGTERM)
         except psutil.AccessDenied:
             log_bot_error('access denied', bot_id, 'STOP')
@@ -262,6 +285,15 @@ def bot_stop(self, bot_id, getstatus=True):
                 elif status is not False:
                     log_bot_error('unknown', bot_id, status)
                     return 'unknown'
+                # The main process stops only after the workers, if any are left, it has been killed
+                for worker in workers:
+                    try:
+                        if worker.is_running():
+                            self.logger.warning('Stopping remaining worker process %d of bot %s.',
+                                                worker.pid, bot_id)
+                            worker.send_signal(signal.SIGTERM)
+                    except psutil.Error:
+                        pass
                 try:
                     self.__remove_pidfile(bot_id)
                 except FileNotFoundError:  # Bot was running interactively and file has been removed already
@@ -318,6 +350,7 @@ def bot_status(self, bot_id, *, proc=None):
             module = self.__runtime_configuration[bot_id]['module']
             status = self.__status_process(pid, module, bot_id) if pid else False
             if pid and status is True:
+                self.__check_workers(pid, bot_id)
                 log_bot_message('running', bot_id)
                 return 'running'
             elif status is not False:
@@ -338,6 +371,21 @@ def bot_status(self, bot_id, *, proc=None):
             log_bot_message('disabled', bot_id)
             return 'disabled'
 
+    def __check_workers(self, pid, bot_id):
+        """
+        Warns if not all worker processes of a bot using instances_processes are running.
+        """
+        num_processes = self.controller._instances_processes(bot_id)
+        if num_processes < 2:
+            return
+        try:
+            running = len(psutil.Process(int(pid)).children())
+        except psutil.Error:
+            return
+        if running < num_processes:
+            self.logger.warning('Only %d of %d worker processes of bot %s are running.',
+                                running, num_processes, bot_id)
+
     def __check_pid(self, bot_id):
         filename = self.PIDFILE.format(bot_id)
         if os.path.isfile(filename):
@@ -740,6 +788,7 @@ def __init__(self, interactive: bool = False, return_type: str = "python", quiet
         intelmqctl [start|stop|restart|status|reload] bot-id
         intelmqctl [start|stop|restart|status|reload]
         intelmqctl list [bots|queues|queues-and-status]
+        intelmqctl metrics [--listen [host:]port]
         intelmqctl log bot-id [number-of-lines [log-level]]
         intelmqctl run bot-id message [get|pop|send]
         intelmqctl run bot-id process [--msg|--dryrun]
@@ -791,6 +840,11 @@ def __init__(self, interactive: bool = False, return_type: str = "python", quiet
 Clear a queue:
     intelmqctl clear queue-id
 
+Get the statistics of the bots and the queue sizes in the OpenMetrics format:
+    intelmqctl metrics
+Serve them via HTTP on http://127.0.0.1:9440/metrics:
+    intelmqctl metrics --listen 9440
+
 Get logs of a bot:
     intelmqctl log bot-id number-of-lines log-level
 Reads the last lines from bot log.
@@ -855,8 +909,19 @@ def __init__(self, interactive: bool = False, return_type: str = "python", quiet
             parser_list.add_argument('--non-zero', '--quiet', '-q', action='store_true',
                                      help='Only list non-empty queues '
                                           'or the IDs of enabled bots.')
+            parser_list.add_argument('--max-age', type=float, default=None, metavar='SECONDS',
+                                     help='Reuse queue counts which are at most this '
+                                          'many seconds old instead of querying the broker.')
             parser_list.set_defaults(func=self.list)
 
+            parser_metrics = subparsers.add_parser('metrics', help='Get statistics and queue sizes as OpenMetrics')
+            parser_metrics.add_argument('--listen', metavar='[HOST:]PORT',
+                                        help='Serve the metrics via HTTP on this address (default host: 127.0.0.1).')
+            parser_metrics.add_argument('--max-age', type=float, default=None, metavar='SECONDS',
+                                        help='Reuse queue counts which are at most this '
+                                             'many seconds old instead of querying the broker.')
+            parser_metrics.set_defaults(func=self.metrics)
+
             parser_clear = subparsers.add_parser('clear', help='Clear a queue')
             parser_clear.add_argument('queue', help='queue name')
             parser_clear.set_defaults(func=self.clear_queue)
@@ -1106,6 +1171,24 @@ def bot_disable(self, bot_id):
     def _is_enabled(self, bot_id):
         return self.runtime_configuration[bot_id].get('enabled', True)
 
+    def _instances_processes(self, bot_id) -> int:
+        """
+        Returns the number of worker processes of the bot (parameter instances_processes).
+        """
+        parameters = self.runtime_configuration.get(bot_id, {}).get('parameters', {})
+        return int(parameters.get('instances_processes',
+                                  getattr(self.parameters, 'instances_processes', 1)))
+
+    def _internal_queues(self, bot_id, source_queue) -> list:
+        """
+        Returns the names of the internal queues of the bot,
+        one for each worker process if instances_processes is used.
+        """
+        num_processes = self._instances_processes(bot_id)
+        if num_processes > 1:
+            return ['%s-internal.%d' % (source_queue, i) for i in range(num_processes)]
+        return [source_queue + '-internal']
+
     def botnet_start(self, group=None):
         botnet_status = {}
         log_botnet_message('starting', group)
@@ -1196,13 +1279,13 @@ def botnet_status(self, group=None):
                 retval = 1
         return retval, botnet_status
 
-    def list(self, kind=None, non_zero=False):
+    def list(self, kind=None, non_zero=False, max_age=None):
         if kind == 'queues':
-            return self.list_queues(non_zero=non_zero)
+            return self.list_queues(non_zero=non_zero, max_age=max_age)
         elif kind == 'bots':
             return self.list_bots(non_zero=non_zero)
         elif kind == 'queues-and-status':
-            q = self.list_queues()
+            q = self.list_queues(max_age=max_age)
             b = self.botnet_status()
             return q[0] | b[0], [q[1], b[1]]
 
@@ -1254,7 +1337,7 @@ def get_queues(self, with_internal_queues=False):
             if 'source-queue' in value:
                 source_queues.add(value['source-queue'])
                 if with_internal_queues:
-                    internal_queues.add(value['source-queue'] + '-internal')
+                    internal_queues.update(self._internal_queues(botid, value['source-queue']))
             if 'destination-queues' in value:
                 # flattens ["one", "two"] → {"one", "two"}, {"_default": "one", "other": ["two", "three"]} → {"one", "two", "three"}
                 destination_queues.update(utils.flatten_queues(value['destination-queues']))
@@ -1263,15 +1346,57 @@ def get_queues(self, with_internal_queues=False):
 
         return source_queues, destination_queues, internal_queues, all_queues
 
-    def list_queues(self, non_zero=False):
+    def _count_queues(self):
+        """
+        Queries the broker for the number of messages in all queues.
+
+        Returns:
+            counters: dictionary of queue names and their counts
+            has_internal_queues: if the broker uses internal queues
+        """
         pipeline = PipelineFactory.create(self.parameters, logger=self.logger)
         pipeline.set_queues(None, "source")
         pipeline.connect()
-        source_queues, destination_queues, internal_queues,\
-            all_queues = self.get_queues(with_internal_queues=pipeline.has_internal_queues)
-
+        all_queues = self.get_queues(with_internal_queues=pipeline.has_internal_queues)[3]
         counters = pipeline.count_queued_messages(*all_queues)
         pipeline.disconnect()
+        return counters, pipeline.has_internal_queues
+
+    def _count_queues_cached(self, max_age, cache_file=QUEUE_STATUS_CACHE_FILE):
+        """
+        Like _count_queues, but reuses the counts stored in the cache file
+        if they are not older than max_age seconds. The file is locked
+        while refreshing, so concurrent callers wait for a single query
+        to the broker instead of all querying it at the same time.
+        """
+        with open(cache_file, 'a+') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            handle.seek(0)
+            try:
+                cache = json.load(handle)
+            except ValueError:
+                cache = {}
+            all_queues = self.get_queues(with_internal_queues=cache.get('internal', False))[3]
+            if (0 <= time.time() - cache.get('time', 0) < max_age and
+                    all_queues <= set(cache.get('counters', {}))):
+                return cache['counters'], cache['internal']
+
+            counters, has_internal_queues = self._count_queues()
+            handle.seek(0)
+            handle.truncate()
+            json.dump({'time': time.time(), 'counters': counters,
+                       'internal': has_internal_queues}, handle)
+            return counters, has_internal_queues
+
+    def list_queues(self, non_zero=False, max_age=None):
+        if max_age is None:
+            counters, has_internal_queues = self._count_queues()
+        else:
+            try:
+                counters, has_internal_queues = self._count_queues_cached(max_age)
+            except OSError as exc:
+                self.logger.warning('Could not use queue status cache: %s.', exc)
+                counters, has_internal_queues = self._count_queues()
         if RETURN_TYPE == 'text':
             for queue, counter in sorted(counters.items(), key=lambda x: str.lower(x[0])):
                 if counter or not non_zero:
@@ -1284,8 +1409,9 @@ def list_queues(self, non_zero=False):
             if 'source-queue' in info:
                 return_dict[bot_id]['source_queue'] = (
                     info['source-queue'], counters[info['source-queue']])
-                if pipeline.has_internal_queues:
-                    return_dict[bot_id]['internal_queue'] = counters[info['source-queue'] + '-internal']
+                if has_internal_queues:
+                    return_dict[bot_id]['internal_queue'] = sum(counters[queue] for queue in
+                                                                self._internal_queues(bot_id, info['source-queue']))
 
             if 'destination-queues' in info:
                 return_dict[bot_id]['destination_queues'] = []
@@ -1311,7 +1437,7 @@ def clear_queue(self, queue):
             if 'source-queue' in value:
                 queues.add(value['source-queue'])
                 if pipeline.has_internal_queues:
-                    queues.add(value['source-queue'] + '-internal')
+                    queues.update(self._internal_queues(key, value['source-queue']))
             if 'destination-queues' in value:
                 queues.update(value['destination-queues'])
 
@@ -1330,6 +1456,134 @@ def clear_queue(self, queue):
                              queue)
             return 1, 'error'
 
+    def _read_statistics(self) -> dict:
+        """
+        Reads all values of the statistics database, iterating over the
+        keys with SCAN and fetching the values with MGET.
+        """
+        statistics = cache.Cache(host=getattr(self.parameters, "statistics_host", "127.0.0.1"),
+                                 port=getattr(self.parameters, "statistics_port", "6379"),
+                                 db=int(getattr(self.parameters, "statistics_database", 3)),
+                                 password=getattr(self.parameters, "statistics_password", None),
+                                 ttl=None)
+        keys = [utils.decode(key) for key in statistics.redis.scan_iter(count=1000)]
+        values = {}
+        for index in range(0, len(keys), 1000):
+            chunk = keys[index:index + 1000]
+            values.update(zip(chunk, statistics.get_many(chunk)))
+        return values
+
+    def _collect_metrics(self, max_age=None) -> dict:
+        """
+        Collects the bot statistics and the queue sizes.
+
+        Returns:
+            metrics: dictionary of metric names and lists of (labels, value)
+        """
+        metrics = OrderedDict((metric[0], []) for metric in STATISTICS_METRICS.values())
+        for key, value in sorted(self._read_statistics().items()):
+            try:
+                bot_id, kind, name = key.rsplit('.', 2)
+            except ValueError:
+                continue
+            if value is None:
+                # expired between SCAN and MGET
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    continue
+            if kind == 'total':
+                metrics[STATISTICS_METRICS['total'][0]].append(({'bot': bot_id, 'path': name}, value))
+            elif kind == 'stats' and name in STATISTICS_METRICS:
+                metrics[STATISTICS_METRICS[name][0]].append(({'bot': bot_id}, value))
+
+        if max_age is None:
+            counters = self._count_queues()[0]
+        else:
+            counters = self._count_queues_cached(max_age)[0]
+        metrics[QUEUE_METRIC[0]] = [({'queue': queue}, counter)
+                                    for queue, counter in sorted(counters.items())]
+        return metrics
+
+    @staticmethod
+    def _format_openmetrics(metrics: dict) -> str:
+        """
+        Formats the metrics as OpenMetrics text, counters get the suffix _total.
+        """
+        types = {metric[0]: metric for metric in STATISTICS_METRICS.values()}
+        types[QUEUE_METRIC[0]] = QUEUE_METRIC
+        lines = []
+        for name, samples in metrics.items():
+            if not samples:
+                continue
+            metric_type, metric_help = types[name][1:]
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            lines.append('# HELP %s %s' % (name, metric_help))
+            suffix = '_total' if metric_type == 'counter' else ''
+            for labels, value in samples:
+                label_text = ','.join('%s="%s"' % (label, str(label_value).replace('\\', '\\\\')
+                                                   .replace('"', '\\"').replace('\n', '\\n'))
+                                      for label, label_value in sorted(labels.items()))
+                lines.append('%s%s{%s} %s' % (name, suffix, label_text, value))
+        lines.append('# EOF\n')
+        return '\n'.join(lines)
+
+    def metrics(self, listen=None, max_age=None):
+        """
+        Exports the statistics of the bots (processed and failed messages,
+        sent messages per path, back-pressure and cache counters) and the
+        queue sizes in the OpenMetrics text format.
+
+        With listen ([host:]port) an HTTP server is started which serves
+        the metrics under /metrics until it is interrupted.
+        """
+        if listen is None:
+            metrics = self._collect_metrics(max_age=max_age)
+            if RETURN_TYPE == 'text':
+                print(self._format_openmetrics(metrics), end='')
+            return 0, metrics
+
+        host, _, port = listen.rpartition(':')
+        controller = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = controller._format_openmetrics(controller._collect_metrics(max_age=max_age)).encode()
+                except Exception:
+                    controller.logger.exception('Collecting the metrics failed.')
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                controller.logger.debug(format, *args)
+
+        try:
+            server = http.server.HTTPServer((host or '127.0.0.1', int(port)), MetricsHandler)
+        except (OSError, ValueError) as exc:
+            self.abort('Can\'t listen on %r: %s' % (listen, exc))
+        self.logger.info('Serving metrics on http://%s:%d/metrics.', *server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return 0, None
+
     def read_bot_log(self, bot_id, log_level, number_of_lines):
         if self.parameters.logging_handler == 'file':
             bot_log_path = os.path.join(self.parameters.logging_path,
@@ -1463,7 +1717,17 @@ def check(self, no_connections=False):
                         retval = 1
                     else:
                         all_queues.add(files[PIPELINE_CONF_FILE][bot_id]['source-queue'])
-                        all_queues.add(files[PIPELINE_CONF_FILE][bot_id]['source-queue'] + '-internal')
+                        all_queues.update(self._internal_queues(bot_id, files[PIPELINE_CONF_FILE][bot_id]['source-queue']))
+            if bot_config.get('module') == 'intelmq.bots.experts.chain.expert':
+                for member_id in bot_config.get('parameters', {}).get('bots', []):
+                    if member_id not in files[RUNTIME_CONF_FILE]:
+                        check_logger.error('Misconfiguration: Bot %r of chain %r not found.', member_id, bot_id)
+                        retval = 1
+                    elif (bot_config.get('enabled', True) and
+                          files[RUNTIME_CONF_FILE][member_id].get('enabled', True)):
+                        check_logger.warning('Bot %r is part of the chain %r, but enabled. It should be disabled.',
+                                             member_id, bot_id)
+                        retval = 1
         if not no_connections:
             try:
                 pipeline = PipelineFactory.create(self.parameters, logger=self.logger)
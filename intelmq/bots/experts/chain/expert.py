@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a chain of bots in one process.
+
+The message objects are passed from one bot (stage) to the next in memory,
+only the chain itself receives from and sends to the pipeline.
+Every stage is an instance of the configured bot with its own parameters,
+logging and statistics.
+"""
+import importlib
+import signal
+
+from intelmq import RUNTIME_CONF_FILE
+from intelmq.lib import utils
+from intelmq.lib.bot import Bot
+from intelmq.lib.exceptions import ConfigurationError
+
+
+class ChainExpertBot(Bot):
+
+    def init(self):
+        bots = getattr(self.parameters, 'bots', [])
+        if isinstance(bots, str):
+            bots = [bot.strip() for bot in bots.split(',')]
+        if not bots:
+            raise ConfigurationError('chain', 'No bots given in parameter "bots".')
+
+        runtime_configuration = utils.load_configuration(RUNTIME_CONF_FILE)
+        # The stages must not take over the signal handlers of the chain.
+        handlers = {signum: signal.getsignal(signum)
+                    for signum in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM)}
+        self.stages = []
+        try:
+            for bot_id in bots:
+                if bot_id not in runtime_configuration:
+                    raise ConfigurationError('chain', 'Bot %r not found in runtime configuration.' % bot_id)
+                module = importlib.import_module(runtime_configuration[bot_id]['module'])
+                self.logger.debug('Initializing stage %r.', bot_id)
+                self.stages.append(module.BOT(bot_id, disable_multithreading=True))
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def shutdown(self):
+        for stage in getattr(self, 'stages', ()):
+            stage.shutdown()
+            if stage.logger is not self.logger:
+                stage.logger.handlers = []
+
+    @staticmethod
+    def check(parameters):
+        if not parameters.get('bots'):
+            return [['error', 'Parameter "bots" must be a non-empty list of bot IDs.']]
+
+    def process(self):
+        message = self.receive_message()
+
+        # work on a copy, the original is needed in case of retries and dumps
+        pending = [message.copy()]
+        output = []
+        for stage in self.stages:
+            forwarded = []
+            for message in pending:
+                for sent_message, path, path_permissive in stage.process_fused(message):
+                    if path == '_default':
+                        forwarded.append(sent_message)
+                    else:
+                        output.append((sent_message, path, path_permissive))
+            pending = forwarded
+        output.extend((message, '_default', False) for message in pending)
+
+        paths = {}
+        for message, path, path_permissive in output:
+            paths.setdefault((path, path_permissive), []).append(message)
+        for (path, path_permissive), messages in paths.items():
+            self.send_message(*messages, path=path, path_permissive=path_permissive)
+        self.acknowledge_message()
+
+
+BOT = ChainExpertBot
@@ -3,7 +3,7 @@
 
 from intelmq.bots.experts.cymru_whois.lib import Cymru
 from intelmq.lib.bot import Bot
-from intelmq.lib.cache import Cache
+from intelmq.lib.cache import Cache, NEGATIVE_VALUE
 from intelmq.lib.harmonization import IPAddress
 
 MINIMUM_BGP_PREFIX_IPV4 = 24
@@ -18,7 +18,9 @@ def init(self):
                            self.parameters.redis_cache_db,
                            self.parameters.redis_cache_ttl,
                            getattr(self.parameters, "redis_cache_password",
-                                   None)
+                                   None),
+                           getattr(self.parameters, "redis_cache_local_size", 0),
+                           getattr(self.parameters, "redis_cache_negative_ttl", None)
                            )
 
         if not hasattr(self.parameters, 'overwrite'):
@@ -55,11 +57,17 @@ def process(self):
             cache_key = bin(ip_integer)[2: minimum + 2]
             result_json = self.cache.get(cache_key)
 
-            if result_json:
+            if result_json == NEGATIVE_VALUE:
+                continue
+            elif result_json:
                 result = json.loads(result_json)
             else:
                 result = Cymru.query(ip)
+                if result is None:
+                    # the lookup failed, do not cache it
+                    continue
                 if not result:
+                    self.cache.set_negative(cache_key)
                     continue
                 result_json = json.dumps(result)
                 self.cache.set(cache_key, result_json)
@@ -21,7 +21,14 @@ class Cymru():
 
     @staticmethod
     def query(ip):
+        """
+        Returns the information about the IP address as dictionary, an empty
+        dictionary if there is none (NXDOMAIN or empty answer) and None if
+        the lookup failed, e.g. on timeouts or SERVFAIL.
+        """
         raw_result = Cymru.__ip_query(ip)
+        if raw_result is None:
+            return None
         results = map(Cymru.__ip_query_parse, raw_result)
         result = None
         for res in results:
@@ -38,7 +45,7 @@ def query(ip):
                     result = res
 
         if not result:
-            return
+            return {}
 
         if "asn" in result:
             raw_result = Cymru.__asn_query(result['asn'])
@@ -49,16 +56,23 @@ def query(ip):
 
     @staticmethod
     def __query(query):
+        """
+        Returns the list of TXT records, an empty list if the name does not
+        exist or has no TXT records and None if the lookup failed.
+        """
         try:
-            for query_result in dns.resolver.query(query, rdtype='TXT'):
-                fp = io.BytesIO()
-                query_result.to_wire(fp)
-                value = fp.getvalue()[1:]  # ignore first character
-                fp.close()
-                yield utils.decode(value)
-
+            answer = dns.resolver.query(query, rdtype='TXT')
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            return []
         except dns.exception.DNSException:
             return None
+        results = []
+        for query_result in answer:
+            fp = io.BytesIO()
+            query_result.to_wire(fp)
+            results.append(utils.decode(fp.getvalue()[1:]))  # ignore first character
+            fp.close()
+        return results
 
     @staticmethod
     def __ip_query(ip):
@@ -87,7 +101,7 @@ def __asn_query(asn):
         See https://github.com/certtools/intelmq/issues/543
         """
         query_string = ASN_QUERY % (asn)
-        query = list(Cymru.__query(query_string))
+        query = Cymru.__query(query_string)
         if query:
             return query[0]
 
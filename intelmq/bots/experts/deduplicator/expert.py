@@ -20,10 +20,14 @@
     filter_keys: string with multiple keys separated by comma. Please
                  note that time.observation key is never consider by the
                  system because system will always ignore this key.
+
+    hash_digest: string ["sha256", "blake2b", "xxhash"] default: "sha256"
 """
 
+from intelmq.lib import message as libmessage
 from intelmq.lib.bot import Bot
 from intelmq.lib.cache import Cache
+from intelmq.lib.exceptions import InvalidArgument, MissingDependencyError
 
 
 class DeduplicatorExpertBot(Bot):
@@ -38,9 +42,15 @@ def init(self):
                            getattr(self.parameters, "redis_cache_password",
                                    None)
                            )
-        self.filter_keys = {k.strip() for k in
-                            self.parameters.filter_keys.split(',')}
+        self.filter_keys = frozenset(k.strip() for k in
+                                     self.parameters.filter_keys.split(','))
         self.bypass = getattr(self.parameters, "bypass", False)
+        self.hash_digest = getattr(self.parameters, "hash_digest", "sha256")
+        if self.hash_digest not in libmessage.HASH_DIGESTS:
+            raise InvalidArgument('hash_digest', got=self.hash_digest,
+                                  expected=libmessage.HASH_DIGESTS)
+        if self.hash_digest == 'xxhash' and libmessage.xxhash is None:
+            raise MissingDependencyError('xxhash', version='>=2.0.0')
 
     def process(self):
         message = self.receive_message()
@@ -49,7 +59,8 @@ def process(self):
             self.send_message(message)
         else:
             message_hash = message.hash(filter_keys=self.filter_keys,
-                                        filter_type=self.parameters.filter_type)
+                                        filter_type=self.parameters.filter_type,
+                                        digest=self.hash_digest)
 
             if not self.cache.exists(message_hash):
                 self.cache.set(message_hash, 'hash')
@@ -20,14 +20,12 @@
 """
 import socket
 
-from intelmq.lib.bot import Bot
+from intelmq.lib.bot import AsyncBot
 
 
-class GethostbynameExpertBot(Bot):
-
-    def process(self):
-        event = self.receive_message()
+class GethostbynameExpertBot(AsyncBot):
 
+    async def process_async(self, event):
         for key in ["source.", "destination."]:
             key_fqdn = key + "fqdn"
             key_ip = key + "ip"
@@ -36,7 +34,7 @@ def process(self):
             if key_ip in event:
                 continue
             try:
-                ip = socket.gethostbyname(event.get(key_fqdn))
+                ip = await self.run_blocking(socket.gethostbyname, event.get(key_fqdn))
             except socket.gaierror as exc:
                 if exc.args[0] in [-2, -4, -5, -8, -11]:
                     pass
@@ -45,8 +43,7 @@ def process(self):
             else:
                 event.add(key_ip, ip, raise_failure=False)
 
-        self.send_message(event)
-        self.acknowledge_message()
+        return event
 
 
 BOT = GethostbynameExpertBot
@@ -7,11 +7,12 @@
 import dns.reversename
 
 from intelmq.lib.bot import Bot
-from intelmq.lib.cache import Cache
+from intelmq.lib.cache import Cache, NEGATIVE_VALUE
 from intelmq.lib.harmonization import IPAddress
 
 MINIMUM_BGP_PREFIX_IPV4 = 24
 MINIMUM_BGP_PREFIX_IPV6 = 128
+# negative cache entries written by IntelMQ up to 2.2
 DNS_EXCEPTION_VALUE = "__dns-exception"
 
 
@@ -27,7 +28,9 @@ def init(self):
                            self.parameters.redis_cache_db,
                            self.parameters.redis_cache_ttl,
                            getattr(self.parameters, "redis_cache_password",
-                                   None)
+                                   None),
+                           getattr(self.parameters, "redis_cache_local_size", 0),
+                           getattr(self.parameters, "redis_cache_negative_ttl", None)
                            )
 
         if not hasattr(self.parameters, 'overwrite'):
@@ -63,7 +66,7 @@ def process(self):
             cachevalue = self.cache.get(cache_key)
             
             result = None
-            if cachevalue == DNS_EXCEPTION_VALUE:
+            if cachevalue in (NEGATIVE_VALUE, DNS_EXCEPTION_VALUE):
                 continue
             elif cachevalue:
                 result = cachevalue
@@ -79,11 +82,11 @@ def process(self):
                     else:
                         raise InvalidPTRResult
                 except (dns.exception.DNSException, InvalidPTRResult) as e:
-                    # Set default TTL for 'DNS query name does not exist' error
+                    # Set default negative TTL for 'DNS query name does not exist' error
                     ttl = None if isinstance(e, dns.resolver.NXDOMAIN) else \
                         getattr(self.parameters, "cache_ttl_invalid_response",
                                 60)
-                    self.cache.set(cache_key, DNS_EXCEPTION_VALUE, ttl)
+                    self.cache.set_negative(cache_key, ttl)
                     result = None
 
                 else:
@@ -11,7 +11,7 @@
 
 import intelmq.lib.utils as utils
 from intelmq.lib.bot import Bot
-from intelmq.lib.cache import Cache
+from intelmq.lib.cache import Cache, NEGATIVE_VALUE
 from intelmq.lib.exceptions import MissingDependencyError
 
 try:
@@ -21,6 +21,7 @@
 
 
 STATUS_CODE_ERROR = 'HTTP status code was {}. Possible problem at the connection endpoint or network issue.'
+# negative cache entries written by IntelMQ up to 2.2
 CACHE_NO_VALUE = '__no_contact'
 
 
@@ -87,7 +88,9 @@ def __initialize_cache(self):
         cache_ttl = getattr(self.parameters, 'redis_cache_ttl')
         if cache_host and cache_port and cache_db and cache_ttl:
             self.__cache = Cache(cache_host, cache_port, cache_db, cache_ttl,
-                                 getattr(self.parameters, "redis_cache_password", None))
+                                 getattr(self.parameters, "redis_cache_password", None),
+                                 getattr(self.parameters, "redis_cache_local_size", 0),
+                                 getattr(self.parameters, "redis_cache_negative_ttl", None))
 
     def process(self):
         event = self.receive_message()
@@ -124,7 +127,7 @@ def process(self):
     def __perform_cached_query(self, type, resource):
         cached_value = self.__cache.get('{}:{}'.format(type, resource))
         if cached_value:
-            if cached_value == CACHE_NO_VALUE:
+            if cached_value in (NEGATIVE_VALUE, CACHE_NO_VALUE):
                 return {}
             else:
                 return json.loads(cached_value)
@@ -137,7 +140,7 @@ def __perform_cached_query(self, type, resource):
                     """ If no abuse contact could be found, a 404 is given. """
                     try:
                         if response.json()['message'].startswith('No abuse contact found for '):
-                            self.__cache.set('{}:{}'.format(type, resource), CACHE_NO_VALUE)
+                            self.__cache.set_negative('{}:{}'.format(type, resource))
                             return {}
                     except ValueError:
                         pass
@@ -154,11 +157,14 @@ def __perform_cached_query(self, type, resource):
                                   '' % (type, status))
 
                 data = self.REPLY_TO_DATA[type](response_data)
-                self.__cache.set('{}:{}'.format(type, resource),
-                                 (json.dumps(list(data) if isinstance(data, set) else data) if data else CACHE_NO_VALUE))
+                if data:
+                    self.__cache.set('{}:{}'.format(type, resource),
+                                     json.dumps(list(data) if isinstance(data, set) else data))
+                else:
+                    self.__cache.set_negative('{}:{}'.format(type, resource))
                 return data
             except (KeyError, IndexError):
-                self.__cache.set('{}:{}'.format(type, resource), CACHE_NO_VALUE)
+                self.__cache.set_negative('{}:{}'.format(type, resource))
 
             return {}
 
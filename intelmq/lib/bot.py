@@ -6,11 +6,14 @@
   * ParserBot: base class for parsers
   * SQLBot: base classs for any bots using SQL
 """
+import asyncio
 import atexit
+import concurrent.futures
 import csv
 import fcntl
+import functools
 import io
-import json
+import itertools
 import logging
 import os
 import re
@@ -23,7 +26,7 @@
 import warnings
 from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Any, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 import psutil
 
@@ -31,16 +34,24 @@
 from intelmq import (DEFAULT_LOGGING_PATH, DEFAULTS_CONF_FILE,
                      HARMONIZATION_CONF_FILE, PIPELINE_CONF_FILE,
                      RUNTIME_CONF_FILE, __version__)
-from intelmq.lib import cache, exceptions, utils
-from intelmq.lib.pipeline import PipelineFactory
+from intelmq.lib import cache, exceptions, jsoncodec, utils
+from intelmq.lib.harmonization import DateTime
+from intelmq.lib.pipeline import Inprocess, PipelineFactory
 from intelmq.lib.utils import RewindableFileHandle, base64_decode
 
-__all__ = ['Bot', 'CollectorBot', 'ParserBot', 'SQLBot', 'OutputBot']
+__all__ = ['Bot', 'CollectorBot', 'ParserBot', 'SQLBot', 'OutputBot', 'AsyncBot']
 
 
 class Bot(object):
     """ Not to be reset when initialized again on reload. """
     __current_message = None
+    __current_messages = None
+    # Number of messages of the last batch which are still unacknowledged
+    __batch_count = 0
+    # Number of messages of the last batch which have been acknowledged
+    __batch_acknowledged = 0
+    # Number of messages of a failed batch left to process individually
+    __batch_fallback = 0
     __message_counter_delay = timedelta(seconds=2)
     __stats_cache = None
 
@@ -56,10 +67,14 @@ class Bot(object):
 
     # True for (non-main) threads of a bot instance
     is_multithreaded = False
+    # Instance number in worker processes, see parameter instances_processes
+    process_instance_id = None
     # True if the bot is thread-safe and it makes sense
     is_multithreadable = True
     # Collectors with an empty process() should set this to true, prevents endless loops (#1364)
     collector_empty_process = False
+    # Default of the parameter source_pipeline_batch_size
+    default_batch_size = 1
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
@@ -77,7 +92,9 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                                   "failure": 0,  # total number since the beginning
                                   "stats_timestamp": datetime.now(),  # stamp of last report to redis
                                   "path": defaultdict(int),  # number of messages sent to queues since last report to redis
-                                  "path_total": defaultdict(int)  # number of messages sent to queues since beginning
+                                  "path_total": defaultdict(int),  # number of messages sent to queues since beginning
+                                  "backpressure": 0.0,  # total seconds paused because of full destination queues
+                                  "backpressure_sent": 0,  # messages sent since last check of destination queues
                                   }
 
         try:
@@ -95,7 +112,7 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
             self.__load_defaults_configuration()
 
             self.__bot_id_full, self.__bot_id, self.__instance_id = self.__check_bot_id(bot_id)
-            if self.__instance_id:
+            if self.__instance_id and self.__instance_id != self.process_instance_id:
                 self.is_multithreaded = True
             self.__init_logger()
         except Exception:
@@ -111,12 +128,29 @@ def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
 
             broker = getattr(self.parameters, "source_pipeline_broker",
                              getattr(self.parameters, "broker", "redis")).title()
-            if broker != 'Amqp':
+            # Worker processes have their own connections, only the bot itself needs to allow it
+            is_multiprocessable = self.is_multithreadable
+            if broker not in ('Amqp', 'Redisstreams'):
                 self.is_multithreadable = False
 
+            """ Multiprocessing """
+            if (getattr(self.parameters, 'instances_processes', 1) > 1 and
+                    not self.__instance_id and
+                    is_multiprocessable and
+                    not disable_multithreading):
+                self.__run_processes(bot_id, int(self.parameters.instances_processes))
+            elif (getattr(self.parameters, 'instances_processes', 1) > 1 and
+                  not is_multiprocessable):
+                self.logger.error('Multiple processes are configured, but are not '
+                                  'available for this bot.')
+            elif (getattr(self.parameters, 'instances_processes', 1) > 1 and
+                  disable_multithreading):
+                self.logger.warning('Multiple processes are configured, but are not '
+                                    'available for interactive runs.')
+
             """ Multithreading """
             if (getattr(self.parameters, 'instances_threads', 0) > 1 and
-                    not self.is_multithreaded and
+                    not self.__instance_id and
                     self.is_multithreadable and
                     not disable_multithreading):
                 self.logger.handlers = []
@@ -161,7 +195,7 @@ def handle_sighup_signal_threading(signum: int,
             self._parse_common_parameters()
             self.init()
 
-            if not self.__instance_id:
+            if not self.is_multithreaded:
                 self.__sighup = threading.Event()
                 signal.signal(signal.SIGHUP, self.__handle_sighup_signal)
                 # system calls should not be interrupted, but restarted
@@ -200,6 +234,57 @@ def catch_shutdown():
         if start:
             self.start()
 
+    def __run_processes(self, bot_id: str, num_instances: int):
+        """
+        Forks the worker processes for the parameter instances_processes,
+        forwards SIGHUP and SIGTERM to them and exits when all have stopped.
+
+        The workers have the IDs bot_id.0 to bot_id.N-1, used for logging,
+        statistics and the internal queues of the Redis broker.
+        """
+        pids = []
+        for i in range(num_instances):
+            pid = os.fork()
+            if pid == 0:
+                Bot.process_instance_id = str(i)
+                # the logger of the worker is a child of this one
+                self.logger.handlers = []
+                exitcode = 0
+                try:
+                    instance = self.__class__('%s.%d' % (bot_id, i))
+                    instance.start()
+                except SystemExit as exc:
+                    exitcode = exc.code if isinstance(exc.code, int) else 1
+                except BaseException:
+                    traceback.print_exc()
+                    exitcode = 1
+                os._exit(exitcode)
+            pids.append(pid)
+        self.logger.info('Started %d worker processes with PIDs %s.', num_instances,
+                         ', '.join(map(str, pids)))
+
+        def forward_signal(signum: int, stack: Optional[object]):
+            for pid in pids:
+                try:
+                    os.kill(pid, signum)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGHUP, forward_signal)
+        signal.signal(signal.SIGTERM, forward_signal)
+        # the shell sends SIGINT to the whole process group anyway
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        exitcode = 0
+        for i, pid in enumerate(pids):
+            _, status = os.waitpid(pid, 0)
+            returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+            self.logger.info('Worker process %s.%d exited with code %d.', bot_id, i, returncode)
+            exitcode = max(exitcode, returncode)
+        self.logger.info('Bot stopped.')
+        logging.shutdown()
+        sys.exit(exitcode)
+
     def __handle_sigterm_signal(self, signum: int, stack: Optional[object]):
         """
         Calles when a SIGTERM is received. Stops the bot.
@@ -233,6 +318,14 @@ def __handle_sighup(self):
         self.__init__(self.__bot_id_full, sighup_event=self.__sighup)
         self.__connect_pipelines()
 
+    @property
+    def bot_id(self) -> str:
+        """
+        The ID of the bot, for worker processes with the process ID ([bot-id].[n]),
+        as used for logging and statistics.
+        """
+        return self.__bot_id_full
+
     def init(self):
         pass
 
@@ -256,6 +349,7 @@ def start(self, starting: bool = True, error_on_pipeline: bool = True,
                 starting = False
                 error_on_message = False
                 message_to_dump = None
+                processed = 1
 
                 if error_on_pipeline:
                     try:
@@ -266,7 +360,11 @@ def start(self, starting: bool = True, error_on_pipeline: bool = True,
                         error_on_pipeline = False
 
                 self.__handle_sighup()
-                self.process()
+                if self.__batch_size > 1 and self.__processes_batches and not self.__batch_fallback:
+                    processed = self.__process_batch()
+                else:
+                    processed = 1
+                    self.process()
                 self.__error_retries_counter = 0  # reset counter
 
             except exceptions.PipelineError as exc:
@@ -368,7 +466,7 @@ def start(self, starting: bool = True, error_on_pipeline: bool = True,
                             # https://lists.cert.at/pipermail/intelmq-users/2018-October/000085.html
                             pass
                 else:
-                    self.__message_counter["success"] += 1
+                    self.__message_counter["success"] += processed
                     do_rate_limit = True
 
                     # no errors, check for run mode: scheduled
@@ -405,22 +503,47 @@ def __stats(self, force: bool = False):
             return
 
         try:
+            temporary = {}
             for path, n in self.__message_counter["path"].items():
                 # current queue traffic
-                self.__stats_cache.set(".".join((self.__bot_id_full, "temporary", path)), n, ttl=2)
+                temporary[".".join((self.__bot_id_full, "temporary", path))] = n
                 self.__message_counter["path_total"][path] += n
                 self.__message_counter["path"][path] = 0
+            stats = {}
             for path, total in self.__message_counter["path_total"].items():
                 # total queue traffic
-                self.__stats_cache.set(".".join((self.__bot_id_full, "total", path)), total)
-            self.__stats_cache.set(".".join((self.__bot_id_full, "stats", "success")),
-                                   self.__message_counter["success"])
-            self.__stats_cache.set(".".join((self.__bot_id_full, "stats", "failure")),
-                                   self.__message_counter["failure"])
+                stats[".".join((self.__bot_id_full, "total", path))] = total
+            stats[".".join((self.__bot_id_full, "stats", "success"))] = self.__message_counter["success"]
+            stats[".".join((self.__bot_id_full, "stats", "failure"))] = self.__message_counter["failure"]
+            if self.__message_counter["backpressure"]:
+                stats[".".join((self.__bot_id_full, "stats", "backpressure"))] = self.__message_counter["backpressure"]
+            for name, value in self.__cache_statistics().items():
+                stats[".".join((self.__bot_id_full, "stats", "cache_" + name))] = value
+            # all values in one round trip
+            pipeline = self.__stats_cache.redis.pipeline(transaction=False)
+            for key, value in temporary.items():
+                pipeline.set(key, value, ex=2)
+            for key, value in stats.items():
+                pipeline.set(key, value)
+            pipeline.execute()
             self.__message_counter["stats_timestamp"] = datetime.now()
         except Exception:
             self.logger.debug('Failed to write statistics to cache, check your `statistics_*` settings.', exc_info=True)
 
+    def __cache_statistics(self) -> Dict[str, float]:
+        """
+        Sums up the counters of all caches used by the bot (the attributes
+        of type Cache), empty if there are none or they were not used yet.
+        """
+        totals = {}
+        for value in vars(self).values():
+            if isinstance(value, cache.Cache) and value is not self.__stats_cache:
+                for name, counter in value.statistics.items():
+                    totals[name] = totals.get(name, 0) + counter
+        if not any(totals.values()):
+            return {}
+        return totals
+
     def __sleep(self, remaining: Optional[float] = None, log: bool = True):
         """
         Sleep handles interrupts and changed rate_limit-parameter.
@@ -495,7 +618,8 @@ def __print_log_buffer(self):
     def __check_bot_id(self, name: str):
         res = re.fullmatch(r'([0-9a-zA-Z\-]+)(\.[0-9]+)?', name)
         if res:
-            if not (res.group(2) and threading.current_thread() == threading.main_thread()):
+            if not (res.group(2) and threading.current_thread() == threading.main_thread() and
+                    res.group(2)[1:] != self.process_instance_id):
                 return name, res.group(1), res.group(2)[1:] if res.group(2) else None
         self.__log_buffer.append(('error',
                                   "Invalid bot id, must match '"
@@ -512,6 +636,8 @@ def __connect_pipelines(self):
                                                             bot=self)
             self.__source_pipeline.connect()
             self.__current_message = None
+            self.__current_messages = None
+            self.__batch_count = 0
             self.logger.debug("Connected to source queue.")
 
         if self.__destination_queues:
@@ -545,7 +671,12 @@ def send_message(self, *messages, path: str = "_default", auto_add=None,
             auto_add: ignored
             path_permissive: If true, do not raise an error if the path is
                 not configured
+
+        All given messages are handed over to the pipeline at once, which
+        allows brokers to send them in a single round trip.
         """
+        raw_messages = []
+        shard_keys = []
         for message in messages:
             if not message:
                 self.logger.warning("Ignoring empty message at sending. Possible bug in bot.")
@@ -567,9 +698,81 @@ def send_message(self, *messages, path: str = "_default", auto_add=None,
                 self.__message_counter["since"] = 0
                 self.__message_counter["start"] = datetime.now()
 
-            raw_message = libmessage.MessageFactory.serialize(message)
-            self.__destination_pipeline.send(raw_message, path=path,
-                                             path_permissive=path_permissive)
+            if self.__destination_pipeline.message_objects:
+                raw_messages.append(message)
+            else:
+                raw_messages.append(libmessage.MessageFactory.serialize(message,
+                                                                        format=self.__destination_pipeline_format))
+                if self.__shard_by:
+                    shard_keys.append(self.__shard_key(message))
+
+        if raw_messages:
+            self.__wait_for_destination(path, len(raw_messages))
+            self.__destination_pipeline.send_batch(raw_messages, path=path,
+                                                   path_permissive=path_permissive,
+                                                   shard_keys=shard_keys or None)
+
+    def __wait_for_destination(self, path: str, count: int):
+        """
+        Pauses sending if a destination queue of the path exceeds its high
+        watermark, until all of them are below their low watermarks again.
+
+        The queues are only checked every destination_pipeline_watermark_check_interval
+        sent messages to keep the overhead low.
+
+        Parameters:
+            path: The path the messages will be sent to
+            count: Number of messages to be sent
+        """
+        if self.__high_watermark is None or self.__destination_pipeline.message_objects:
+            return
+        self.__message_counter["backpressure_sent"] += count
+        if self.__message_counter["backpressure_sent"] < self.__watermark_check_interval:
+            return
+        self.__message_counter["backpressure_sent"] = 0
+
+        watermarks = {}
+        for queue in self.__destination_pipeline.destination_queues.get(path, ()):
+            high = self.__watermark(self.__high_watermark, queue)
+            if high is not None:
+                low = self.__watermark(self.__low_watermark, queue)
+                watermarks[queue] = (high, high // 2 if low is None else low)
+        if not watermarks:
+            return
+
+        counts = self.__destination_pipeline.count_queued_messages(*watermarks)
+        full = sorted(queue for queue, count in counts.items() if count > watermarks[queue][0])
+        if not full:
+            return
+        self.logger.info("Destination queue(s) %s exceeded the high watermark, pausing.",
+                         ", ".join(full))
+        pausestart = starttime = time.time()
+        while any(count > watermarks[queue][1] for queue, count in counts.items()):
+            time.sleep(self.__watermark_polling_interval)
+            counts = self.__destination_pipeline.count_queued_messages(*watermarks)
+            self.__message_counter["backpressure"] += time.time() - starttime
+            starttime = time.time()
+            self.__stats()
+        self.__message_counter["backpressure"] += time.time() - starttime
+        self.logger.info("Destination queue(s) below the low watermark, resuming after %.1fs.",
+                         time.time() - pausestart)
+
+    def __shard_key(self, message: libmessage.Message) -> str:
+        """
+        Returns the key for sharded routing, the values of the shard_by
+        fields of the message. Missing fields are empty.
+        """
+        return '\n'.join(str(message.get(field, '')) for field in self.__shard_by)
+
+    @staticmethod
+    def __watermark(watermarks, queue: str) -> Optional[int]:
+        """
+        Returns the watermark of the queue, watermarks can be a single
+        number for all queues or a dictionary of queue names and numbers.
+        """
+        if isinstance(watermarks, dict):
+            return watermarks.get(queue)
+        return watermarks
 
     def receive_message(self):
         """
@@ -587,6 +790,9 @@ def receive_message(self):
         message = None
         while not message:
             message = self.__source_pipeline.receive()
+            if isinstance(message, libmessage.Message):
+                # in-process pipelines of fused bot chains pass message objects
+                break
             if not message:
                 self.logger.warning('Empty message received. Some previous bot sent invalid data.')
                 self.__handle_sighup()
@@ -600,13 +806,18 @@ def receive_message(self):
             self.__handle_sighup()
             return self.receive_message()
 
-        try:
-            self.__current_message = libmessage.MessageFactory.unserialize(message,
-                                                                           harmonization=self.harmonization)
-        except exceptions.InvalidKey as exc:
-            # In case a incoming message is malformed an does not conform with the currently
-            # loaded harmonization, stop now as this will happen repeatedly without any change
-            raise exceptions.ConfigurationError('harmonization', exc.args[0])
+        if isinstance(message, libmessage.Message):
+            self.__current_message = message
+        else:
+            try:
+                self.__current_message = libmessage.MessageFactory.unserialize(message,
+                                                                               harmonization=self.harmonization,
+                                                                               trusted=self.__source_pipeline_trusted,
+                                                                               lazy=self.__source_pipeline_lazy)
+            except exceptions.InvalidKey as exc:
+                # In case a incoming message is malformed an does not conform with the currently
+                # loaded harmonization, stop now as this will happen repeatedly without any change
+                raise exceptions.ConfigurationError('harmonization', exc.args[0])
 
         if self.logger.isEnabledFor(logging.DEBUG):
             if 'raw' in self.__current_message and len(self.__current_message['raw']) > 400:
@@ -626,10 +837,181 @@ def acknowledge_message(self):
         """
         if self.__source_pipeline:
             self.__source_pipeline.acknowledge()
+        if self.__batch_fallback:
+            self.__batch_fallback -= 1
 
         # free memory of last message
         self.__current_message = None
 
+    def receive_messages(self, max_n: Optional[int] = None,
+                         max_wait: Optional[float] = None) -> List[libmessage.Message]:
+        """
+        Receives up to max_n messages at once, they need to be acknowledged
+        with acknowledge_messages.
+
+        Blocks until at least one message is available. If less than max_n
+        messages are queued, waits up to max_wait seconds for more messages.
+
+        Parameters:
+            max_n: Maximum number of messages, parameter source_pipeline_batch_size by default
+            max_wait: Maximum time to wait for max_n messages in seconds,
+                parameter source_pipeline_batch_max_wait by default
+
+        Raises:
+            intelmq.lib.exceptions.DecodingError: If a message can't be decoded,
+                the messages are still unacknowledged then.
+        """
+        max_n = self.__batch_size if max_n is None else max_n
+        max_wait = self.__batch_max_wait if max_wait is None else max_wait
+
+        self.logger.debug('Waiting for up to %d incoming messages.', max_n)
+        if max_wait > 0 and max_n > 1:
+            deadline = time.time() + max_wait
+            while (self.__source_pipeline.count_queued_messages(self.__source_queues)[self.__source_queues] < max_n and
+                   time.time() < deadline):
+                time.sleep(min(0.1, max(deadline - time.time(), 0)))
+        raw_messages = self.__source_pipeline.receive_batch(max_n)
+
+        # handle a sighup which happened during blocking read, see receive_message
+        if self.__sighup.is_set():
+            self.__source_pipeline.reject_message()
+            self.__handle_sighup()
+            return self.receive_messages(max_n, max_wait)
+
+        self.__batch_count = len(raw_messages)
+        messages = []
+        for message in raw_messages:
+            if not isinstance(message, libmessage.Message):
+                try:
+                    message = libmessage.MessageFactory.unserialize(message,
+                                                                    harmonization=self.harmonization,
+                                                                    trusted=self.__source_pipeline_trusted,
+                                                                    lazy=self.__source_pipeline_lazy)
+                except exceptions.InvalidKey as exc:
+                    # see receive_message
+                    raise exceptions.ConfigurationError('harmonization', exc.args[0])
+            messages.append(message)
+        self.__current_messages = messages
+        self.logger.debug('Received %d messages.', len(messages))
+        return messages
+
+    def acknowledge_messages(self, indices: Optional[Iterable[int]] = None):
+        """
+        Acknowledges that the messages received by receive_messages have been processed.
+
+        For bots without source pipeline (collectors), this is a no-op.
+
+        Parameters:
+            indices: Positions of the processed messages in the list
+                returned by receive_messages, all messages by default.
+                The other messages stay unacknowledged, e.g. to process
+                them individually after a failure (see process_batch).
+        """
+        if indices is not None:
+            indices = set(indices)
+        if self.__source_pipeline:
+            self.__source_pipeline.acknowledge_batch(indices)
+        acknowledged = self.__batch_count if indices is None else min(len(indices), self.__batch_count)
+        self.__batch_count -= acknowledged
+        self.__batch_acknowledged += acknowledged
+
+        if not self.__batch_count:
+            # free memory of the messages
+            self.__current_messages = None
+
+    def process_batch(self, messages: List[libmessage.Message]):
+        """
+        Processes multiple messages at once, e.g. to write them to a
+        database in one request. Bots can implement this in addition to
+        process(), it is used if the parameter source_pipeline_batch_size is
+        larger than 1. The messages are received with receive_messages
+        and need to be acknowledged with acknowledge_messages.
+
+        If processing the batch fails, the messages which have not been
+        acknowledged are processed individually with process(), so that a
+        faulty message is retried and dumped alone without losing the rest
+        of the batch.
+
+        Parameters:
+            messages: The received messages
+        """
+        raise NotImplementedError
+
+    def __process_batch(self) -> int:
+        """
+        Receives a batch of messages and calls process_batch.
+
+        If the messages can't be decoded or processing fails, the
+        unacknowledged messages are processed individually by the next
+        iterations.
+
+        Returns:
+            The number of processed messages, on failures the number of
+            messages acknowledged before
+        """
+        self.__batch_count = self.__batch_acknowledged = 0
+        try:
+            messages = self.receive_messages()
+            self.process_batch(messages)
+        except (exceptions.PipelineError, exceptions.ConfigurationError, MemoryError):
+            self.__message_counter["success"] += self.__batch_acknowledged
+            raise
+        except Exception:
+            if not self.__batch_count:
+                # nothing received or already acknowledged
+                self.__message_counter["success"] += self.__batch_acknowledged
+                raise
+            self.logger.exception('Processing a batch failed, processing the %d unacknowledged messages individually now.',
+                                  self.__batch_count)
+            self.__batch_fallback = self.__batch_count
+            self.__batch_count = 0
+            self.__current_messages = None
+            # the messages stay in the internal queue and are received again
+            self.__source_pipeline.reject_message()
+            return self.__batch_acknowledged
+        return len(messages)
+
+    def process_fused(self, message: libmessage.Message) -> list:
+        """
+        Processes one message in memory, used by fused bot chains
+        (see intelmq.bots.experts.chain.expert).
+
+        Instead of the configured pipelines, an in-process pipeline hands the
+        message object to process() and collects the sent message objects,
+        nothing is serialized. Statistics are counted like for a running bot.
+
+        Parameters:
+            message: The message to process, may be modified in place
+
+        Returns:
+            List of (message, path, path_permissive) tuples of the sent messages
+
+        Raises:
+            Any exception raised by process(), it is logged and counted as failure
+        """
+        if not isinstance(self.__source_pipeline, Inprocess):
+            self.__source_pipeline = Inprocess(self.parameters, self.logger, self)
+            self.__destination_pipeline = self.__source_pipeline
+        pipeline = self.__source_pipeline
+        pipeline.incoming.append(message)
+        try:
+            self.process()
+        except Exception as exc:
+            self.__message_counter["failure"] += 1
+            if self.parameters.error_log_exception:
+                self.logger.exception("Bot has found a problem.")
+            else:
+                self.logger.error(utils.error_message_from_exc(exc))
+                self.logger.error("Bot has found a problem.")
+            raise
+        else:
+            self.__message_counter["success"] += 1
+        finally:
+            self.__current_message = None
+            sent = pipeline.reset()
+            self.__stats()
+        return sent
+
     def _dump_message(self, error_traceback, message: dict):
         self.logger.info('Dumping message to dump file.')
 
@@ -672,14 +1054,14 @@ def _dump_message(self, error_traceback, message: dict):
             else:
                 raise ValueError('Dump file was locked for more than 60s, giving up now.')
             if mode == 'r+':
-                dump_data = json.load(fp)
+                dump_data = jsoncodec.loads(fp.read())
                 dump_data.update(new_dump_data)
             else:
                 dump_data = new_dump_data
 
             fp.seek(0)
 
-            json.dump(dump_data, fp, indent=4, sort_keys=True)
+            fp.write(jsoncodec.dumps(dump_data, indent=4, sort_keys=True))
 
         self.logger.debug('Message dumped.')
 
@@ -751,6 +1133,42 @@ def __load_pipeline_configuration(self):
             raise exceptions.ConfigurationError('pipeline', "no key "
                                                             "{!r}.".format(self.__bot_id))
 
+        self.__destination_pipeline_format = getattr(self.parameters,
+                                                     'destination_pipeline_format',
+                                                     'json')
+        if self.__destination_pipeline_format not in libmessage.MESSAGE_FORMATS:
+            raise exceptions.ConfigurationError('pipeline', "Invalid destination_pipeline_format "
+                                                            "{!r}.".format(self.__destination_pipeline_format))
+        if self.__destination_pipeline_format == 'msgpack' and libmessage.msgpack is None:
+            raise exceptions.MissingDependencyError('msgpack')
+        json_backend = getattr(self.parameters, 'json_backend', 'auto')
+        try:
+            jsoncodec.set_backend(json_backend)
+        except exceptions.InvalidArgument:
+            raise exceptions.ConfigurationError('runtime', "Invalid json_backend {!r}.".format(json_backend))
+
+        self.__source_pipeline_trusted = bool(getattr(self.parameters, 'source_pipeline_trusted', False))
+        self.__batch_size = int(getattr(self.parameters, 'source_pipeline_batch_size',
+                                        self.default_batch_size))
+        self.__batch_max_wait = float(getattr(self.parameters, 'source_pipeline_batch_max_wait', 0))
+        self.__processes_batches = type(self).process_batch is not Bot.process_batch
+        if self.__batch_size > 1 and not self.__processes_batches:
+            self.logger.warning('Batches are configured, but are not supported by this bot.')
+        self.__source_pipeline_lazy = bool(getattr(self.parameters, 'source_pipeline_lazy', False))
+
+        self.__shard_by = getattr(self.parameters, 'shard_by', None) or []
+        if isinstance(self.__shard_by, str):
+            self.__shard_by = [self.__shard_by]
+
+        self.__high_watermark = getattr(self.parameters, 'destination_pipeline_high_watermark', None)
+        self.__low_watermark = getattr(self.parameters, 'destination_pipeline_low_watermark', None)
+        self.__watermark_check_interval = int(getattr(self.parameters,
+                                                      'destination_pipeline_watermark_check_interval',
+                                                      100))
+        self.__watermark_polling_interval = float(getattr(self.parameters,
+                                                          'destination_pipeline_watermark_polling_interval',
+                                                          1))
+
     def __log_configuration_parameter(self, config_name: str, option: str, value: Any):
         if "password" in option or "token" in option:
             value = "HIDDEN"
@@ -859,6 +1277,7 @@ class ParserBot(Bot):
     ignore_lines_starting = []
     handle = None
     current_line = None
+    __column_template = None
 
     def __init__(self, bot_id: str, start: bool = False, sighup_event=None,
                  disable_multithreading: bool = None):
@@ -910,7 +1329,7 @@ def parse_json(self, report: libmessage.Report):
         A basic JSON parser. Assumes a *list* of objects to be yielded
         """
         raw_report = utils.base64_decode(report.get("raw"))
-        for line in json.loads(raw_report):
+        for line in jsoncodec.loads(raw_report):
             yield line
 
     def parse_json_stream(self, report: libmessage.Report):
@@ -920,7 +1339,7 @@ def parse_json_stream(self, report: libmessage.Report):
         raw_report = utils.base64_decode(report.get("raw"))
         for line in raw_report.splitlines():
             self.current_line = line
-            yield json.loads(line)
+            yield jsoncodec.loads(line)
 
     def parse(self, report: libmessage.Report):
         """
@@ -952,6 +1371,102 @@ def parse_line(self, line: Any, report: libmessage.Report):
         """
         raise NotImplementedError
 
+    def sanitize_columns(self, rows: Iterable, columns: Dict[str, Any],
+                         time_formats: Optional[Dict[str, str]] = None,
+                         chunk_size: int = 1000):
+        """
+        Sanitizes and validates the columns of parsed rows in chunks.
+
+        Every distinct value of a column in a chunk is sanitized and
+        validated only once, instead of once per row and event.
+        Use it in parse and create the events in parse_line with
+        new_event_from_columns, e.g.::
+
+            def parse(self, report):
+                yield from self.sanitize_columns(self.parse_csv_dict(report),
+                                                 {'source.ip': 'ip', 'time.source': 'timestamp'},
+                                                 time_formats={'time.source': 'epoch_millis'})
+
+            def parse_line(self, line, report):
+                row, values = line
+                event = self.new_event_from_columns(values, report)
+
+        Parameters:
+            rows: The parsed rows, dictionaries (e.g. of parse_csv_dict) or
+                sequences (e.g. of parse_csv)
+            columns: Maps harmonization keys to the column names or indices of the rows
+            time_formats: Maps harmonization keys to the format for DateTime.convert
+            chunk_size: Number of rows validated at once
+
+        Yields:
+            A tuple of the row and a dictionary of the sanitized values by key
+            for every row. Missing and ignored values (see Message.add) are
+            left out, invalid values are given as intelmq.lib.exceptions.InvalidValue.
+            self.current_line is kept in sync with the row.
+        """
+        schema = libmessage.HarmonizationSchema.get(self.harmonization['event'])
+        fields = {}
+        for key in columns:
+            try:
+                fields[key] = schema.lookup(key)
+            except KeyError:
+                raise exceptions.InvalidKey(key)
+        time_formats = time_formats or {}
+        rows = iter(rows)
+        while True:
+            chunk = []
+            lines = []
+            for row in itertools.islice(rows, chunk_size):
+                chunk.append(row)
+                lines.append(self.current_line)
+            if not chunk:
+                return
+            sanitized = [{} for _ in chunk]
+            for key, column in columns.items():
+                indices = []
+                values = []
+                for index, row in enumerate(chunk):
+                    try:
+                        value = row[column]
+                    except (KeyError, IndexError):
+                        continue
+                    if value is None or value in libmessage.Message._IGNORED_VALUES:
+                        continue
+                    indices.append(index)
+                    values.append(value)
+                if key in time_formats:
+                    converted = DateTime.parse_many(values, time_formats[key])
+                    results = fields[key][0].sanitize_many(
+                        (value for value in converted if value is not None), fields[key][1])
+                    results.reverse()
+                    results = [None if value is None else results.pop() for value in converted]
+                else:
+                    results = fields[key][0].sanitize_many(values, fields[key][1])
+                for index, value, result in zip(indices, values, results):
+                    sanitized[index][key] = (exceptions.InvalidValue(key, value)
+                                             if result is None else result)
+            for row, line, values in zip(chunk, lines, sanitized):
+                self.current_line = line
+                yield row, values
+
+    def new_event_from_columns(self, values: Dict[str, Any],
+                               report: libmessage.Report) -> libmessage.Event:
+        """
+        Creates an event for the report with the values of sanitize_columns,
+        the values are not validated again.
+
+        Raises:
+            intelmq.lib.exceptions.InvalidValue: If one of the values is invalid.
+        """
+        for value in values.values():
+            if isinstance(value, exceptions.InvalidValue):
+                raise value
+        if self.__column_template is None or self.__column_template[0] is not report:
+            self.__column_template = (report, dict(self.new_event(report)))
+        event = self.__column_template[1].copy()
+        event.update(values)
+        return self.new_event(event, trusted=True)
+
     def process(self):
         self.tempdata = []  # temporary data for parse, parse_line and recover_line
         self.__failed = []
@@ -1058,7 +1573,8 @@ def recover_line_json(self, line: dict):
 
         Recovers a fully functional report with only the problematic pulse.
         """
-        return json.dumps([line])
+        # the formatting of the raw field does not depend on the JSON backend
+        return jsoncodec.dumps([line], ensure_ascii=True)
 
     def recover_line_json_stream(self, line: dict) -> str:
         """
@@ -1272,11 +1788,11 @@ def export_event(self, event: libmessage.Event,
             elif self.single_key == 'output':
                 retval = event.get(self.single_key)
                 if return_type is str:
-                    loaded = json.loads(retval)
+                    loaded = jsoncodec.loads(retval)
                     if isinstance(loaded, return_type):
                         return loaded
                 else:
-                    retval = json.loads(retval)
+                    retval = jsoncodec.loads(retval)
             else:
                 retval = event.get(self.single_key)
         else:
@@ -1297,5 +1813,133 @@ def export_event(self, event: libmessage.Event,
         return retval
 
 
+class AsyncBot(Bot):
+    """
+    Base class for bots waiting for network lookups or requests, e.g.
+    experts querying external services.
+
+    Instead of process, the bots implement the coroutine process_async,
+    which processes one message. Up to source_pipeline_batch_size
+    messages (default: 100) are received at once and up to `concurrency`
+    (parameter, default: 20) of them are processed concurrently, the next
+    message is started as soon as one is finished. The results of a message
+    are sent and the message is acknowledged as soon as it is finished, so
+    the order of the messages can change. Messages for which process_async
+    raises an exception are processed one by one afterwards (see
+    Bot.process_batch), so that only they are retried and dumped.
+
+    Blocking functions, e.g. of requests or dnspython, can be run in a
+    thread pool with run_blocking.
+    """
+    default_batch_size = 100
+    __loop = None
+    __executor = None
+
+    async def process_async(self, message: libmessage.Message):
+        """
+        Processes one message.
+
+        Returns:
+            The message to send, a list of messages or None to send nothing.
+            To send to another path than _default, a tuple of one of these
+            and the path.
+        """
+        raise NotImplementedError
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """
+        Runs a blocking function in a thread pool of `concurrency` threads
+        and returns its result.
+        """
+        if self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.__concurrency())
+        # get_running_loop is new in Python 3.7
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        return await loop.run_in_executor(self.__executor, functools.partial(function, *args, **kwargs))
+
+    def process(self):
+        message = self.receive_message()
+        self.__send(self.__run(self.__process(message)))
+        self.acknowledge_message()
+
+    def process_batch(self, messages: List[libmessage.Message]):
+        self.__run(self.__process_window(messages))
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        if self.__loop is not None:
+            self.__loop.close()
+            self.__loop = None
+
+    def __concurrency(self) -> int:
+        return int(getattr(self.parameters, 'concurrency', 20))
+
+    def __run(self, coroutine):
+        if self.__loop is None:
+            self.__loop = asyncio.new_event_loop()
+        return self.__loop.run_until_complete(coroutine)
+
+    async def __process(self, message: libmessage.Message) -> tuple:
+        """
+        Runs process_async and returns the list of messages to send and the path.
+        """
+        result = await self.process_async(message)
+        path = '_default'
+        if isinstance(result, tuple):
+            result, path = result
+        if result is None:
+            return [], path
+        if not isinstance(result, list):
+            return [result], path
+        return result, path
+
+    def __send(self, result: tuple):
+        messages, path = result
+        if messages:
+            self.send_message(*messages, path=path)
+
+    async def __process_window(self, messages: List[libmessage.Message]):
+        """
+        Processes the messages with up to `concurrency` coroutines at once.
+        Each message is sent and acknowledged when it is finished.
+
+        Raises:
+            The first exception raised by process_async, after all other
+            messages have been processed. The failed messages are not
+            acknowledged.
+        """
+        concurrency = self.__concurrency()
+        queued = iter(enumerate(messages))
+        running = {}
+        error = None
+        try:
+            while True:
+                for index, message in itertools.islice(queued, concurrency - len(running)):
+                    running[asyncio.ensure_future(self.__process(message))] = index
+                if not running:
+                    break
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as exc:
+                        if error is None:
+                            error = exc
+                        continue
+                    self.__send(result)
+                    self.acknowledge_messages([index])
+        finally:
+            # e.g. the pipeline failed
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(list(running))
+        if error is not None:
+            raise error
+
+
 class Parameters(object):
     pass
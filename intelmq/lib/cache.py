@@ -6,20 +6,49 @@
 Cymru Whois. It's possible to define a TTL value in each information
 inserted in cache. This TTL means how much time the system will keep an
 information in the cache.
+
+Optionally, a bounded in-process cache (least recently used values) is
+kept in front of Redis, so that repeated lookups of the same keys do not
+need a network round trip. The local entries expire with the TTL of the
+Redis keys. Changes by other processes are only seen after the local
+entries expired or were evicted.
+
+Lookups without result can be cached as well (negative caching), with a
+separate TTL, see Cache.set_negative. The cache counts its hits, misses,
+negative hits and the time spent in lookups, the bots export these
+counters to the statistics database.
 """
-from typing import Any, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
 
 import redis
 
 import intelmq.lib.utils as utils
+from intelmq.lib.exceptions import DecodingError
+
+__all__ = ['Cache', 'DEFAULT_NEGATIVE_TTL', 'NEGATIVE_VALUE']
 
-__all__ = ['Cache']
+# value of keys cached by Cache.set_negative
+NEGATIVE_VALUE = '__intelmq-cache-negative'
+# default TTL of negative entries in seconds, at most the TTL of other keys
+DEFAULT_NEGATIVE_TTL = 3600
 
 
 class Cache():
 
     def __init__(self, host: str, port: int, db: str, ttl: int,
-                 password: Optional[str] = None):
+                 password: Optional[str] = None, local_size: int = 0,
+                 negative_ttl: Optional[int] = None):
+        """
+        Parameters:
+            host, port, db, password: Connection parameters of Redis
+            ttl: Default TTL of the keys in seconds, no expiration if 0 or None
+            local_size: Maximum number of values cached in-process, 0 disables the local cache
+            negative_ttl: TTL of negative entries in seconds, by default
+                DEFAULT_NEGATIVE_TTL or ttl if it is shorter
+        """
         if host.startswith("/"):
             kwargs = {"unix_socket_path": host}
 
@@ -35,29 +64,174 @@ def __init__(self, host: str, port: int, db: str, ttl: int,
 
         self.redis = redis.Redis(db=db, password=password, **kwargs)
 
-        self.ttl = ttl
+        # the TTLs may be given as strings in the configuration
+        self.ttl = self.__int(ttl)
+        self.negative_ttl = self.__int(negative_ttl)
+        if self.negative_ttl is None:
+            self.negative_ttl = min(self.ttl, DEFAULT_NEGATIVE_TTL) if self.ttl else DEFAULT_NEGATIVE_TTL
+        self.local_size = int(local_size or 0)
+        # key: (value, expiration time or None), the least recently used first
+        self.__local = OrderedDict()
+        self.__local_lock = threading.Lock()
+        self.statistics = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'latency': 0.0}
 
     def exists(self, key: str):
-        return self.redis.exists(key)
+        starttime = time.perf_counter()
+        retval = 1 if self.__get_local(key) is not None else self.redis.exists(key)
+        self.statistics['hits' if retval else 'misses'] += 1
+        self.statistics['latency'] += time.perf_counter() - starttime
+        return retval
 
     def get(self, key: str):
-        retval = self.redis.get(key)
-        if isinstance(retval, bytes):
-            return utils.decode(retval)
+        """
+        Returns the value of the key, None if it does not exist and
+        NEGATIVE_VALUE for negative entries.
+        """
+        starttime = time.perf_counter()
+        retval = self.__get_local(key)
+        if retval is None and not self.local_size:
+            retval = self.__decode(self.redis.get(key))
+        elif retval is None:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.get(key)
+            pipeline.pttl(key)
+            retval, pttl = pipeline.execute()
+            retval = self.__decode(retval)
+            if retval is not None:
+                self.__set_local(key, retval, self.__ttl_from_pttl(pttl))
+        self.__count(retval)
+        self.statistics['latency'] += time.perf_counter() - starttime
         return retval
 
+    def get_many(self, keys: Iterable[str]) -> List[Any]:
+        """
+        Returns the values of all keys (None for missing keys) with one
+        MGET for the keys not cached locally.
+        """
+        starttime = time.perf_counter()
+        keys = list(keys)
+        retval = [self.__get_local(key) for key in keys]
+        missing = [index for index, value in enumerate(retval) if value is None]
+        if missing:
+            self.__get_many_remote(keys, retval, missing)
+        for value in retval:
+            self.__count(value)
+        self.statistics['latency'] += time.perf_counter() - starttime
+        return retval
+
+    def __get_many_remote(self, keys: List[str], retval: List[Any], missing: List[int]):
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.mget([keys[index] for index in missing])
+        if self.local_size:
+            for index in missing:
+                pipeline.pttl(keys[index])
+        results = pipeline.execute()
+        for position, index in enumerate(missing):
+            value = self.__decode(results[0][position])
+            retval[index] = value
+            if value is not None and self.local_size:
+                self.__set_local(keys[index], value, self.__ttl_from_pttl(results[1 + position]))
+
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
-        if ttl is None:
-            ttl = self.ttl
+        ttl = self.ttl if ttl is None else self.__int(ttl)
         if isinstance(value, str):
             value = utils.encode(value)
-        # backward compatibility (Redis v2.2)
-        self.redis.set(key, value)
-        if ttl:
-            self.redis.expire(key, ttl)
+        self.redis.set(key, value, ex=ttl or None)
+        self.__set_local_value(key, value, ttl)
+
+    def set_negative(self, key: str, ttl: Optional[int] = None):
+        """
+        Caches that a lookup of the key had no result: get returns
+        NEGATIVE_VALUE until the entry expires after ttl, by default negative_ttl.
+        """
+        if ttl is None:
+            ttl = self.negative_ttl
+        self.set(key, NEGATIVE_VALUE, ttl=self.__int(ttl))
+
+    def set_many(self, mapping: Dict[str, Any], ttl: Optional[int] = None):
+        """
+        Sets all keys and values of the mapping in one round trip.
+        """
+        ttl = self.ttl if ttl is None else self.__int(ttl)
+        pipeline = self.redis.pipeline(transaction=False)
+        values = {}
+        for key, value in mapping.items():
+            if isinstance(value, str):
+                value = utils.encode(value)
+            values[key] = value
+            pipeline.set(key, value, ex=ttl or None)
+        pipeline.execute()
+        for key, value in values.items():
+            self.__set_local_value(key, value, ttl)
 
     def flush(self):
         """
         Flushes the currently opened database by calling FLUSHDB.
         """
+        with self.__local_lock:
+            self.__local.clear()
         self.redis.flushdb()
+
+    def __count(self, value: Any):
+        if value is None:
+            self.statistics['misses'] += 1
+        elif value == NEGATIVE_VALUE:
+            self.statistics['negative_hits'] += 1
+        else:
+            self.statistics['hits'] += 1
+
+    @staticmethod
+    def __int(value) -> Optional[int]:
+        return None if value is None else int(value)
+
+    @staticmethod
+    def __decode(value):
+        if isinstance(value, bytes):
+            return utils.decode(value)
+        return value
+
+    @staticmethod
+    def __ttl_from_pttl(pttl: int) -> Optional[float]:
+        """
+        Converts the remaining time to live of a Redis key in milliseconds,
+        which is negative for keys without expiration.
+        """
+        return pttl / 1000 if pttl >= 0 else None
+
+    def __get_local(self, key: str):
+        if not self.local_size:
+            return None
+        with self.__local_lock:
+            try:
+                value, expires = self.__local[key]
+            except KeyError:
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self.__local[key]
+                return None
+            self.__local.move_to_end(key)
+            return value
+
+    def __set_local(self, key: str, value: Any, ttl: Optional[float]):
+        expires = time.monotonic() + ttl if ttl else None
+        with self.__local_lock:
+            self.__local[key] = (value, expires)
+            self.__local.move_to_end(key)
+            if len(self.__local) > self.local_size:
+                self.__local.popitem(last=False)
+
+    def __set_local_value(self, key: str, value: Any, ttl: Optional[int]):
+        """
+        Caches a value written to Redis locally, as get would return it.
+        """
+        if not self.local_size:
+            return
+        if isinstance(value, bytes):
+            try:
+                self.__set_local(key, utils.decode(value), ttl)
+                return
+            except DecodingError:
+                pass
+        # other types are converted by redis
+        with self.__local_lock:
+            self.__local.pop(key, None)
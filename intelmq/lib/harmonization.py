@@ -23,13 +23,14 @@
  - UppercaseString
  - TLP
 """
-import binascii
 import datetime
+import functools
 import ipaddress
 import json
 import re
 import socket
 import sys
+import threading
 import urllib.parse as parse
 
 import dateutil.parser
@@ -38,7 +39,7 @@
 
 import intelmq.lib.utils as utils
 
-from typing import Optional
+from typing import Any, Iterable, List, Optional, Tuple
 
 __all__ = ['Base64', 'Boolean', 'ClassificationType', 'DateTime', 'FQDN',
            'Float', 'Accuracy', 'GenericType', 'IPAddress', 'IPNetwork',
@@ -82,6 +83,37 @@ def sanitize(value) -> Optional[str]:
 
         return str(value)
 
+    @classmethod
+    def sanitize_many(cls, values: Iterable) -> List[Optional[Any]]:
+        """
+        Sanitizes and validates many values at once, e.g. a column of a feed.
+
+        Every distinct value is sanitized and validated only once.
+
+        Returns:
+            A list with the sanitized value for every valid value and None
+            for every invalid value, in the order of the given values.
+        """
+        results = {}
+        retval = []
+        for value in values:
+            # 1, 1.0 and True are equal, but not the same value
+            memo_key = (type(value), value)
+            try:
+                retval.append(results[memo_key])
+                continue
+            except KeyError:
+                pass
+            except TypeError:  # unhashable, e.g. lists
+                memo_key = None
+            sanitized = cls.sanitize(value)
+            if sanitized is not None and not cls.is_valid(sanitized):
+                sanitized = None
+            if memo_key is not None:
+                results[memo_key] = sanitized
+            retval.append(sanitized)
+        return retval
+
 
 class String(GenericType):
     """
@@ -291,6 +323,13 @@ class DateTime(String):
     The following additional conversions are available with the convert function:
     """
     midnight = datetime.time(0, 0, 0, 0)
+    # ISO 8601 / RFC 3339 timestamps with the usual variants, including 'YYYY-MM-DD HH:MM:SS'
+    __ISO_LAYOUT = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?'
+                              r'(?:(Z)|([+-])(\d{2}):?(\d{2}))?$')
+    __DATE_LAYOUT = re.compile(r'(\d{4})-(\d{2})-(\d{2})$')
+    __cache_date = None
+    # the order of the layouts per thread, the layout which matched last first
+    __local = threading.local()
 
     @staticmethod
     def is_valid(value: str, sanitize: bool = False) -> bool:
@@ -315,25 +354,87 @@ def sanitize(value: str) -> Optional[str]:
 
     @staticmethod
     def __parse(value: str) -> Optional[str]:
+        # dateutil completes timestamps without date with the current date
+        today = datetime.date.today()
+        if today != DateTime.__cache_date:
+            DateTime.__cache_date = today
+            DateTime.__parse_cached.cache_clear()
+        return DateTime.__parse_cached(value)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def __parse_cached(value: str) -> Optional[str]:
         try:
             return utils.decode(DateTime.parse_utc_isoformat(value))
         except ValueError:
             pass
 
         try:
-            value = dateutil.parser.parse(value, fuzzy=True)
+            value = DateTime.__parse_datetime(value)
             value = value.astimezone(pytz.utc)
             value = value.isoformat()
         except ValueError:
             return None
         return utils.decode(value)
 
+    @staticmethod
+    def __parse_datetime(value: str) -> datetime.datetime:
+        """
+        Parses the value like dateutil's fuzzy parser, but timestamps in
+        one of the common layouts are converted directly.
+
+        The layout which matched last is tried first, so that the layout
+        of a feed is detected only once. The order is kept per thread.
+        """
+        try:
+            layouts = DateTime.__local.layouts
+        except AttributeError:
+            layouts = DateTime.__local.layouts = list(DateTime.__LAYOUTS)
+        for index, (pattern, builder) in enumerate(layouts):
+            match = pattern.match(value)
+            if match:
+                try:
+                    result = builder(match)
+                except ValueError:  # e.g. invalid dates, let dateutil decide
+                    break
+                if index:
+                    layouts.insert(0, layouts.pop(index))
+                return result
+        return dateutil.parser.parse(value, fuzzy=True)
+
+    @staticmethod
+    def __from_iso_layout(match) -> datetime.datetime:
+        year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+        if utc:
+            tzinfo = datetime.timezone.utc
+        elif sign:
+            offset = datetime.timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            tzinfo = datetime.timezone(-offset if sign == '-' else offset)
+        else:
+            tzinfo = None
+        return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                 int(fraction.ljust(6, '0')) if fraction else 0, tzinfo)
+
+    @staticmethod
+    def __from_date_layout(match) -> datetime.datetime:
+        return datetime.datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    # the layouts converted without dateutil: (pattern, function creating the datetime from the match)
+    __LAYOUTS = ((__ISO_LAYOUT, __from_iso_layout.__func__),
+                 (__DATE_LAYOUT, __from_date_layout.__func__),
+                 )
+
     @staticmethod
     def parse_utc_isoformat(value: str) -> Optional[datetime.datetime]:
         """
         Parse format generated by datetime.isoformat() method with UTC timezone.
         It is much faster than universal dateutil parser.
         """
+        match = DateTime.__ISO_LAYOUT.match(value) if isinstance(value, str) else None
+        if match and value[10] == 'T' and value.endswith('+00:00'):
+            # the values are checked by the constructor
+            DateTime.__from_iso_layout(match)
+            return value
         try:
             datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S+00:00')
         except ValueError:
@@ -423,7 +524,7 @@ def convert_from_format_midnight(value: str, format: str) -> str:
 
     @staticmethod
     def convert_fuzzy(value) -> str:
-        value = dateutil.parser.parse(value, fuzzy=True)
+        value = DateTime.__parse_datetime(value)
         if not value.tzinfo and sys.version_info <= (3, 6):
             value = pytz.utc.localize(value)
         elif not value.tzinfo:
@@ -453,6 +554,40 @@ def convert(value, format='fuzzy') -> str:
         else:
             return DateTime.TIME_CONVERSIONS[format](value)
 
+    @staticmethod
+    def parse_many(values: Iterable, format='fuzzy') -> List[Optional[str]]:
+        """
+        Converts many values at once with the given format (see convert) and
+        sanitizes them, e.g. a column of a feed.
+
+        Every distinct value is converted only once.
+
+        Returns:
+            A list with the sanitized timestamp for every valid value and None
+            for every value which can't be converted, in the order of the given values.
+        """
+        results = {}
+        retval = []
+        for value in values:
+            memo_key = (type(value), value)
+            try:
+                retval.append(results[memo_key])
+                continue
+            except KeyError:
+                pass
+            except TypeError:
+                memo_key = None
+            try:
+                converted = DateTime.sanitize(DateTime.convert(value, format=format))
+            except (ValueError, TypeError, OverflowError):
+                converted = None
+            if converted is not None and not DateTime.is_valid(converted):
+                converted = None
+            if memo_key is not None:
+                results[memo_key] = converted
+            retval.append(converted)
+        return retval
+
 
 DateTime.TIME_CONVERSIONS = {'timestamp': DateTime.from_timestamp,
                              'windows_nt': DateTime.from_windows_nt,
@@ -674,12 +809,11 @@ def is_valid(value: str, sanitize: bool = False) -> bool:
         if not GenericType().is_valid(value):
             return False
 
-        try:
-            address = ipaddress.ip_address(value)
-        except ValueError:
+        address = IPAddress.__parse(value)
+        if address is None:
             return False
 
-        if address == ipaddress.ip_address('0.0.0.0'):
+        if address == (4, 0):  # 0.0.0.0
             return False
 
         return True
@@ -700,6 +834,16 @@ def sanitize(value: str) -> Optional[str]:
         except AttributeError:  # None
             return None
 
+        address = IPAddress.__parse(value)
+        if address is not None and address[0] == 4:
+            # IPv4 addresses accepted by inet_pton are in the normalized form already
+            return value
+
+        return IPAddress.__sanitize_network(value)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def __sanitize_network(value: str) -> Optional[str]:
         # Check if it is syntacticlly a valid IP Address/Network
         try:
             network = ipaddress.ip_network(str(value))
@@ -714,25 +858,44 @@ def sanitize(value: str) -> Optional[str]:
         return GenericType().sanitize(value)
 
     @staticmethod
-    def to_int(value: str) -> Optional[int]:
+    @functools.lru_cache(maxsize=4096)
+    def __parse(value: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns the version and the integer value of a plain IPv4 or IPv6 address, None otherwise.
+        """
         try:
-            ip_integer = socket.inet_pton(socket.AF_INET, value)
-        except socket.error:
-            try:
-                ip_integer = socket.inet_pton(socket.AF_INET6, value)
-            except socket.error:
-                return None
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+        except (OSError, ValueError):
+            pass
+        try:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, value), 'big')
+        except (OSError, ValueError):
+            return None
 
-        ip_integer = int(binascii.hexlify(ip_integer), 16)
-        return ip_integer
+    @staticmethod
+    def to_int(value: str) -> Optional[int]:
+        address = IPAddress.__parse(value)
+        if address is None:
+            return None
+        return address[1]
 
     @staticmethod
     def version(value: str) -> int:
-        return ipaddress.ip_address(value).version
+        address = IPAddress.__parse(value) if isinstance(value, str) else None
+        if address is None:
+            return ipaddress.ip_address(value).version
+        return address[0]
 
     @staticmethod
     def to_reverse(ip_addr: str) -> str:
-        return str(dns.reversename.from_address(ip_addr))
+        address = IPAddress.__parse(ip_addr) if isinstance(ip_addr, str) else None
+        if address is None:
+            return str(dns.reversename.from_address(ip_addr))
+        version, integer = address
+        if version == 4 or integer >> 32 == 0xffff:  # IPv4-mapped IPv6 addresses like dnspython
+            return '%d.%d.%d.%d.in-addr.arpa.' % (integer & 0xff, integer >> 8 & 0xff,
+                                                  integer >> 16 & 0xff, integer >> 24 & 0xff)
+        return '.'.join(reversed('%032x' % integer)) + '.ip6.arpa.'
 
 
 class IPNetwork(String):
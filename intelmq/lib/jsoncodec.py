@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+JSON encoding and decoding of messages.
+
+The messages and bots use this module instead of the json module of the
+standard library. If orjson or ujson is installed, it is used to encode
+and decode messages, otherwise the standard library. The parameter
+json_backend of the bots selects the backend explicitly, see set_backend.
+
+The output of the backends differs in formatting only (separators,
+escaping of non-ASCII characters), all of them decode to the same values,
+except for NaN and infinite floats, which orjson encodes as null.
+Where the exact formatting matters (e.g. the output of Message.to_json and
+the dump files), formatting options are given and the standard library is
+used regardless of the backend.
+"""
+import json
+from typing import Any, Union
+
+import intelmq.lib.exceptions as exceptions
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+__all__ = ['BACKEND', 'BACKENDS', 'dumps', 'loads', 'set_backend']
+
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def _ujson_dumps(obj: Any) -> str:
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+
+# name: (loads, dumps), in the order of preference
+BACKENDS = {}
+if orjson is not None:
+    BACKENDS['orjson'] = (orjson.loads, _orjson_dumps)
+if ujson is not None:
+    BACKENDS['ujson'] = (ujson.loads, _ujson_dumps)
+BACKENDS['json'] = (json.loads, json.dumps)
+
+BACKEND = next(iter(BACKENDS))
+_loads, _dumps = BACKENDS[BACKEND]
+
+
+def set_backend(backend: str) -> None:
+    """
+    Selects the backend for this process: 'orjson', 'ujson', 'json' or
+    'auto' for the first installed one of them.
+    """
+    global BACKEND, _loads, _dumps
+    if backend not in ('auto', 'orjson', 'ujson', 'json'):
+        raise exceptions.InvalidArgument('backend', got=backend,
+                                         expected=['auto', 'orjson', 'ujson', 'json'])
+    if backend == 'auto':
+        backend = next(iter(BACKENDS))
+    if backend not in BACKENDS:
+        raise exceptions.MissingDependencyError(backend)
+    BACKEND = backend
+    _loads, _dumps = BACKENDS[backend]
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Decodes a JSON document.
+
+    Documents the backend can't handle (e.g. integers larger than 64 bit or
+    NaN) are decoded by the standard library, which also raises the error
+    for invalid documents.
+    """
+    if _loads is json.loads:
+        return json.loads(data)
+    try:
+        return _loads(data)
+    except ValueError:
+        return json.loads(data)
+
+
+def dumps(obj: Any, **kwargs) -> str:
+    """
+    Encodes obj as JSON document.
+
+    Without further arguments, the formatting depends on the backend.
+    Keyword arguments of json.dumps (e.g. sort_keys, indent) request a
+    specific formatting, the standard library is used in this case.
+    For the formatting of json.dumps with default options, pass ensure_ascii=True.
+    """
+    if kwargs or _dumps is json.dumps:
+        return json.dumps(obj, **kwargs)
+    try:
+        return _dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        # e.g. integers larger than 64 bit, surrogates, non-string keys
+        return json.dumps(obj)
@@ -5,19 +5,203 @@
 Use MessageFactory to get a Message object (types Report and Event).
 """
 import hashlib
-import json
 import re
 import warnings
 from collections import defaultdict
+from collections.abc import MutableMapping
 from typing import Any, Dict, Iterable, Optional, Sequence, Union
 
 import intelmq.lib.exceptions as exceptions
 import intelmq.lib.harmonization
 from intelmq import HARMONIZATION_CONF_FILE
-from intelmq.lib import utils
+from intelmq.lib import jsoncodec, utils
 
-__all__ = ['Event', 'Message', 'MessageFactory', 'Report']
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+__all__ = ['CompactMessage', 'Event', 'HarmonizationSchema', 'LazyMessage', 'Message', 'MessageFactory', 'Report']
 VALID_MESSSAGE_TYPES = ('Event', 'Message', 'Report')
+MESSAGE_FORMATS = ('json', 'msgpack')
+HASH_DIGESTS = ('sha256', 'blake2b', 'xxhash')
+# 0xC1 is neither valid in UTF-8 nor used by msgpack, hence binary messages
+# can never be confused with JSON-encoded messages.
+BINARY_MESSAGE_PREFIX = b'\xc1'
+MSGPACK_PREFIX = BINARY_MESSAGE_PREFIX + b'\x01'
+MESSAGE_TYPE_CODES = {name[0].encode(): name for name in VALID_MESSSAGE_TYPES}
+HARMONIZATION_KEY_FORMAT = re.compile('^[a-z_](.[a-z_0-9]+)*$')
+# A key in a JSON object followed by the separator, with or without space
+LAZY_KEY_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)":( ?)')
+
+
+class InternedKeys(object):
+    """
+    Maps the harmonization keys of one message type to small integer ids.
+
+    The ids are the positions in the sorted list of keys, the fingerprint
+    identifies this list, so that producer and consumer can detect
+    differing harmonization configurations.
+    """
+    __cache = {}
+
+    def __init__(self, harmonization_config: dict):
+        self.keys = sorted(harmonization_config)
+        self.ids = {key: index for index, key in enumerate(self.keys)}
+        self.fingerprint = hashlib.sha256('\n'.join(self.keys).encode()).digest()[:4]
+
+    @classmethod
+    def get(cls, harmonization_config: dict) -> 'InternedKeys':
+        """
+        Returns the (cached) key table for the given harmonization configuration.
+        """
+        cached = cls.__cache.get(id(harmonization_config))
+        if cached is not None and cached[0] is harmonization_config:
+            return cached[1]
+        table = cls(harmonization_config)
+        if len(cls.__cache) > 16:
+            cls.__cache.clear()
+        cls.__cache[id(harmonization_config)] = (harmonization_config, table)
+        return table
+
+
+class HarmonizationField(object):
+    """
+    Compiled definition of one harmonization field.
+
+    Holds the validation and sanitation functions of the field's type and
+    the precompiled regular expressions, so that they do not need to be
+    looked up for every value.
+    """
+    __slots__ = ('config', 'is_jsondict', 'length', 'regex', 'iregex',
+                 '_is_valid', '_is_valid_subitem', '_sanitize', '_sanitize_subitem',
+                 '_sanitize_many')
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.is_jsondict = config['type'] == 'JSONDict'
+        self.length = config.get('length')
+        self.regex = re.compile(config['regex']) if 'regex' in config else None
+        self.iregex = re.compile(config['iregex'], re.IGNORECASE) if 'iregex' in config else None
+        type_instance = getattr(intelmq.lib.harmonization, config['type'], None)
+        if type_instance is None:
+            # unknown types fail only when the field is used
+            self._is_valid = self._is_valid_subitem = self._unknown_type
+            self._sanitize = self._sanitize_subitem = self._unknown_type
+            self._sanitize_many = self._unknown_type
+            return
+        type_instance = type_instance()
+        self._is_valid = type_instance.is_valid
+        self._sanitize = type_instance.sanitize
+        self._sanitize_many = type_instance.sanitize_many
+        self._is_valid_subitem = getattr(type_instance, 'is_valid_subitem', None)
+        self._sanitize_subitem = getattr(type_instance, 'sanitize_subitem', None)
+
+    def _unknown_type(self, value):
+        getattr(intelmq.lib.harmonization, self.config['type'])
+
+    def is_valid(self, value: Any, subitem: bool = False) -> tuple:
+        """
+        Validates the value, returns a tuple of the result and the reason
+        for invalid values.
+        """
+        if not (self._is_valid_subitem if subitem else self._is_valid)(value):
+            return (False, 'is_valid returned False.')
+        if self.length is not None:
+            length = len(str(value))
+            if not length <= self.length:
+                return (False, 'too long: {} > {}.'.format(length, self.length))
+        if self.regex is not None and not self.regex.search(str(value)):
+            return (False, 'regex did not match.')
+        if self.iregex is not None and not self.iregex.search(str(value)):
+            return (False, 'regex (case insensitive) did not match.')
+        return (True, )
+
+    def sanitize(self, value: Any, subitem: bool = False) -> Any:
+        return (self._sanitize_subitem if subitem else self._sanitize)(value)
+
+    def sanitize_many(self, values: Iterable, subitem: bool = False) -> list:
+        """
+        Sanitizes and validates many values like Message.add does, e.g. a
+        column of a feed. Every distinct value is checked only once.
+
+        Returns a list with the sanitized value or None for invalid values.
+        """
+        if subitem:
+            values = [self._sanitize_subitem(value) for value in values]
+            if self._is_valid_subitem is None:
+                return values
+        else:
+            values = self._sanitize_many(values)
+            if self.length is None and self.regex is None and self.iregex is None:
+                return values
+        valid = {}
+        retval = []
+        for value in values:
+            if value is not None:
+                memo_key = (type(value), value)
+                try:
+                    is_valid = valid[memo_key]
+                except KeyError:
+                    is_valid = valid[memo_key] = self.is_valid(value, subitem)[0]
+                except TypeError:  # unhashable
+                    is_valid = self.is_valid(value, subitem)[0]
+                if not is_valid:
+                    value = None
+            retval.append(value)
+        return retval
+
+
+class HarmonizationSchema(object):
+    """
+    The harmonization configuration of one message type, compiled once
+    per process.
+
+    Validates the keys on creation and holds a HarmonizationField for
+    each key. Use HarmonizationSchema.get to get the cached schema.
+    """
+    __cache = {}
+
+    def __init__(self, harmonization_config: dict):
+        for harm_key in harmonization_config:
+            if not HARMONIZATION_KEY_FORMAT.match(harm_key) and harm_key != '__type':
+                raise exceptions.InvalidKey("Harmonization key %r is invalid." % harm_key)
+        self.harmonization_config = harmonization_config
+        self.fields = {key: HarmonizationField(config)
+                       for key, config in harmonization_config.items()}
+        self.jsondict_keys = [key for key, field in self.fields.items() if field.is_jsondict]
+
+    @classmethod
+    def get(cls, harmonization_config: dict) -> 'HarmonizationSchema':
+        """
+        Returns the (cached) schema for the given harmonization configuration of one message type.
+        """
+        cached = cls.__cache.get(id(harmonization_config))
+        if cached is not None and cached[0] is harmonization_config:
+            return cached[1]
+        schema = cls(harmonization_config)
+        if len(cls.__cache) > 16:
+            cls.__cache.clear()
+        cls.__cache[id(harmonization_config)] = (harmonization_config, schema)
+        return schema
+
+    def lookup(self, key: str) -> tuple:
+        """
+        Returns the field of the key and if the key is a subitem of the field,
+        e.g. for extra.*
+
+        Raises:
+            KeyError: If the key is not valid
+        """
+        field = self.fields.get(key)
+        if field is not None:
+            return field, False
+        return self.fields[key.partition('.')[0]], True
 
 
 class MessageFactory(object):
@@ -28,7 +212,7 @@ class MessageFactory(object):
 
     @staticmethod
     def from_dict(message: dict, harmonization=None,
-                  default_type: Optional[str] = None) -> dict:
+                  default_type: Optional[str] = None, trusted: bool = False) -> dict:
         """
         Takes dictionary Message object, returns instance of correct class.
 
@@ -36,6 +220,7 @@ def from_dict(message: dict, harmonization=None,
             message: the message which should be converted to a Message object
             harmonization: a dictionary holding the used harmonization
             default_type: If '__type' is not present in message, the given type will be used
+            trusted: Take the fields as they are without validation, see Message
 
         See also:
             MessageFactory.unserialize
@@ -51,34 +236,75 @@ def from_dict(message: dict, harmonization=None,
                                              expected=VALID_MESSSAGE_TYPES,
                                              docs=HARMONIZATION_CONF_FILE)
         del message["__type"]
-        return class_reference(message, auto=True, harmonization=harmonization)
+        return class_reference(message, auto=True, harmonization=harmonization,
+                               trusted=trusted)
 
     @staticmethod
-    def unserialize(raw_message: str, harmonization: dict = None,
-                    default_type: Optional[str] = None) -> dict:
+    def unserialize(raw_message: Union[bytes, str], harmonization: dict = None,
+                    default_type: Optional[str] = None, trusted: bool = False,
+                    lazy: bool = False) -> dict:
         """
-        Takes JSON-encoded Message object, returns instance of correct class.
+        Takes JSON- or msgpack-encoded Message object, returns instance of correct class.
+
+        The format is detected automatically, msgpack-encoded messages start
+        with MSGPACK_PREFIX.
 
         Parameters:
             message: the message which should be converted to a Message object
             harmonization: a dictionary holding the used harmonization
             default_type: If '__type' is not present in message, the given type will be used
+            trusted: Take the fields as they are without validation, for messages
+                from other bots, which validated them already. See Message.
+            lazy: Return a LazyMessage for JSON-encoded messages, which decodes
+                the fields only on access. Implies trusted.
 
         See also:
             MessageFactory.from_dict
             MessageFactory.serialize
         """
-        message = Message.unserialize(raw_message)
-        return MessageFactory.from_dict(message, harmonization=harmonization,
-                                        default_type=default_type)
+        if isinstance(raw_message, bytes) and raw_message.startswith(BINARY_MESSAGE_PREFIX):
+            if harmonization is None:
+                harmonization = utils.load_configuration(HARMONIZATION_CONF_FILE)
+            message = Message.unserialize_msgpack(raw_message, harmonization)
+        elif lazy:
+            if harmonization is None:
+                harmonization = utils.load_configuration(HARMONIZATION_CONF_FILE)
+            return LazyMessage(utils.decode(raw_message), harmonization=harmonization,
+                               default_type=default_type)
+        else:
+            message = Message.unserialize(raw_message)
+        has_type = '__type' in message
+        retval = MessageFactory.from_dict(message, harmonization=harmonization,
+                                          default_type=default_type, trusted=trusted)
+        # keep the received message for sending it on unchanged, unless sanitation changed it
+        if has_type and dict.__eq__(retval, message):
+            if isinstance(raw_message, bytes) and not raw_message.startswith(BINARY_MESSAGE_PREFIX):
+                raw_message = utils.decode(raw_message)
+            retval._received = raw_message
+        return retval
 
     @staticmethod
-    def serialize(message):
+    def serialize(message, format: str = 'json') -> Union[bytes, str]:
         """
-        Takes instance of message-derived class and makes JSON-encoded Message.
+        Takes instance of message-derived class and makes JSON- or msgpack-encoded Message.
 
-        The class is saved in __type attribute.
+        The class is saved in __type attribute for JSON and in the header for msgpack.
+
+        Parameters:
+            message: The message to serialize
+            format: 'json' (default) or 'msgpack'
         """
+        if isinstance(message, LazyMessage):
+            if format == 'json':
+                return message.serialize()
+            message = message.materialize()
+        elif isinstance(message, CompactMessage):
+            message = message.to_message()
+        if format == 'msgpack':
+            return Message.serialize_msgpack(message)
+        elif format != 'json':
+            raise exceptions.InvalidArgument('format', got=format,
+                                             expected=MESSAGE_FORMATS)
         raw_message = Message.serialize(message)
         return raw_message
 
@@ -87,9 +313,29 @@ class Message(dict):
 
     _IGNORED_VALUES = ["", "-", "N/A"]
     _default_value_set = False
+    # The serialized message as received, reused for serialization until the message is modified
+    _received = None
+    # The computed hashes by filter and digest, also reset when the message is modified
+    _hashes = None
+    # The sorted keys to hash by the keys of the message and the filter
+    __hash_keys = {}
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: dict = None) -> None:
+                 harmonization: dict = None, trusted: bool = False) -> None:
+        """
+        Parameters:
+            message: Initial fields, a dictionary or a tuple of key-value pairs
+            auto: unused here
+            harmonization: Harmonization definition to use
+            trusted: If true and message is a dictionary, its fields are taken
+                as they are, without validation and sanitation. Only use this
+                for messages which have been created by other bots, values
+                added later are still validated.
+        """
+        if isinstance(message, LazyMessage):
+            message = message.materialize()
+        elif isinstance(message, CompactMessage):
+            message = dict(message.items())
         try:
             classname = message['__type'].lower()
             del message['__type']
@@ -111,11 +357,14 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
             warnings.warn("Assuming harmonization type 'JSONDict' for harmonization field 'extra'. "
                           "This assumption will be removed in version 3.0.", DeprecationWarning)
             self.harmonization_config['extra']['type'] = 'JSONDict'
-        for harm_key in self.harmonization_config.keys():
-            if not re.match('^[a-z_](.[a-z_0-9]+)*$', harm_key) and harm_key != '__type':
-                raise exceptions.InvalidKey("Harmonization key %r is invalid." % harm_key)
+        self._schema = HarmonizationSchema.get(self.harmonization_config)
 
         super().__init__()
+        # JSONDict fields given as a whole (e.g. by old versions) need to be split up
+        if (trusted and isinstance(message, dict) and
+                not any(key in message for key in self._schema.jsondict_keys)):
+            super().update(message)
+            return
         if isinstance(message, dict):
             iterable = message.items()
         elif isinstance(message, tuple):
@@ -130,10 +379,11 @@ def __setitem__(self, key: str, value: Any) -> None:
         self.add(key, value)
 
     def __getitem__(self, key) -> Any:
-        class_name, subitem = self.__get_type_config(key)
-        if class_name['type'] == 'JSONDict' and not subitem:
+        field, subitem = self.__get_field(key)
+        if field is not None and field.is_jsondict and not subitem:
             # return extra as string for backwards compatibility
-            return json.dumps(self.to_dict(hierarchical=True)[key.split('.')[0]])
+            return jsoncodec.dumps(self.to_dict(hierarchical=True)[key.split('.')[0]],
+                                   ensure_ascii=True)
         else:
             try:
                 return super().__getitem__(key)
@@ -144,6 +394,7 @@ def __getitem__(self, key) -> Any:
                     raise
 
     def __delitem__(self, item):
+        self._received = self._hashes = None
         if item == 'extra':
             for key in [key for key in self.keys() if key.startswith('extra.')]:
                 del self[key]
@@ -257,12 +508,13 @@ def add(self, key: str, value: str, sanitize: bool = True,
             else:
                 return False
 
-        class_name, subitem = self.__get_type_config(key)
-        if class_name and class_name['type'] == 'JSONDict' and not subitem:
+        self._received = self._hashes = None
+        field, subitem = self.__get_field(key)
+        if field and field.is_jsondict and not subitem:
             # for backwards compatibility allow setting the extra field as string
             if overwrite and key in self:
                 del self[key]
-            for extrakey, extravalue in json.loads(value).items():
+            for extrakey, extravalue in jsoncodec.loads(value).items():
                 # For extra we must not ignore empty or invalid values because of backwards compatibility issues #1335
                 if key != 'extra' and hasattr(extravalue, '__len__'):
                     if not len(extravalue):  # ignore empty values
@@ -280,6 +532,22 @@ def update(self, other: dict):
             if not self.add(key, value, sanitize=False, raise_failure=False, overwrite=True):
                 self.add(key, value, sanitize=True, overwrite=True)
 
+    def pop(self, *args):
+        self._received = self._hashes = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._received = self._hashes = None
+        return super().popitem()
+
+    def setdefault(self, *args):
+        self._received = self._hashes = None
+        return super().setdefault(*args)
+
+    def clear(self):
+        self._received = self._hashes = None
+        super().clear()
+
     def change(self, key: str, value: str, sanitize: bool = True):
         if key not in self:
             raise exceptions.KeyNotExists(key)
@@ -292,11 +560,13 @@ def finditems(self, keyword: str):
 
     def copy(self):
         class_ref = self.__class__.__name__
-        self['__type'] = class_ref
+        # auto: a Report must not get a time.observation the original does not have
         retval = getattr(intelmq.lib.message,
-                         class_ref)(super().copy(),
+                         class_ref)(dict(super().copy(), __type=class_ref), auto=True,
                                     harmonization={self.__class__.__name__.lower(): self.harmonization_config})
-        del self['__type']
+        if dict.__eq__(retval, self):
+            retval._received = self._received
+            retval._hashes = None if self._hashes is None else dict(self._hashes)
         return retval
 
     def deep_copy(self):
@@ -307,75 +577,100 @@ def __str__(self):
         return self.serialize()
 
     def serialize(self):
-        self['__type'] = self.__class__.__name__
-        json_dump = utils.decode(json.dumps(self))
-        del self['__type']
-        return json_dump
+        if isinstance(self._received, str):
+            return self._received
+        return jsoncodec.dumps(dict(self, __type=self.__class__.__name__))
 
     @staticmethod
     def unserialize(message_string: str):
-        message = json.loads(message_string)
+        message = jsoncodec.loads(message_string)
+        return message
+
+    def serialize_msgpack(self) -> bytes:
+        """
+        Encodes the message with msgpack, harmonization keys are replaced by integer ids.
+
+        Layout: MSGPACK_PREFIX, one byte for the type, four bytes fingerprint
+        of the key table, msgpack-encoded map.
+        Keys not in the harmonization (e.g. the subkeys of extra) are kept as strings.
+        """
+        if isinstance(self._received, bytes):
+            return self._received
+        if msgpack is None:
+            raise exceptions.MissingDependencyError('msgpack')
+        table = InternedKeys.get(self.harmonization_config)
+        ids = table.ids
+        payload = {ids.get(key, key): value for key, value in self.items()}
+        return b''.join((MSGPACK_PREFIX, self.__class__.__name__[0].encode(),
+                         table.fingerprint,
+                         msgpack.packb(payload, use_bin_type=True)))
+
+    @staticmethod
+    def unserialize_msgpack(raw_message: bytes, harmonization: dict) -> dict:
+        """
+        Decodes a message encoded by Message.serialize_msgpack into a dictionary.
+
+        Raises:
+            DecodingError: If the message is not valid or the key table differs
+        """
+        if msgpack is None:
+            raise exceptions.MissingDependencyError('msgpack')
+        if not raw_message.startswith(MSGPACK_PREFIX) or len(raw_message) < 7:
+            raise exceptions.DecodingError(object=raw_message)
+        classname = MESSAGE_TYPE_CODES.get(raw_message[2:3])
+        if classname is None:
+            raise exceptions.DecodingError(object=raw_message)
+        table = InternedKeys.get(harmonization.get(classname.lower(), {}))
+        if raw_message[3:7] != table.fingerprint:
+            raise exceptions.DecodingError(object=raw_message)
+        try:
+            payload = msgpack.unpackb(raw_message[7:], raw=False,
+                                      strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise exceptions.DecodingError(object=raw_message) from exc
+        if not isinstance(payload, dict):
+            raise exceptions.DecodingError(object=raw_message)
+        keys = table.keys
+        message = {}
+        for key, value in payload.items():
+            if isinstance(key, int):
+                if not 0 <= key < len(keys):
+                    raise exceptions.DecodingError(object=raw_message)
+                key = keys[key]
+            message[key] = value
+        message['__type'] = classname
         return message
 
     def __is_valid_key(self, key: str):
+        if key == '__type':
+            return True
         try:
-            class_name, subitem = self.__get_type_config(key)
+            self._schema.lookup(key)
         except KeyError:
             return False
-        if key in self.harmonization_config or key == '__type' or subitem:
-            return True
-        return False
+        return True
 
     def __is_valid_value(self, key: str, value: str):
         if key == '__type':
             return (True, )
-        config, subitem = self.__get_type_config(key)
-        class_reference = getattr(intelmq.lib.harmonization, config['type'])
-        if not subitem:
-            validation = class_reference().is_valid(value)
-        else:
-            validation = class_reference().is_valid_subitem(value)
-        if not validation:
-            return (False, 'is_valid returned False.')
-        if 'length' in config:
-            length = len(str(value))
-            if not length <= config['length']:
-                return (False, 'too long: {} > {}.'.format(length,
-                                                           config['length']))
-        if 'regex' in config:
-            if not re.search(config['regex'], str(value)):
-                return (False, 'regex did not match.')
-        if 'iregex' in config:
-            if not re.search(config['iregex'], str(value), re.IGNORECASE):
-                return (False, 'regex (case insensitive) did not match.')
-        return (True, )
+        field, subitem = self._schema.lookup(key)
+        return field.is_valid(value, subitem)
 
     def __sanitize_value(self, key: str, value: str):
-        class_name, subitem = self.__get_type_config(key)
-        class_reference = getattr(intelmq.lib.harmonization, class_name['type'])
-        if not subitem:
-            return class_reference().sanitize(value)
-        else:
-            return class_reference().sanitize_subitem(value)
+        field, subitem = self._schema.lookup(key)
+        return field.sanitize(value, subitem)
 
-    def __get_type_config(self, key: str):
+    def __get_field(self, key: str):
         if key == '__type':
             return None, None
-        try:
-            class_name = self.harmonization_config[key]
-        except KeyError:
-            # Could be done recursively in the future if needed
-            class_name = self.harmonization_config[key.split('.')[0]]
-            subitem = True
-        else:
-            subitem = False
-        return class_name, subitem
+        return self._schema.lookup(key)
 
     def __hash__(self):
         return int(self.hash(), 16)
 
-    def hash(self, *, filter_keys: Iterable = frozenset(), filter_type: str = "blacklist"):
-        """Return a SHA256 hash of the message as a hexadecimal string.
+    def hash(self, *, filter_keys: Iterable = frozenset(), filter_type: str = "blacklist",
+             digest: str = "sha256"):
+        """Return a hash of the message as a hexadecimal string.
         The hash is computed over almost all key/value pairs. Depending on
         filter_type parameter (blacklist or whitelist), the keys defined in
         filter_keys_list parameter will be considered as the keys to ignore
@@ -383,7 +678,21 @@ def hash(self, *, filter_keys: Iterable = frozenset(), filter_type: str = "black
         parameter should be a set.
 
         'time.observation' will always be ignored.
+
+        The digest is SHA256 by default. 'blake2b' (128 bit) and 'xxhash'
+        (XXH3 128 bit, requires the xxhash library) are faster, but give
+        other hashes for the same message.
+
+        The hashes are cached until the message is modified. Changing
+        mutable values (e.g. lists in extra fields) in place is not noticed,
+        set the changed value with change or add instead.
         """
+        filter_keys = frozenset(filter_keys)
+        if self._hashes is not None:
+            try:
+                return self._hashes[(filter_keys, filter_type, digest)]
+            except KeyError:
+                pass
 
         if filter_type not in ["whitelist", "blacklist"]:
 
@@ -391,24 +700,40 @@ def hash(self, *, filter_keys: Iterable = frozenset(), filter_type: str = "black
                                              got=filter_type,
                                              expected=['whitelist', 'blacklist'])
 
-        event_hash = hashlib.sha256()
-
-        for key, value in sorted(self.items()):
-            if "time.observation" == key:
-                continue
-
-            if filter_type == "whitelist" and key not in filter_keys:
-                continue
-
-            if filter_type == "blacklist" and key in filter_keys:
-                continue
-
-            event_hash.update(utils.encode(key))
-            event_hash.update(b"\xc0")
-            event_hash.update(utils.encode(repr(value)))
-            event_hash.update(b"\xc0")
-
-        return event_hash.hexdigest()
+        if digest == 'sha256':
+            event_hash = hashlib.sha256()
+        elif digest == 'blake2b':
+            event_hash = hashlib.blake2b(digest_size=16)
+        elif digest == 'xxhash':
+            if xxhash is None:
+                raise exceptions.MissingDependencyError('xxhash', version='>=2.0.0')
+            event_hash = xxhash.xxh3_128()
+        else:
+            raise exceptions.InvalidArgument('digest', got=digest, expected=HASH_DIGESTS)
+
+        keys_cache_key = (frozenset(self), filter_keys, filter_type)
+        keys = Message.__hash_keys.get(keys_cache_key)
+        if keys is None:
+            whitelist = filter_type == "whitelist"
+            keys = tuple(sorted(key for key in self
+                                if key != "time.observation" and (key in filter_keys) is whitelist))
+            if len(Message.__hash_keys) > 1024:
+                Message.__hash_keys.clear()
+            Message.__hash_keys[keys_cache_key] = keys
+
+        # key, 0xC0, repr(value), 0xC0 for each field
+        pieces = []
+        for key in keys:
+            pieces.append(key.encode())
+            pieces.append(repr(dict.__getitem__(self, key)).encode())
+        if pieces:
+            pieces.append(b"")
+            event_hash.update(b"\xc0".join(pieces))
+
+        if self._hashes is None:
+            self._hashes = {}
+        hexdigest = self._hashes[(filter_keys, filter_type, digest)] = event_hash.hexdigest()
+        return hexdigest
 
     def to_dict(self, hierarchical: bool = False, with_type: bool = False,
                 jsondict_as_string: bool = False) -> dict:
@@ -443,11 +768,8 @@ def to_dict(self, hierarchical: bool = False, with_type: bool = False,
                 subkeys = [key]
             json_dict_fp = new_dict  # type: Dict[str, Any]
 
-            try:
-                key_type = self.__get_type_config(splitted_key[0])[0]['type']
-            except KeyError:
-                key_type = None
-            if key_type == 'JSONDict' and jsondict_as_string:
+            field = self._schema.fields.get(splitted_key[0])
+            if field is not None and field.is_jsondict and jsondict_as_string:
                 jsondicts[splitted_key[0]]['.'.join(splitted_key[1:])] = value
                 continue
 
@@ -462,13 +784,13 @@ def to_dict(self, hierarchical: bool = False, with_type: bool = False,
                 json_dict_fp = json_dict_fp[subkey]
 
         for key, value in jsondicts.items():
-            new_dict[key] = json.dumps(value, ensure_ascii=False)
+            new_dict[key] = jsoncodec.dumps(value, ensure_ascii=False)
 
         return new_dict
 
     def to_json(self, hierarchical=False, with_type=False, jsondict_as_string=False):
         json_dict = self.to_dict(hierarchical=hierarchical, with_type=with_type)
-        return json.dumps(json_dict, ensure_ascii=False, sort_keys=True)
+        return jsoncodec.dumps(json_dict, ensure_ascii=False, sort_keys=True)
 
     def __eq__(self, other: dict) -> bool:
         """
@@ -478,6 +800,10 @@ def __eq__(self, other: dict) -> bool:
 
         Comparison with other types e.g. dicts does not check the harmonization_config.
         """
+        if isinstance(other, LazyMessage):
+            other = other.materialize()
+        elif isinstance(other, CompactMessage):
+            other = other.to_message()
         dict_eq = super().__eq__(other)
         if dict_eq and issubclass(type(other), Message):
             type_eq = type(self) == type(other)
@@ -507,7 +833,7 @@ def __contains__(self, item: str) -> bool:
 class Event(Message):
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: Optional[dict] = None) -> None:
+                 harmonization: Optional[dict] = None, trusted: bool = False) -> None:
         """
         Parameters:
             message: Give a report and feed.name, feed.url and
@@ -515,7 +841,12 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 If it's another type, the value is given to dict's init
             auto: unused here
             harmonization: Harmonization definition to use
+            trusted: Take the fields of a dictionary without validation, see Message
         """
+        if isinstance(message, LazyMessage):
+            message = message.materialize()
+        elif isinstance(message, CompactMessage):
+            message = message.to_message()
         if isinstance(message, Report):
             template = {}
             if 'feed.accuracy' in message:
@@ -536,13 +867,13 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 template['time.observation'] = message['time.observation']
         else:
             template = message
-        super().__init__(template, auto, harmonization)
+        super().__init__(template, auto, harmonization, trusted=trusted)
 
 
 class Report(Message):
 
     def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
-                 harmonization: Optional[dict] = None) -> None:
+                 harmonization: Optional[dict] = None, trusted: bool = False) -> None:
         """
         Parameters:
             message: Passed along to Message's and dict's init.
@@ -550,20 +881,457 @@ def __init__(self, message: Union[dict, tuple] = (), auto: bool = False,
                 has only the fiels which are possible in Report, all others are stripped.
             auto: if False (default), time.observation is automatically added.
             harmonization: Harmonization definition to use
+            trusted: Take the fields of a dictionary without validation, see Message
         """
+        if isinstance(message, LazyMessage):
+            message = message.materialize()
+        elif isinstance(message, CompactMessage):
+            message = message.to_message()
         if isinstance(message, Event):
             super().__init__({}, auto, harmonization)
             for key, value in message.items():
                 if self._Message__is_valid_key(key):
                     self.add(key, value, sanitize=False)
         else:
-            super().__init__(message, auto, harmonization)
+            super().__init__(message, auto, harmonization, trusted=trusted)
         if not auto and 'time.observation' not in self:
             time_observation = intelmq.lib.harmonization.DateTime().generate_datetime_now()
             self.add('time.observation', time_observation, sanitize=False)
 
-    def copy(self):
-        retval = super().copy()
-        if 'time.observation' in retval and 'time.observation' not in self:
-            del retval['time.observation']
+
+
+class LazyMessage(object):
+    """
+    Lazy view on a JSON-encoded message as written by Message.serialize.
+
+    The fields are searched in the document and decoded only when they are
+    accessed. Added values are validated like in Message.add. When
+    serialized, the changed fields are spliced into the original document,
+    the unchanged values are not encoded again.
+
+    All other operations (e.g. to_dict, items or access to the JSONDict
+    fields as a whole) convert the view into a Message object first, see
+    materialize. The values of the original document are not validated.
+    """
+    __DELETED = object()
+
+    def __init__(self, raw_message: str, harmonization: dict,
+                 default_type: Optional[str] = None):
+        self.__raw = raw_message
+        self.__harmonization = harmonization
+        self.__type = default_type
+        self.__message = None
+        self.__changes = {}
+        self.__spans = {}
+        self.__values = {}
+        match = LAZY_KEY_PATTERN.match(raw_message, 1) if raw_message.startswith('{"') else None
+        # the separators depend on the JSON backend of the writer
+        self.__key_separator = ':' + (match.group(2) if match else ' ')
+        self.__separator = ',' + (match.group(2) if match else ' ')
+        if not (raw_message == '{}' or
+                (match and raw_message.endswith('}') and
+                 self.__key_separator + '[' not in raw_message and
+                 self.__key_separator + '{' not in raw_message)):
+            # not written by Message.serialize or with nested values, decode everything now
+            self.materialize()
+            return
+        if self.__span('__type'):
+            self.__type = self.__decode('__type')
+        try:
+            self.__class = {'Event': Event, 'Report': Report, 'Message': Message}[self.__type]
+            self.__schema = HarmonizationSchema.get(harmonization[self.__type.lower()])
+        except KeyError:
+            raise exceptions.InvalidArgument('__type', got=self.__type,
+                                             expected=VALID_MESSSAGE_TYPES,
+                                             docs=HARMONIZATION_CONF_FILE)
+
+    def __span(self, key: str) -> Optional[tuple]:
+        """
+        Returns the position of the key in the document:
+        (start of the key, start of the value, end of the value)
+        None if the key does not exist.
+        """
+        try:
+            return self.__spans[key]
+        except KeyError:
+            pass
+        raw = self.__raw
+        separator = self.__separator
+        needle = jsoncodec.dumps(key) + self.__key_separator
+        if raw.startswith(needle, 1):
+            start = 1
+        else:
+            # quotes inside of strings are always escaped, so the separator and a quote only occur before keys
+            start = raw.find(separator + needle)
+            if start != -1:
+                start += len(separator)
+        if start == -1:
+            span = None
+        else:
+            end = raw.find(separator + '"', start + len(needle))
+            span = (start, start + len(needle), len(raw) - 1 if end == -1 else end)
+        self.__spans[key] = span
+        return span
+
+    def __all_keys(self) -> list:
+        """
+        Returns all keys of the original document.
+        """
+        raw = self.__raw
+        keys = []
+        position = 1
+        while raw != '{}':
+            match = LAZY_KEY_PATTERN.match(raw, position)
+            key = match.group(1)
+            keys.append(jsoncodec.loads('"%s"' % key) if '\\' in key else key)
+            position = raw.find(self.__separator + '"', match.end())
+            if position == -1:
+                return keys
+            position += len(self.__separator)
+        return keys
+
+    def __decode(self, key: str) -> Any:
+        try:
+            return self.__values[key]
+        except KeyError:
+            _, start, end = self.__span(key)
+            value = self.__values[key] = jsoncodec.loads(self.__raw[start:end])
+            return value
+
+    def __needs_message(self, key: str) -> bool:
+        """
+        Returns True if the key can't be handled by the view: JSONDict fields
+        and non-ASCII keys, as writers with the json module escape the latter.
+        """
+        if any(ord(char) > 127 for char in key):
+            return True
+        field = self.__schema.fields.get(key)
+        return field is not None and field.is_jsondict
+
+    def materialize(self) -> Message:
+        """
+        Converts the view into a Message object, which is used for all further operations.
+        """
+        if self.__message is None:
+            message = jsoncodec.loads(self.__raw)
+            for key, value in self.__changes.items():
+                if value is self.__DELETED:
+                    message.pop(key, None)
+                else:
+                    message[key] = value
+            self.__message = MessageFactory.from_dict(message, harmonization=self.__harmonization,
+                                                      default_type=self.__type, trusted=True)
+            self.__changes = self.__values = self.__spans = None
+        return self.__message
+
+    @property
+    def materialized(self) -> bool:
+        return self.__message is not None
+
+    def __getattr__(self, name: str):
+        if name.startswith('_LazyMessage__'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+    def keys(self):
+        if self.__message is not None:
+            return self.__message.keys()
+        keys = [key for key in self.__all_keys() if key != '__type' and key not in self.__changes]
+        keys.extend(key for key, value in self.__changes.items() if value is not self.__DELETED)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __bool__(self):
+        if self.__message is not None:
+            return bool(self.__message)
+        return bool(len(self))
+
+    def __contains__(self, key: str) -> bool:
+        if self.__message is not None or self.__needs_message(key):
+            return key in self.materialize()
+        if key in self.__changes:
+            return self.__changes[key] is not self.__DELETED
+        return key != '__type' and self.__span(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        if self.__message is not None or self.__needs_message(key):
+            return self.materialize()[key]
+        if key in self.__changes:
+            value = self.__changes[key]
+            if value is self.__DELETED:
+                raise KeyError(key)
+            return value
+        if key == '__type' or self.__span(key) is None:
+            raise KeyError(key)
+        return self.__decode(key)
+
+    def get(self, key: str, default=None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def add(self, key: str, value: Any, sanitize: bool = True,
+            overwrite: Optional[bool] = None, ignore: Sequence = (),
+            raise_failure: bool = True) -> Optional[bool]:
+        """
+        Adds a value like Message.add.
+        """
+        if self.__message is not None or self.__needs_message(key):
+            return self.materialize().add(key, value, sanitize=sanitize, overwrite=overwrite,
+                                          ignore=ignore, raise_failure=raise_failure)
+        exists = key in self
+        if overwrite is None and exists:
+            raise exceptions.KeyExists(key)
+        if overwrite is False and exists:
+            return False
+        if value is None or value in Message._IGNORED_VALUES:
+            if overwrite and exists:
+                del self[key]
+            return
+        # validate with an empty message of the same type
+        scratch = self.__class(harmonization=self.__harmonization, auto=True)
+        retval = scratch.add(key, value, sanitize=sanitize, ignore=ignore,
+                             raise_failure=raise_failure)
+        if retval:
+            self.__changes.update(dict.items(scratch))
+        return retval
+
+    def __setitem__(self, key: str, value: Any):
+        self.add(key, value)
+
+    def change(self, key: str, value: Any, sanitize: bool = True):
+        if key not in self:
+            raise exceptions.KeyNotExists(key)
+        return self.add(key, value, overwrite=True, sanitize=sanitize)
+
+    def update(self, other: dict):
+        for key, value in other.items():
+            if not self.add(key, value, sanitize=False, raise_failure=False, overwrite=True):
+                self.add(key, value, sanitize=True, overwrite=True)
+
+    def __delitem__(self, key: str):
+        if self.__message is not None or self.__needs_message(key):
+            del self.materialize()[key]
+            return
+        if key not in self:
+            raise KeyError(key)
+        self.__changes[key] = self.__DELETED
+
+    def serialize(self) -> str:
+        """
+        Returns the JSON-encoded message, the changed fields are spliced into the original document.
+        """
+        if self.__message is not None:
+            return self.__message.serialize()
+        if not self.__changes:
+            return self.__raw
+        raw = self.__raw
+        separator = self.__separator
+        changed = sorted(self.__span(key) + (key, ) for key in self.__changes
+                         if self.__span(key) is not None)
+        pieces = []
+        position = 0
+        for key_start, value_start, value_end, key in changed:
+            pieces.append(raw[position:key_start])
+            value = self.__changes[key]
+            if value is self.__DELETED:
+                # drop the separator before the entry, or after it for the first entry
+                if pieces[-1].endswith(separator):
+                    pieces[-1] = pieces[-1][:-len(separator)]
+                elif raw.startswith(separator, value_end):
+                    value_end += len(separator)
+            else:
+                pieces.append(raw[key_start:value_start])
+                pieces.append(jsoncodec.dumps(value))
+            position = value_end
+        pieces.append(raw[position:-1])
+        document = ''.join(pieces)
+        added = [jsoncodec.dumps(key) + self.__key_separator + jsoncodec.dumps(value)
+                 for key, value in self.__changes.items()
+                 if value is not self.__DELETED and self.__span(key) is None]
+        if added:
+            document = ''.join((document, separator if document != '{' else '', separator.join(added)))
+        return document + '}'
+
+    def __str__(self):
+        return self.serialize()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.serialize())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, LazyMessage):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __ne__(self, other) -> bool:
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.materialize())
+
+
+class CompactMessage(MutableMapping):
+    """
+    Memory-saving representation of a message for bots holding many
+    messages in memory, e.g. for sending them in batches.
+
+    Only the values are stored per message, in a tuple. The fields of the
+    harmonization are ordered by their ids in InternedKeys, other fields
+    (e.g. the subfields of extra) follow in alphabetical order. The table
+    mapping the fields to their positions, the message type and the
+    harmonization configuration are shared by all messages with the same
+    fields.
+
+    The object supports the API of Message. Reading is done on the tuple,
+    changes (e.g. add, change, update, del) are done on a temporary Message
+    object, with the same validation, and are therefore slower.
+    to_message converts it back into a Message object.
+    """
+    __slots__ = ('__layout', '__values', '__hashes')
+    __layouts = {}
+
+    def __init__(self, message: Message):
+        if isinstance(message, LazyMessage):
+            message = message.materialize()
+        elif isinstance(message, CompactMessage):
+            message = message.to_message()
+        self.__store(message)
+
+    def __store(self, message: Message):
+        config = message.harmonization_config
+        ids = InternedKeys.get(config).ids
+        other = len(ids)
+        keys = tuple(sorted(dict.keys(message), key=lambda key: (ids.get(key, other), key)))
+        cache_key = (type(message), id(config), keys)
+        layout = self.__layouts.get(cache_key)
+        if layout is None or layout[1] is not config:
+            # type, harmonization, positions of the fields, schema
+            layout = (type(message), config, {key: index for index, key in enumerate(keys)},
+                      message._schema)
+            if len(self.__layouts) > 4096:
+                self.__layouts.clear()
+            self.__layouts[cache_key] = layout
+        self.__layout = layout
+        self.__values = tuple(dict.__getitem__(message, key) for key in keys)
+        self.__hashes = None if message._hashes is None else dict(message._hashes)
+
+    def __modify(self, method: str, *args, **kwargs):
+        message = self.to_message()
+        try:
+            return getattr(message, method)(*args, **kwargs)
+        finally:
+            self.__store(message)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self.__values[self.__layout[2][key]]
+        except KeyError:
+            if key in self.__layout[3].jsondict_keys:
+                # e.g. extra as string
+                return self.to_message()[key]
+            raise
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.__layout[3].jsondict_keys:
+            return self.to_message().__contains__(key)
+        return key in self.__layout[2]
+
+    def __iter__(self):
+        return iter(self.__layout[2])
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def __setitem__(self, key: str, value: Any):
+        self.__modify('__setitem__', key, value)
+
+    def __delitem__(self, key: str):
+        self.__modify('__delitem__', key)
+
+    def add(self, *args, **kwargs) -> Optional[bool]:
+        return self.__modify('add', *args, **kwargs)
+
+    def change(self, *args, **kwargs) -> Optional[bool]:
+        return self.__modify('change', *args, **kwargs)
+
+    def update(self, other: dict):
+        self.__modify('update', other)
+
+    def clear(self):
+        self.__modify('clear')
+
+    def is_valid(self, *args, **kwargs) -> bool:
+        return self.to_message().is_valid(*args, **kwargs)
+
+    def finditems(self, keyword: str):
+        for key, value in self.items():
+            if key.startswith(keyword):
+                yield key, value
+
+    @property
+    def harmonization_config(self) -> dict:
+        return self.__layout[1]
+
+    @property
+    def _schema(self) -> HarmonizationSchema:
+        return self.__layout[3]
+
+    def to_message(self) -> Message:
+        """
+        Returns a new Message object of the original type with all fields.
+        """
+        class_reference, config, positions, _ = self.__layout
+        retval = class_reference(dict(zip(positions, self.__values)),
+                                 harmonization={class_reference.__name__.lower(): config},
+                                 trusted=True, auto=True)
+        retval._hashes = None if self.__hashes is None else dict(self.__hashes)
+        return retval
+
+    def copy(self) -> 'CompactMessage':
+        retval = CompactMessage.__new__(CompactMessage)
+        retval.__layout, retval.__values = self.__layout, self.__values
+        retval.__hashes = None if self.__hashes is None else dict(self.__hashes)
         return retval
+
+    def deep_copy(self) -> 'CompactMessage':
+        return CompactMessage(self.to_message().deep_copy())
+
+    def to_dict(self, *args, **kwargs) -> dict:
+        return self.to_message().to_dict(*args, **kwargs)
+
+    def to_json(self, *args, **kwargs) -> str:
+        return self.to_message().to_json(*args, **kwargs)
+
+    def hash(self, **kwargs) -> str:
+        message = self.to_message()
+        retval = message.hash(**kwargs)
+        self.__hashes = message._hashes
+        return retval
+
+    def __hash__(self):
+        return int(self.hash(), 16)
+
+    def serialize(self) -> str:
+        return self.to_message().serialize()
+
+    def serialize_msgpack(self) -> bytes:
+        return self.to_message().serialize_msgpack()
+
+    def __str__(self):
+        return self.serialize()
+
+    def __eq__(self, other) -> bool:
+        return self.to_message() == other
+
+    def __ne__(self, other) -> bool:
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
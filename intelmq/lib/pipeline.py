@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
+import os
+import socket
 import time
 import warnings
-from itertools import chain
-from typing import Dict, Optional, Union
+import zlib
+from itertools import chain, repeat
+from typing import Dict, Iterable, List, Optional, Union
 import ssl
 
 import redis
@@ -10,8 +13,9 @@
 import intelmq.lib.exceptions as exceptions
 import intelmq.lib.pipeline
 import intelmq.lib.utils as utils
+from intelmq.lib.message import BINARY_MESSAGE_PREFIX
 
-__all__ = ['Pipeline', 'PipelineFactory', 'Redis', 'Pythonlist', 'Amqp']
+__all__ = ['Pipeline', 'PipelineFactory', 'Redis', 'Redisstreams', 'Pythonlist', 'Inprocess', 'Amqp']
 
 try:
     import pika
@@ -22,6 +26,16 @@
 except ImportError:
     pika = None
 
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Header of compressed messages, see Pipeline._encode
+ZLIB_PREFIX = BINARY_MESSAGE_PREFIX + b'\x02'
+LZ4_PREFIX = BINARY_MESSAGE_PREFIX + b'\x03'
+COMPRESSION_ALGORITHMS = (None, 'zlib', 'lz4')
+
 
 class PipelineFactory(object):
 
@@ -61,8 +75,19 @@ def create(parameters: object, logger: object,
 
 class Pipeline(object):
     has_internal_queues = False
+    # If the pipeline passes message objects instead of serialized messages
+    message_objects = False
     # If the class currently holds a message, restricts the actions
     _has_message = False
+    # Number of messages held from the last call to receive_batch
+    _batch_size = 0
+    # Positions of the acknowledged messages of the batch
+    _batch_acknowledged = frozenset()
+    # Number of the oldest messages of the batch removed from the broker
+    _batch_removed = 0
+    # If messages of a batch can be acknowledged in any order, otherwise
+    # only the oldest messages of a batch can be removed from the broker
+    acknowledges_out_of_order = False
 
     def __init__(self, parameters, logger, bot):
         self.parameters = parameters
@@ -71,6 +96,10 @@ def __init__(self, parameters, logger, bot):
         self.source_queue = None
         self.logger = logger
         self.bot = bot
+        self.compression = None
+        self.compression_threshold = 16384
+        self.load_balance = False
+        self.load_balance_iterator = 0
 
     def connect(self):
         raise NotImplementedError
@@ -96,6 +125,7 @@ def set_queues(self, queues: Optional[str], queues_type: str):
                 self.internal_queue = None
 
         elif queues_type == "destination":
+            self.load_compression_configuration()
             type_ = type(queues)
             if type_ is list:
                 q = {"_default": queues}
@@ -113,22 +143,175 @@ def set_queues(self, queues: Optional[str], queues_type: str):
         else:
             raise exceptions.InvalidArgument('queues_type', got=queues_type, expected=['source', 'destination'])
 
+    def load_compression_configuration(self):
+        """
+        Reads the parameters for compressing sent messages:
+        destination_pipeline_compression and destination_pipeline_compression_threshold
+        """
+        self.compression = getattr(self.parameters, 'destination_pipeline_compression', None)
+        self.compression_threshold = int(getattr(self.parameters,
+                                                 'destination_pipeline_compression_threshold',
+                                                 16384))
+        if self.compression not in COMPRESSION_ALGORITHMS:
+            raise exceptions.InvalidArgument('destination_pipeline_compression',
+                                             got=self.compression,
+                                             expected=COMPRESSION_ALGORITHMS)
+        if self.compression == 'lz4' and lz4 is None:
+            raise exceptions.MissingDependencyError('lz4')
+
+    def _encode(self, message: Union[bytes, str]) -> bytes:
+        """
+        Encodes the message for sending and compresses it, if compression is
+        configured and the message is at least compression_threshold bytes long.
+        Compressed messages start with ZLIB_PREFIX or LZ4_PREFIX.
+        """
+        message = utils.encode(message)
+        if not self.compression or len(message) < self.compression_threshold:
+            return message
+        if self.compression == 'zlib':
+            return ZLIB_PREFIX + zlib.compress(message)
+        return LZ4_PREFIX + lz4.frame.compress(message)
+
+    @staticmethod
+    def _decompress(message: bytes) -> bytes:
+        """
+        Decompresses messages compressed by _encode, returns all other messages unchanged.
+
+        Raises:
+            DecodingError: If the message can't be decompressed
+        """
+        if not isinstance(message, bytes) or not message.startswith(BINARY_MESSAGE_PREFIX):
+            return message
+        header = message[:2]
+        try:
+            if header == ZLIB_PREFIX:
+                return zlib.decompress(message[2:])
+            elif header == LZ4_PREFIX:
+                if lz4 is None:
+                    raise exceptions.MissingDependencyError('lz4')
+                return lz4.frame.decompress(message[2:])
+        except (zlib.error, RuntimeError) as exc:
+            raise exceptions.DecodingError(object=message) from exc
+        return message
+
+    def _select_queues(self, queues: list, shard_key: Optional[str] = None) -> list:
+        """
+        Selects the queues of a path a message is sent to.
+
+        With a shard key, the message is sent to one queue chosen by a stable
+        hash of the key, so that all messages with the same key end up in the
+        same queue. With load_balance, the queues are used in turn. Otherwise
+        the message is sent to all queues.
+        """
+        if shard_key is not None:
+            return [queues[zlib.crc32(utils.encode(shard_key)) % len(queues)]]
+        if self.load_balance:
+            queue = queues[self.load_balance_iterator % len(queues)]
+            self.load_balance_iterator = (self.load_balance_iterator + 1) % len(queues)
+            return [queue]
+        return queues
+
     def send(self, message: str, path: str = "_default",
-             path_permissive: bool = False):
+             path_permissive: bool = False, shard_key: Optional[str] = None):
         raise NotImplementedError
 
-    def receive(self) -> str:
+    def send_batch(self, messages: Iterable[str], path: str = "_default",
+                   path_permissive: bool = False,
+                   shard_keys: Optional[Iterable[str]] = None):
+        """
+        Sends multiple messages to the destination queues of the given path.
+
+        Brokers can override this to send all messages at once,
+        by default the messages are sent one by one.
+
+        shard_keys optionally gives a shard key for each message, see _select_queues.
+        """
+        if shard_keys is None:
+            for message in messages:
+                self.send(message, path=path, path_permissive=path_permissive)
+        else:
+            for message, shard_key in zip(messages, shard_keys):
+                self.send(message, path=path, path_permissive=path_permissive,
+                          shard_key=shard_key)
+
+    def receive(self) -> Union[str, bytes]:
+        """
+        Receive one message. Binary encoded messages (see
+        intelmq.lib.message.BINARY_MESSAGE_PREFIX) are returned as bytes.
+        """
         if self._has_message:
             raise exceptions.PipelineError("There's already a message, first "
                                            "acknowledge the existing one.")
 
         retval = self._receive()
         self._has_message = True
+        retval = self._decompress(retval)
+        if isinstance(retval, bytes) and retval.startswith(BINARY_MESSAGE_PREFIX):
+            return retval
         return utils.decode(retval)
 
     def _receive(self) -> bytes:
         raise NotImplementedError
 
+    def receive_batch(self, n: int) -> List[Union[str, bytes]]:
+        """
+        Receive up to n messages at once.
+
+        Blocks until at least one message is available. Messages which can't
+        be decoded are returned as bytes, so that the caller can handle them
+        individually without losing the rest of the batch. Binary encoded
+        messages are returned as bytes as well.
+        The messages need to be acknowledged with acknowledge_batch.
+
+        Parameters
+        ----------
+        n : int
+            Maximum number of messages to receive.
+
+        Raises
+        ------
+        exceptions
+            exceptions.PipelineError: If the pipeline already holds a message
+
+        Returns
+        -------
+        List[Union[str, bytes]]
+            The received messages, the oldest first.
+
+        """
+        if self._has_message:
+            raise exceptions.PipelineError("There's already a message, first "
+                                           "acknowledge the existing one.")
+        if n < 1:
+            raise exceptions.InvalidArgument('n', got=n, expected='positive integer')
+
+        retval = self._receive_batch(n)
+        self._has_message = True
+        self._batch_size = len(retval)
+        self._batch_acknowledged = frozenset()
+        self._batch_removed = 0
+        messages = []
+        for message in retval:
+            try:
+                message = self._decompress(message)
+            except exceptions.DecodingError:
+                messages.append(message)
+                continue
+            if isinstance(message, bytes) and message.startswith(BINARY_MESSAGE_PREFIX):
+                messages.append(message)
+                continue
+            try:
+                messages.append(utils.decode(message))
+            except exceptions.DecodingError:
+                messages.append(message)
+        return messages
+
+    def _receive_batch(self, n: int) -> List[bytes]:
+        """
+        Fallback for brokers without native batch support: one message only.
+        """
+        return [self._receive()]
+
     def acknowledge(self):
         """
         Acknowledge/delete the current message from the source queue
@@ -154,6 +337,63 @@ def acknowledge(self):
     def _acknowledge(self):
         raise NotImplementedError
 
+    def acknowledge_batch(self, indices: Optional[Iterable[int]] = None):
+        """
+        Acknowledge/delete messages received by receive_batch.
+
+        If the broker can only remove the oldest messages of a batch
+        (acknowledges_out_of_order is False), an acknowledged message is
+        removed when all older messages of the batch are acknowledged too.
+
+        Parameters
+        ----------
+        indices : Optional[Iterable[int]]
+            Positions of the messages in the list returned by receive_batch.
+            By default all messages.
+
+        Raises
+        ------
+        exceptions
+            exceptions.PipelineError: If no message is held
+            exceptions.InvalidArgument: If a position is out of range
+        """
+        if not self._has_message:
+            raise exceptions.PipelineError("No message to acknowledge.")
+        if indices is None:
+            indices = range(self._batch_size)
+        indices = sorted(set(indices) - self._batch_acknowledged)
+        if indices and not 0 <= indices[0] <= indices[-1] < self._batch_size:
+            raise exceptions.InvalidArgument('indices', got=indices,
+                                             expected='positions between 0 and %d' % (self._batch_size - 1))
+        self._batch_acknowledged = self._batch_acknowledged.union(indices)
+        if self.acknowledges_out_of_order:
+            if indices:
+                self._acknowledge_batch_messages(indices)
+        else:
+            removed = self._batch_removed
+            while removed in self._batch_acknowledged:
+                removed += 1
+            if removed > self._batch_removed:
+                self._acknowledge_batch(removed - self._batch_removed)
+                self._batch_removed = removed
+        if len(self._batch_acknowledged) >= self._batch_size:
+            self._has_message = False
+            self._batch_size = 0
+            self._batch_acknowledged = frozenset()
+
+    def _acknowledge_batch(self, count: int):
+        """
+        Removes the oldest count messages of the batch.
+        """
+        for _ in range(count):
+            self._acknowledge()
+
+    def _acknowledge_batch_messages(self, indices: List[int]):
+        """
+        Removes the messages of the batch at the given positions.
+        """
+        raise NotImplementedError
+
     def clear_queue(self, queue):
         raise NotImplementedError
 
@@ -161,10 +401,22 @@ def nonempty_queues(self) -> set:
         raise NotImplementedError
 
     def reject_message(self):
+        """
+        Rejects the held message or the not yet acknowledged messages of the
+        batch, they are received again.
+        """
         if not self._has_message:
             raise exceptions.PipelineError("No message to acknowledge.")
+        if not self.acknowledges_out_of_order:
+            # acknowledged messages behind a not acknowledged one are still held
+            held = [index for index in sorted(self._batch_acknowledged)
+                    if index >= self._batch_removed]
+            if held:
+                self._acknowledge_batch_messages(held)
         self._reject_message()
         self._has_message = False
+        self._batch_size = 0
+        self._batch_acknowledged = frozenset()
 
     def _reject_message(self):
         raise NotImplementedError
@@ -173,6 +425,19 @@ def _reject_message(self):
 class Redis(Pipeline):
     has_internal_queues = True
     pipe = None
+    # Atomically moves up to ARGV[1] messages from the source queue (KEYS[1])
+    # to the internal queue (KEYS[2]), like RPOPLPUSH does for one message.
+    _MOVE_BATCH_SCRIPT = """
+local messages = {}
+for i = 1, tonumber(ARGV[1]) do
+    local message = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+    if not message then
+        break
+    end
+    messages[#messages + 1] = message
+end
+return messages
+"""
 
     def load_configurations(self, queues_type):
         self.host = getattr(self.parameters,
@@ -213,6 +478,7 @@ def connect(self):
             kwargs['single_connection_client'] = True
 
         self.pipe = redis.Redis(db=self.db, password=self.password, **kwargs)
+        self._move_batch = self.pipe.register_script(self._MOVE_BATCH_SCRIPT)
 
     def disconnect(self):
         pass
@@ -220,35 +486,74 @@ def disconnect(self):
     def set_queues(self, queues, queues_type):
         self.load_configurations(queues_type)
         super().set_queues(queues, queues_type)
+        # worker processes of a bot need separate internal queues
+        if (self.has_internal_queues and self.internal_queue and
+                getattr(self.bot, 'process_instance_id', None)):
+            self.internal_queue = '%s.%s' % (self.internal_queue, self.bot.process_instance_id)
 
     def send(self, message: str, path: str = "_default",
-             path_permissive: bool = False):
+             path_permissive: bool = False, shard_key: Optional[str] = None):
+        self.send_batch((message, ), path=path, path_permissive=path_permissive,
+                        shard_keys=None if shard_key is None else (shard_key, ))
+
+    def send_batch(self, messages: Iterable[str], path: str = "_default",
+                   path_permissive: bool = False,
+                   shard_keys: Optional[Iterable[str]] = None):
+        """
+        Sends all pushes for the given messages in one round trip.
+
+        If more than one push is necessary (multiple destination queues or
+        multiple messages), a MULTI/EXEC transaction is used, so either all
+        or none of the pushes are executed.
+        """
         if path not in self.destination_queues and path_permissive:
             return
 
-        message = utils.encode(message)
-
         try:
-            queues = self.destination_queues[path]
+            all_queues = self.destination_queues[path]
         except KeyError as exc:
             raise exceptions.PipelineError(exc)
-        if self.load_balance:
-            queues = [queues[self.load_balance_iterator]]
-            self.load_balance_iterator += 1
-            if self.load_balance_iterator == len(self.destination_queues[path]):
-                self.load_balance_iterator = 0
 
-        for destination_queue in queues:
-            try:
-                self.pipe.lpush(destination_queue, message)
-            except Exception as exc:
-                if 'Cannot assign requested address' in exc.args[0] or \
-                        "OOM command not allowed when used memory > 'maxmemory'." in exc.args[0]:
-                    raise MemoryError(exc.args[0])
-                elif 'Redis is configured to save RDB snapshots, but is currently not able to persist on disk' in exc.args[0]:
-                    raise IOError(28, 'No space left on device or in memory. Redis can\'t save its snapshots. '
-                                      'Look at redis\'s logs.')
-                raise exceptions.PipelineError(exc)
+        if shard_keys is None:
+            shard_keys = repeat(None)
+        pushes = []
+        for message, shard_key in zip(messages, shard_keys):
+            message = self._encode(message)
+            for destination_queue in self._select_queues(all_queues, shard_key):
+                pushes.append((destination_queue, message))
+
+        try:
+            if len(pushes) == 1:
+                self._push(self.pipe, *pushes[0])
+            elif pushes:
+                transaction = self.pipe.pipeline(transaction=True)
+                for destination_queue, message in pushes:
+                    self._push(transaction, destination_queue, message)
+                transaction.execute()
+        except Exception as exc:
+            self._raise_send_error(exc)
+
+    @staticmethod
+    def _push(client, queue: str, message: bytes):
+        """
+        Adds the message to the queue, client is a redis connection or pipeline.
+        """
+        client.lpush(queue, message)
+
+    @staticmethod
+    def _raise_send_error(exc: Exception):
+        """
+        Maps errors of redis on sending to MemoryError, IOError and PipelineError.
+        """
+        error = str(exc.args[0]) if exc.args else ''
+        # newer versions of redis-py strip the "OOM " prefix of the error message
+        if 'Cannot assign requested address' in error or \
+                "command not allowed when used memory > 'maxmemory'." in error:
+            raise MemoryError(error)
+        elif 'Redis is configured to save RDB snapshots, but is currently not able to persist on disk' in error:
+            raise IOError(28, 'No space left on device or in memory. Redis can\'t save its snapshots. '
+                              'Look at redis\'s logs.')
+        raise exceptions.PipelineError(exc)
 
     def _receive(self) -> bytes:
         if self.source_queue is None:
@@ -280,14 +585,75 @@ def _acknowledge(self):
                                                "for acknowledgement. Return value was %r."
                                                "" % retval)
 
+    def _receive_batch(self, n: int) -> List[bytes]:
+        """
+        Messages left in the internal queue (e.g. after a crash) are returned
+        first. Otherwise, blocks for the first message and moves up to n-1
+        further messages in one atomic server-side call.
+        """
+        if self.source_queue is None:
+            raise exceptions.ConfigurationError('pipeline', 'No source queue given.')
+        try:
+            while True:
+                try:
+                    # the oldest messages are at the right end
+                    retval = self.pipe.lrange(self.internal_queue, -n, -1)
+                except redis.exceptions.BusyLoadingError:  # Just wait at redis' startup #1334
+                    time.sleep(1)
+                else:
+                    break
+            if retval:
+                retval = retval[::-1]
+            else:
+                retval = [self.pipe.brpoplpush(self.source_queue,
+                                               self.internal_queue, 0)]
+                if n > 1:
+                    retval.extend(self._move_batch(keys=[self.source_queue, self.internal_queue],
+                                                   args=[n - 1]))
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        else:
+            self._batch_messages = retval
+            return retval
+
+    def _acknowledge_batch(self, count: int):
+        """
+        Removes the oldest count messages from the internal queue with a single LTRIM.
+        """
+        try:
+            self.pipe.ltrim(self.internal_queue, 0, -count - 1)
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+
+    def _acknowledge_batch_messages(self, indices: List[int]):
+        """
+        Removes the messages from the internal queue with LREM, each message
+        only once, starting with the oldest.
+        """
+        try:
+            transaction = self.pipe.pipeline(transaction=True)
+            for index in indices:
+                transaction.lrem(self.internal_queue, -1, self._batch_messages[index])
+            transaction.execute()
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+
     def count_queued_messages(self, *queues) -> dict:
-        queue_dict = {}
-        for queue in queues:
-            try:
-                queue_dict[queue] = self.pipe.llen(queue)
-            except Exception as exc:
-                raise exceptions.PipelineError(exc)
-        return queue_dict
+        """
+        Counts the messages of all given queues in one round trip.
+        """
+        try:
+            pipe = self.pipe.pipeline(transaction=False)
+            for queue in queues:
+                self._length(pipe, queue)
+            counts = pipe.execute()
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        return dict(zip(queues, counts))
+
+    @staticmethod
+    def _length(client, queue: str):
+        client.llen(queue)
 
     def clear_queue(self, queue):
         """Clears a queue by removing (deleting) the key,
@@ -306,7 +672,8 @@ def nonempty_queues(self) -> set:
         if not self.pipe:
             self.set_queues(None, "source")
             self.connect()
-        return {queue.decode() for queue in self.pipe.keys()}
+        # SCAN does not block the server like KEYS on large databases
+        return {queue.decode() for queue in self.pipe.scan_iter(count=1000)}
 
     def _reject_message(self):
         """
@@ -318,6 +685,177 @@ def _reject_message(self):
 # [Receive]     B RPOP LPUSH   source_queue ->  internal_queue
 # [Send]        LPUSH          message      ->  destination_queue
 # [Acknowledge] RPOP           message      <-  internal_queue
+#
+# Batches
+# -------
+# [Send]        MULTI, LPUSH (per message and queue), EXEC
+# [Receive]     B RPOP LPUSH + (n-1) RPOP LPUSH (Lua)   source_queue ->  internal_queue
+# [Acknowledge] LTRIM          n messages   <-  internal_queue
+# [Reject]      LREM (per acknowledged message behind a rejected one)  <-  internal_queue
+
+
+class Redisstreams(Redis):
+    """
+    Pipeline based on Redis Streams, requires Redis 5.0 or newer.
+
+    All instances of a bot consume the same stream as members of one consumer
+    group, each with its own consumer name (host name and bot ID). Received,
+    but not yet acknowledged messages stay in the consumer's list of pending
+    entries and are delivered to the same consumer again, e.g. after a restart.
+    Pending entries of other consumers which have not been acknowledged for
+    `source_pipeline_stream_claim_idle_time` seconds (default: 600) are
+    claimed, so messages of vanished instances are not lost. This is checked
+    every `source_pipeline_stream_claim_interval` seconds (default: the idle
+    time, at most 60).
+    """
+    has_internal_queues = False
+    acknowledges_out_of_order = True
+    consumer_group = 'intelmq'
+    message_field = b'message'
+    # Maximum number of idle pending entries to claim at once
+    claim_count = 100
+
+    def __init__(self, parameters, logger, bot):
+        super().__init__(parameters, logger, bot)
+        self.claim_idle_time = 600
+        self.claim_interval = 60
+        self._last_claim = 0
+        self._message_ids = []
+
+    def load_configurations(self, queues_type):
+        super().load_configurations(queues_type)
+        if queues_type == 'source':
+            self.claim_idle_time = getattr(self.parameters,
+                                           "source_pipeline_stream_claim_idle_time",
+                                           600)
+            self.claim_interval = getattr(self.parameters,
+                                          "source_pipeline_stream_claim_interval",
+                                          min(self.claim_idle_time, 60))
+
+    def connect(self):
+        super().connect()
+        # instances with the same bot ID on other hosts are other consumers
+        bot_id = getattr(self.bot, 'bot_id', None)
+        self.consumer = '%s:%s' % (socket.gethostname(), bot_id if bot_id else os.getpid())
+        if self.source_queue is None:
+            return
+        try:
+            # id 0: also deliver messages sent before the group existed
+            self.pipe.xgroup_create(self.source_queue, self.consumer_group,
+                                    id='0', mkstream=True)
+        except redis.exceptions.ResponseError as exc:
+            if 'BUSYGROUP' not in str(exc):  # group exists already
+                raise exceptions.PipelineError(exc)
+
+    @staticmethod
+    def _push(client, queue: str, message: bytes):
+        client.xadd(queue, {Redisstreams.message_field: message})
+
+    def _read(self, count: int, pending: bool = False) -> list:
+        """
+        Reads the consumer's own pending entries or blocks for new entries.
+        Entries which have been deleted in the meantime are acknowledged
+        and skipped.
+        """
+        retval = self.pipe.xreadgroup(self.consumer_group, self.consumer,
+                                      {self.source_queue: '0' if pending else '>'},
+                                      count=count, block=None if pending else 0)
+        if not retval:
+            return []
+        entries = []
+        for message_id, fields in retval[0][1]:
+            if not fields:
+                self.pipe.xack(self.source_queue, self.consumer_group, message_id)
+                continue
+            entries.append((message_id, fields[self.message_field]))
+        return entries
+
+    def _claim_idle_messages(self):
+        """
+        Claims pending entries of other consumers, which have been idle for too long.
+        Checked at most every `claim_interval` seconds.
+        """
+        if time.time() - self._last_claim < self.claim_interval:
+            return
+        self._last_claim = time.time()
+        min_idle_time = int(self.claim_idle_time * 1000)
+        pending = self.pipe.xpending_range(self.source_queue, self.consumer_group,
+                                           '-', '+', self.claim_count)
+        message_ids = [entry['message_id'] for entry in pending
+                       if utils.decode(entry['consumer']) != self.consumer and
+                       entry['time_since_delivered'] >= min_idle_time]
+        if message_ids:
+            self.logger.info('Claiming %d idle pending messages of other consumers.',
+                             len(message_ids))
+            self.pipe.xclaim(self.source_queue, self.consumer_group, self.consumer,
+                             min_idle_time, message_ids)
+
+    def _receive_batch(self, n: int) -> List[bytes]:
+        if self.source_queue is None:
+            raise exceptions.ConfigurationError('pipeline', 'No source queue given.')
+        try:
+            while True:
+                try:
+                    self._claim_idle_messages()
+                    entries = self._read(n, pending=True)
+                except redis.exceptions.BusyLoadingError:  # Just wait at redis' startup #1334
+                    time.sleep(1)
+                else:
+                    break
+            while not entries:
+                entries = self._read(n)
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        self._message_ids = [message_id for message_id, _ in entries]
+        return [message for _, message in entries]
+
+    def _receive(self) -> bytes:
+        return self._receive_batch(1)[0]
+
+    def _acknowledge(self):
+        """
+        Acknowledges and deletes all held messages, so that the length of
+        the stream is the number of queued messages.
+        """
+        try:
+            transaction = self.pipe.pipeline(transaction=True)
+            transaction.xack(self.source_queue, self.consumer_group, *self._message_ids)
+            transaction.xdel(self.source_queue, *self._message_ids)
+            transaction.execute()
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        self._message_ids = []
+
+    def _acknowledge_batch_messages(self, indices: List[int]):
+        message_ids = [self._message_ids[index] for index in indices]
+        try:
+            transaction = self.pipe.pipeline(transaction=True)
+            transaction.xack(self.source_queue, self.consumer_group, *message_ids)
+            transaction.xdel(self.source_queue, *message_ids)
+            transaction.execute()
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+
+    @staticmethod
+    def _length(client, queue: str):
+        client.xlen(queue)
+
+    def nonempty_queues(self) -> set:
+        """ Returns a list of all currently non-empty queues. """
+        # streams persist when all entries have been deleted
+        queues = super().nonempty_queues()
+        return {queue for queue, count in self.count_queued_messages(*queues).items() if count}
+
+    def _reject_message(self):
+        """
+        Rejecting is a no-op as the message stays in the list of pending entries.
+        """
+
+# Algorithm
+# ---------
+# [Receive]     XREADGROUP (own pending entries, then BLOCK for new)  source_queue
+# [Send]        XADD           message      ->  destination_queue
+# [Acknowledge] XACK, XDEL     message(s)   <-  source_queue
 
 
 class Pythonlist(Pipeline):
@@ -346,16 +884,16 @@ def set_queues(self, queues, queues_type):
             self.state[destination_queue] = []
 
     def send(self, message: str, path: str = "_default",
-             path_permissive: bool = False):
+             path_permissive: bool = False, shard_key: Optional[str] = None):
         """Sends a message to the destination queues"""
         if path not in self.destination_queues and path_permissive:
             return
 
-        for destination_queue in self.destination_queues[path]:
+        for destination_queue in self._select_queues(self.destination_queues[path], shard_key):
             if destination_queue in self.state:
-                self.state[destination_queue].append(utils.encode(message))
+                self.state[destination_queue].append(self._encode(message))
             else:
-                self.state[destination_queue] = [utils.encode(message)]
+                self.state[destination_queue] = [self._encode(message)]
 
     def _receive(self) -> bytes:
         """
@@ -364,7 +902,7 @@ def _receive(self) -> bytes:
         Does not block unlike the other pipelines.
         """
         if len(self.state[self.internal_queue]) > 0:
-            return utils.decode(self.state[self.internal_queue][0])
+            return self.state[self.internal_queue][0]
 
         try:
             first_msg = self.state[self.source_queue].pop(0)
@@ -378,6 +916,38 @@ def _acknowledge(self):
         """Removes a message from the internal queue and returns it"""
         self.state.get(self.internal_queue, [None]).pop(0)
 
+    def _receive_batch(self, n: int) -> List[bytes]:
+        """
+        Receives up to n not yet acknowledged messages.
+
+        Does not block unlike the other pipelines.
+        """
+        if len(self.state[self.internal_queue]) > 0:
+            self._batch_messages = self.state[self.internal_queue][:n]
+            return self._batch_messages
+
+        if not self.state[self.source_queue]:
+            raise exceptions.PipelineError(IndexError('pop from empty list'))
+        messages = self.state[self.source_queue][:n]
+        del self.state[self.source_queue][:n]
+        self.state[self.internal_queue].extend(messages)
+
+        self._batch_messages = messages
+        return messages
+
+    def _acknowledge_batch(self, count: int):
+        """Removes the received messages from the internal queue"""
+        del self.state.get(self.internal_queue, [])[:count]
+
+    def _acknowledge_batch_messages(self, indices: List[int]):
+        """Removes the messages at the given positions of the batch from the internal queue"""
+        internal_queue = self.state.get(self.internal_queue, [])
+        for index in indices:
+            for position, message in enumerate(internal_queue):
+                if message is self._batch_messages[index]:
+                    del internal_queue[position]
+                    break
+
     def count_queued_messages(self, *queues) -> dict:
         """Returns the amount of queued messages
            over all given queue names.
@@ -400,14 +970,76 @@ def _reject_message(self):
         """
 
 
+class Inprocess(Pipeline):
+    """
+    This pipeline passes message objects in memory, without serialization.
+
+    It is used for the stages of fused bot chains
+    (intelmq.bots.experts.chain.expert) and not meant to be configured as broker.
+    Messages to be received are added to `incoming`, sent messages are
+    collected in `sent` as (message, path, path_permissive) tuples.
+    """
+    message_objects = True
+
+    def __init__(self, parameters, logger, bot):
+        super().__init__(parameters, logger, bot)
+        self.incoming = []
+        self.sent = []
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def send(self, message, path: str = "_default",
+             path_permissive: bool = False, shard_key: Optional[str] = None):
+        """
+        Collects the message. If the same object is sent more than once,
+        copies are collected, so that the receivers can modify them independently.
+        """
+        if any(message is other for other, _, _ in self.sent):
+            message = message.copy()
+        self.sent.append((message, path, path_permissive))
+
+    def receive(self):
+        if self._has_message:
+            raise exceptions.PipelineError("There's already a message, first "
+                                           "acknowledge the existing one.")
+        if not self.incoming:
+            raise exceptions.PipelineError("No message to receive.")
+        self._has_message = True
+        return self.incoming[0]
+
+    def _acknowledge(self):
+        self.incoming.pop(0)
+
+    def _reject_message(self):
+        """
+        No-op, the message is received again
+        """
+
+    def reset(self) -> list:
+        """
+        Drops all incoming messages and returns and clears the sent messages.
+        """
+        sent = self.sent
+        self.incoming = []
+        self.sent = []
+        self._has_message = False
+        return sent
+
+
 class Amqp(Pipeline):
     queue_args = {'x-queue-mode': 'lazy'}
+    acknowledges_out_of_order = True
 
     def __init__(self, parameters, logger, bot):
         super(Amqp, self).__init__(parameters, logger, bot)
         if pika is None:
             raise ValueError("To use AMQP you must install the 'pika' library.")
         self.properties = pika.BasicProperties(delivery_mode=2)  # message persistence
+        self._delivery_tags = []
 
     def load_configurations(self, queues_type):
         self.host = getattr(self.parameters,
@@ -529,7 +1161,7 @@ def _send(self, destination_queue, message, reconnect=True):
                 raise exceptions.PipelineError('Sent message was not confirmed.')
 
     def send(self, message: str, path: str = "_default",
-             path_permissive: bool = False):
+             path_permissive: bool = False, shard_key: Optional[str] = None):
         """
         In principle we could use AMQP's exchanges here but that architecture is incompatible
         to the format of our pipeline.conf file.
@@ -537,23 +1169,19 @@ def send(self, message: str, path: str = "_default",
         if path not in self.destination_queues and path_permissive:
             return
 
-        message = utils.encode(message)
+        message = self._encode(message)
         try:
             queues = self.destination_queues[path]
         except KeyError as exc:
             raise exceptions.PipelineError(exc)
-        if self.load_balance:
-            queues = [queues[self.load_balance_iterator]]
-            self.load_balance_iterator += 1
-            if self.load_balance_iterator == len(self.destination_queues[path]):
-                self.load_balance_iterator = 0
 
-        for destination_queue in queues:
+        for destination_queue in self._select_queues(queues, shard_key):
             self._send(destination_queue, message)
 
     def _receive(self) -> bytes:
         if self.source_queue is None:
             raise exceptions.ConfigurationError('pipeline', 'No source queue given.')
+        self._delivery_tags = []
         try:
             method, header, body = next(self.channel.consume(self.source_queue))
             if method:
@@ -563,6 +1191,34 @@ def _receive(self) -> bytes:
         else:
             return body
 
+    def _receive_batch(self, n: int) -> List[bytes]:
+        """
+        Blocks for the first message and takes up to n-1 further messages
+        which have already been delivered to the consumer.
+        """
+        if self.source_queue is None:
+            raise exceptions.ConfigurationError('pipeline', 'No source queue given.')
+        messages = []
+        delivery_tags = []
+        try:
+            while True:
+                method, header, body = next(self.channel.consume(self.source_queue))
+                messages.append(body)
+                delivery_tags.append(method.delivery_tag)
+                if len(messages) >= n or not self.channel.get_waiting_message_count():
+                    break
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+        self._delivery_tags = delivery_tags
+        return messages
+
+    def _acknowledge_batch_messages(self, indices: List[int]):
+        try:
+            for index in indices:
+                self.channel.basic_ack(delivery_tag=self._delivery_tags[index])
+        except Exception as exc:
+            raise exceptions.PipelineError(exc)
+
     def _acknowledge(self):
         try:
             self.channel.basic_ack(delivery_tag=self.delivery_tag)
@@ -619,4 +1275,10 @@ def nonempty_queues(self) -> set:
         return {name for name, count in result.items() if count}
 
     def _reject_message(self):
-        self.channel.basic_nack(delivery_tag=self.delivery_tag, requeue=True)
+        if not self._delivery_tags:
+            self.channel.basic_nack(delivery_tag=self.delivery_tag, requeue=True)
+            return
+        for index, delivery_tag in enumerate(self._delivery_tags):
+            if index not in self._batch_acknowledged:
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        self._delivery_tags = []
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import intelmq.bin.intelmqctl as ctl
 
@@ -38,5 +41,53 @@ def test_interpret_commandline(self):
                               'intelmq.bots.collectors.http.collector_http', 'other-collector'))
 
 
+class TestIntelMQController(unittest.TestCase):
+    def test_count_queues_cached(self):
+        """ The broker is only queried if the cache is outdated. """
+        controller = ctl.IntelMQController.__new__(ctl.IntelMQController)
+        controller.get_queues = mock.Mock(return_value=(set(), set(), set(), {'a', 'b'}))
+        controller._count_queues = mock.Mock(return_value=({'a': 1, 'b': 0}, False))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = os.path.join(tmpdir, 'queue-status.json')
+            self.assertEqual(controller._count_queues_cached(60, cache_file=cache_file),
+                             ({'a': 1, 'b': 0}, False))
+            self.assertEqual(controller._count_queues_cached(60, cache_file=cache_file),
+                             ({'a': 1, 'b': 0}, False))
+            self.assertEqual(controller._count_queues.call_count, 1)
+            controller._count_queues_cached(0, cache_file=cache_file)
+            self.assertEqual(controller._count_queues.call_count, 2)
+            controller.get_queues.return_value = (set(), set(), set(), {'a', 'b', 'c'})
+            controller._count_queues_cached(60, cache_file=cache_file)
+            self.assertEqual(controller._count_queues.call_count, 3)
+
+    def test_metrics(self):
+        """ Test the conversion of the statistics and queue sizes to OpenMetrics. """
+        controller = ctl.IntelMQController.__new__(ctl.IntelMQController)
+        controller._read_statistics = mock.Mock(return_value={
+            'expert.stats.success': '10', 'expert.stats.failure': '1',
+            'expert.total._default': '9', 'expert.temporary._default': '2',
+            'expert.0.stats.cache_latency': '0.25', 'expert.stats.unknown': '3',
+            'expired.stats.success': None, 'other': 'key'})
+        controller._count_queues = mock.Mock(return_value=({'expert-queue': 4}, False))
+        metrics = controller._collect_metrics()
+        self.assertEqual(metrics['intelmq_bot_messages_processed'], [({'bot': 'expert'}, 10)])
+        self.assertEqual(metrics['intelmq_bot_messages_sent'], [({'bot': 'expert', 'path': '_default'}, 9)])
+        self.assertEqual(metrics['intelmq_bot_cache_lookup_seconds'], [({'bot': 'expert.0'}, 0.25)])
+        self.assertEqual(metrics['intelmq_queue_messages'], [({'queue': 'expert-queue'}, 4)])
+        text = controller._format_openmetrics(metrics)
+        self.assertIn('# TYPE intelmq_bot_messages_failed counter\n'
+                      '# HELP intelmq_bot_messages_failed Messages whose processing failed.\n'
+                      'intelmq_bot_messages_failed_total{bot="expert"} 1\n', text)
+        self.assertIn('\nintelmq_bot_messages_sent_total{bot="expert",path="_default"} 9\n', text)
+        self.assertIn('\nintelmq_queue_messages{queue="expert-queue"} 4\n', text)
+        self.assertNotIn('backpressure', text)
+        self.assertTrue(text.endswith('\n# EOF\n'))
+
+    def test_format_openmetrics_escape(self):
+        """ Test the escaping of label values. """
+        text = ctl.IntelMQController._format_openmetrics({'intelmq_queue_messages': [({'queue': 'a"b\\c\n'}, 1)]})
+        self.assertIn('intelmq_queue_messages{queue="a\\"b\\\\c\\n"} 1\n', text)
+
+
 if __name__ == '__main__':  # pragma: nocover
     unittest.main()
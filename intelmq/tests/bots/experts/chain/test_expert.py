@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the chain expert with the taxonomy, url2fqdn and filter experts as stages.
+"""
+import unittest
+import unittest.mock as mock
+
+import intelmq.lib.test as test
+from intelmq import PIPELINE_CONF_FILE, RUNTIME_CONF_FILE
+from intelmq.bots.experts.chain.expert import ChainExpertBot
+
+STAGES = {'filter-expert': ('intelmq.bots.experts.filter.expert',
+                            {'filter_key': 'source.url',
+                             'filter_value': 'http://example.net/',
+                             'filter_action': 'drop'}),
+          'taxonomy-expert': ('intelmq.bots.experts.taxonomy.expert', {}),
+          'url2fqdn-expert': ('intelmq.bots.experts.url2fqdn.expert', {}),
+          }
+
+EXAMPLE_INPUT = {"__type": "Event",
+                 "classification.type": "phishing",
+                 "source.url": "http://example.com/",
+                 "time.observation": "2015-01-01T00:00:00+00:00",
+                 }
+EXAMPLE_OUTPUT = {"__type": "Event",
+                  "classification.taxonomy": "fraud",
+                  "classification.type": "phishing",
+                  "source.url": "http://example.com/",
+                  "source.fqdn": "example.com",
+                  "time.observation": "2015-01-01T00:00:00+00:00",
+                  }
+FILTERED_INPUT = EXAMPLE_INPUT.copy()
+FILTERED_INPUT['source.url'] = 'http://example.net/'
+FILTERED_OUTPUT = FILTERED_INPUT.copy()
+
+original_mocked_config = test.mocked_config
+
+
+def mocked_config(*args, **kwargs):
+    """ Adds the stages to the mocked runtime and pipeline configuration. """
+    mocked = original_mocked_config(*args, **kwargs)
+
+    def mocked_with_stages(conf_file):
+        config = mocked(conf_file)
+        if conf_file == RUNTIME_CONF_FILE:
+            for bot_id, (module, parameters) in STAGES.items():
+                config[bot_id] = {'group': 'Expert', 'module': module,
+                                  'parameters': parameters, 'enabled': False}
+        elif conf_file == PIPELINE_CONF_FILE:
+            for bot_id in STAGES:
+                config[bot_id] = {'source-queue': bot_id + '-queue',
+                                  'destination-queues': ['output-queue']}
+        return config
+    return mocked_with_stages
+
+
+@mock.patch('intelmq.lib.test.mocked_config', new=mocked_config)
+class TestChainExpertBot(test.BotTestCase, unittest.TestCase):
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = ChainExpertBot
+        cls.sysconfig = {'bots': ['filter-expert', 'taxonomy-expert', 'url2fqdn-expert']}
+
+    def test_chain(self):
+        self.input_message = EXAMPLE_INPUT
+        self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_OUTPUT)
+        self.assertEqual(self.bot.stages[1]._Bot__message_counter['success'], 1)
+
+    def test_other_paths(self):
+        """ Messages sent to other paths leave the chain immediately. """
+        self.input_message = FILTERED_INPUT
+        self.prepare_bot(destination_queues=['_default', 'action_other', 'filter_match'])
+        self.run_bot(prepare=False)
+        self.assertOutputQueueLen(0)
+        self.assertMessageEqual(0, FILTERED_OUTPUT, path='action_other')
+        self.assertMessageEqual(0, FILTERED_OUTPUT, path='filter_match')
+
+    def test_check(self):
+        self.assertEqual(ChainExpertBot.check({'bots': []}),
+                         [['error', 'Parameter "bots" must be a non-empty list of bot IDs.']])
+        self.assertIsNone(ChainExpertBot.check({'bots': ['taxonomy-expert']}))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 import unittest
+from unittest import mock
+
+import dns.exception
+import dns.resolver
 
 import intelmq.lib.test as test
 from intelmq.bots.experts.cymru_whois.expert import CymruExpertBot
+from intelmq.lib.cache import NEGATIVE_VALUE
 
 EXAMPLE_INPUT = {"__type": "Event",
                  "source.ip": "93.184.216.34",  # example.com
@@ -134,5 +139,40 @@ def test_overwrite(self):
         self.assertMessageEqual(0, OVERWRITE_OUT)
 
 
+@test.skip_redis()
+class TestCymruExpertBotNegativeCache(test.BotTestCase, unittest.TestCase):
+    """
+    Tests which lookups without result are cached, without network access.
+    """
+    cache_key = bin(0x5db8d822)[2:26]  # 93.184.216.34
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = CymruExpertBot
+        cls.use_cache = True
+        cls.sysconfig = {'overwrite': True}
+
+    def setUp(self):
+        super().setUp()
+        self.cache.flushdb()
+
+    def test_lookup_failed(self):
+        """ Test if failed lookups, e.g. timeouts, are not cached. """
+        self.input_message = EXAMPLE_INPUT
+        with mock.patch('dns.resolver.query', side_effect=dns.exception.Timeout):
+            self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_INPUT)
+        self.assertIsNone(self.cache.get(self.cache_key))
+
+    def test_no_data(self):
+        """ Test if non-existing names are cached with the short negative TTL. """
+        self.input_message = EXAMPLE_INPUT
+        with mock.patch('dns.resolver.query', side_effect=dns.resolver.NXDOMAIN):
+            self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_INPUT)
+        self.assertEqual(self.cache.get(self.cache_key).decode(), NEGATIVE_VALUE)
+        self.assertTrue(0 < self.cache.ttl(self.cache_key) <= 3600)
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -70,6 +70,22 @@ def test_whitelist_pass(self):
         self.run_bot()
         self.assertMessageEqual(0, msg)
 
+    def test_hash_digest(self):
+        self.sysconfig = {"redis_cache_ttl": "86400",
+                          "filter_type": "whitelist",
+                          "filter_keys": "source.ip",
+                          "hash_digest": "blake2b"}
+        msg = self.new_event()
+        msg.add('source.ip', '127.0.0.8')
+        msg_hash = msg.hash(filter_type="whitelist", filter_keys={"source.ip"},
+                            digest="blake2b")
+        self.cache.set(msg_hash, 'hash')
+        self.cache.expire(msg_hash, 3600)
+
+        self.input_message = msg
+        self.run_bot()
+        self.assertOutputQueueLen()
+
     def test_bypass(self):
         self.sysconfig = {"redis_cache_ttl": "86400",
                           "filter_type": "whitelist",
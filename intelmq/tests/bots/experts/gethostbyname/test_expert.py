@@ -3,7 +3,10 @@
 Testing GethostbynameExpertBot.
 """
 
+import json
+import socket
 import unittest
+from unittest import mock
 
 import intelmq.lib.test as test
 from intelmq.bots.experts.gethostbyname.expert import GethostbynameExpertBot
@@ -47,5 +50,47 @@ def test_non_existing(self):
         self.run_bot()
         self.assertMessageEqual(0, NONEXISTING_INPUT)
 
+
+def mocked_gethostbyname(name):
+    if name.endswith('.invalid'):
+        raise socket.gaierror(-2, 'Name or service not known')
+    if name == 'error.example.net':
+        raise socket.gaierror(-3, 'Temporary failure in name resolution')
+    return '192.0.2.1'
+
+
+@mock.patch('socket.gethostbyname', mocked_gethostbyname)
+class TestGethostbynameExpertBotMocked(test.BotTestCase, unittest.TestCase):
+    """
+    Tests the concurrent lookups without network access.
+    """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = GethostbynameExpertBot
+
+    def test_batch(self):
+        """ Test if all messages of a batch are looked up and sent. """
+        inputs = [dict(EXAMPLE_INPUT, **{'source.fqdn': 'host%d.example.com' % i}) for i in range(5)]
+        self.input_message = inputs + [NONEXISTING_INPUT]
+        self.run_bot(parameters={'concurrency': 2})
+        expected = [dict(input_message, **{'source.ip': '192.0.2.1', 'destination.ip': '192.0.2.1'})
+                    for input_message in inputs]
+        self.assertCountEqual([json.loads(event) for event in self.get_output_queue()],
+                              expected + [NONEXISTING_INPUT])
+
+    def test_failure(self):
+        """ Test if a failing lookup is retried individually without losing the other messages. """
+        failing = dict(EXAMPLE_INPUT, **{'source.fqdn': 'error.example.net'})
+        self.input_message = [failing, EXAMPLE_INPUT]
+        self.run_bot(iterations=2, allowed_error_count=2)
+        self.assertLogMatches(pattern='Processing a batch failed, processing the 1 unacknowledged messages individually now.',
+                              levelname='ERROR')
+        self.assertLogMatches(pattern='Dumping message to dump file.', levelname='INFO')
+        self.assertOutputQueueLen(1)
+        self.assertMessageEqual(0, dict(EXAMPLE_INPUT, **{'source.ip': '192.0.2.1',
+                                                          'destination.ip': '192.0.2.1'}))
+
+
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -7,6 +7,7 @@
 
 import intelmq.lib.test as test
 from intelmq.bots.experts.ripencc_abuse_contact.expert import RIPEExpertBot
+from intelmq.lib.cache import NEGATIVE_VALUE
 
 EXAMPLE_INPUT = {"__type": "Event",
                  "source.ip": "93.184.216.34",  # example.com
@@ -207,7 +208,7 @@ def test_replace(self):
                                   'query_ripe_stat_geolocation': False,
                                   })
         self.assertMessageEqual(0, EMPTY_REPLACED)
-        self.assertEqual(self.cache.get('stat:127.0.0.1'), b'__no_contact')
+        self.assertEqual(self.cache.get('stat:127.0.0.1'), NEGATIVE_VALUE.encode())
         self.cache.flushdb()  # collides with test_ripe_stat_errors
 
     def test_ripe_db_as_404(self):
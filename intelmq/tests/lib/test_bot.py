@@ -4,6 +4,7 @@
 """
 
 import unittest
+from unittest import mock
 
 import intelmq.lib.test as test
 from intelmq.tests.lib import test_parser_bot
@@ -66,6 +67,47 @@ def test_invalid_input_message(self):
         self.assertEqual(self.pipe.state['test-bot-input'], [])
         self.assertEqual(self.pipe.state['test-bot-output'], [])
 
+    def test_backpressure(self):
+        """
+        Test if the bot pauses sending while the destination queue is above the high watermark.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.prepare_bot(parameters={'destination_pipeline_high_watermark': 0,
+                                     'destination_pipeline_watermark_check_interval': 1})
+        self.pipe.state['test-bot-output'] = [b'{}']
+
+        def drain(seconds):
+            self.pipe.state['test-bot-output'].clear()
+
+        with mock.patch('intelmq.lib.bot.time.sleep', side_effect=drain) as sleep:
+            self.run_bot(prepare=False)
+        self.assertEqual(sleep.call_count, 2)  # before sending each of the two events
+        self.assertLogMatches(pattern=r'Destination queue\(s\) test-bot-output exceeded the high watermark, pausing.',
+                              levelname='INFO')
+        self.assertLogMatches(pattern=r'Destination queue\(s\) below the low watermark, resuming after .*',
+                              levelname='INFO')
+        self.assertEqual(len(self.get_output_queue()), 1)
+
+    def test_shard_by(self):
+        """
+        Test if events with the same shard key are sent to only one of the destination queues.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.prepare_bot(parameters={'shard_by': 'source.ip'})
+        self.pipe.destination_queues['_default'].append('test-bot-output-2')
+        self.pipe.state['test-bot-output-2'] = []
+        self.run_bot(prepare=False)
+        self.assertEqual(self.pipe.state['test-bot-output'], [])
+        self.assertEqual(len(self.pipe.state['test-bot-output-2']), 2)
+
+    def test_source_pipeline_lazy(self):
+        """
+        Test if lazily decoded messages are processed like fully decoded ones.
+        """
+        self.input_message = test_parser_bot.EXAMPLE_SHORT
+        self.run_bot(parameters={'source_pipeline_lazy': True})
+        self.assertEqual(len(self.get_output_queue()), 2)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the Cache class, the redis connection parameters are the ones of the bot tests.
+"""
+import os
+import unittest
+from unittest import mock
+
+import intelmq.lib.test as test
+from intelmq.lib.cache import Cache, DEFAULT_NEGATIVE_TTL, NEGATIVE_VALUE
+
+
+@test.skip_redis()
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = Cache(test.BOT_CONFIG['redis_cache_host'],
+                           test.BOT_CONFIG['redis_cache_port'],
+                           test.BOT_CONFIG['redis_cache_db'],
+                           ttl=10,
+                           password=os.environ.get('INTELMQ_TEST_REDIS_PASSWORD'))
+        self.cache.flush()
+
+    def tearDown(self):
+        self.cache.flush()
+
+    def test_set_ttl(self):
+        """ Test if set writes the value and the TTL with one command. """
+        with mock.patch.object(self.cache.redis, 'expire') as expire:
+            self.cache.set('foo', 'bar')
+        expire.assert_not_called()
+        self.assertEqual(self.cache.get('foo'), 'bar')
+        self.assertTrue(0 < self.cache.redis.ttl('foo') <= 10)
+        self.cache.set('foo', 1, ttl=0)
+        self.assertEqual(self.cache.redis.ttl('foo'), -1)
+        self.assertEqual(self.cache.get('foo'), '1')
+
+    def test_many(self):
+        """ Test get_many and set_many. """
+        self.cache.set_many({'a': 'ä', 'b': b'b', 'c': 3}, ttl=5)
+        self.assertEqual(self.cache.get_many(['a', 'missing', 'b', 'c']), ['ä', None, 'b', '3'])
+        self.assertTrue(0 < self.cache.redis.ttl('c') <= 5)
+        self.assertEqual(self.cache.get_many([]), [])
+
+    def test_negative(self):
+        """ Test if negative entries are returned as such with their own TTL. """
+        self.cache.negative_ttl = 3
+        self.cache.set_negative('foo')
+        self.assertEqual(self.cache.get('foo'), NEGATIVE_VALUE)
+        self.assertTrue(0 < self.cache.redis.ttl('foo') <= 3)
+        self.cache.set_negative('bar', ttl=0)
+        self.assertEqual(self.cache.redis.ttl('bar'), -1)
+
+    def test_negative_ttl_default(self):
+        """ Test if negative entries have a short TTL by default. """
+        self.assertEqual(self.cache.negative_ttl, 10)
+        for ttl, expected in ((86400, DEFAULT_NEGATIVE_TTL), (0, DEFAULT_NEGATIVE_TTL), (None, DEFAULT_NEGATIVE_TTL)):
+            cache = Cache(test.BOT_CONFIG['redis_cache_host'],
+                          test.BOT_CONFIG['redis_cache_port'],
+                          test.BOT_CONFIG['redis_cache_db'],
+                          ttl=ttl, password=os.environ.get('INTELMQ_TEST_REDIS_PASSWORD'))
+            self.assertEqual(cache.negative_ttl, expected)
+
+    def test_string_ttl(self):
+        """ Test if TTLs given as strings in the configuration are converted. """
+        cache = Cache(test.BOT_CONFIG['redis_cache_host'],
+                      test.BOT_CONFIG['redis_cache_port'],
+                      test.BOT_CONFIG['redis_cache_db'],
+                      ttl='10', password=os.environ.get('INTELMQ_TEST_REDIS_PASSWORD'),
+                      local_size=10, negative_ttl='3')
+        cache.set('foo', 'bar')
+        self.assertTrue(0 < cache.redis.ttl('foo') <= 10)
+        self.assertEqual(cache.get('foo'), 'bar')
+        cache.set_negative('negative')
+        self.assertTrue(0 < cache.redis.ttl('negative') <= 3)
+        cache.set('other', 'bar', ttl='5')
+        cache.set_negative('other_negative', ttl='2')
+        cache.set_many({'a': 'a'}, ttl='4')
+        self.assertTrue(0 < cache.redis.ttl('other') <= 5)
+        self.assertTrue(0 < cache.redis.ttl('other_negative') <= 2)
+        self.assertTrue(0 < cache.redis.ttl('a') <= 4)
+
+    def test_statistics(self):
+        """ Test the hit, miss and negative hit counters. """
+        self.cache.set('foo', 'bar')
+        self.cache.set_negative('negative')
+        self.cache.get('foo')
+        self.cache.get('missing')
+        self.cache.get_many(['foo', 'negative', 'missing'])
+        self.cache.exists('foo')
+        statistics = self.cache.statistics
+        self.assertEqual((statistics['hits'], statistics['misses'], statistics['negative_hits']),
+                         (3, 2, 1))
+        self.assertGreater(statistics['latency'], 0)
+
+
+@test.skip_redis()
+class TestLocalCache(TestCache):
+
+    def setUp(self):
+        self.cache = Cache(test.BOT_CONFIG['redis_cache_host'],
+                           test.BOT_CONFIG['redis_cache_port'],
+                           test.BOT_CONFIG['redis_cache_db'],
+                           ttl=10,
+                           password=os.environ.get('INTELMQ_TEST_REDIS_PASSWORD'),
+                           local_size=2)
+        self.cache.flush()
+
+    def test_local_hit(self):
+        """ Test if repeated lookups are answered without redis. """
+        self.cache.redis.set('foo', 'bar')
+        self.assertEqual(self.cache.get('foo'), 'bar')
+        self.cache.redis.delete('foo')
+        self.assertEqual(self.cache.get('foo'), 'bar')
+        self.assertEqual(self.cache.get_many(['foo']), ['bar'])
+        self.assertTrue(self.cache.exists('foo'))
+        self.assertFalse(self.cache.exists('missing'))
+
+    def test_local_eviction(self):
+        """ Test if the least recently used value is evicted. """
+        self.cache.set_many({'a': 'a', 'b': 'b'})
+        self.cache.get('a')
+        self.cache.set('c', 'c')
+        self.cache.redis.delete('a', 'b', 'c')
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), ['a', None, 'c'])
+
+    def test_local_ttl(self):
+        """ Test if the local values expire with the TTL of the redis keys. """
+        self.cache.redis.set('foo', 'bar', ex=5)
+        self.cache.set('other', 'bar', ttl=5)
+        self.assertEqual(self.cache.get('foo'), 'bar')
+        self.cache.redis.delete('foo', 'other')
+        with mock.patch('intelmq.lib.cache.time.monotonic', return_value=1e12):
+            self.assertIsNone(self.cache.get('foo'))
+            self.assertIsNone(self.cache.get('other'))
+
+    def test_local_other_types(self):
+        """ Test if values converted by redis are not cached locally. """
+        self.cache.set('foo', 'bar')
+        self.cache.set('foo', 1.5)
+        self.assertEqual(self.cache.get('foo'), '1.5')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
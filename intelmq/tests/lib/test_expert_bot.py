@@ -1,7 +1,12 @@
+import asyncio
+import json
 import unittest
+from unittest import mock
 
 import intelmq.lib.test as test
-from intelmq.lib.bot import Bot
+from intelmq.lib import jsoncodec
+from intelmq.lib.bot import AsyncBot, Bot
+from intelmq.lib.cache import Cache
 
 EXAMPLE = {'feed.name': 'Test', "__type": "Report"}
 QUEUES = {"_default", "other-way", "two-way"}
@@ -48,6 +53,223 @@ def test_pipeline_multiple(self):
         self.assertOutputQueueLen(0, path="other-way")
         self.assertMessageEqual(0, input_message, path="two-way")
 
+    def test_json_backend(self):
+        """ Test if the parameter json_backend selects the JSON backend. """
+        try:
+            self.run_bot(parameters={'json_backend': 'json'})
+            self.assertEqual(jsoncodec.BACKEND, 'json')
+            self.assertMessageEqual(0, EXAMPLE)
+        finally:
+            jsoncodec.set_backend('auto')
+
+    def test_bot_id(self):
+        """ Test the public bot_id property. """
+        self.run_bot()
+        self.assertEqual(self.bot.bot_id, 'test-bot')
+
+    def test_cache_statistics(self):
+        """ Test if the counters of the bot's caches are summed up for the statistics. """
+        self.run_bot()
+        self.assertEqual(self.bot._Bot__cache_statistics(), {})
+        self.bot.cache = Cache('localhost', 6379, 4, 10)
+        self.bot._other_cache = Cache('localhost', 6379, 4, 10)
+        self.assertEqual(self.bot._Bot__cache_statistics(), {})
+        self.bot.cache.statistics.update(hits=2, misses=1, latency=0.5)
+        self.bot._other_cache.statistics.update(hits=1, negative_hits=3, latency=0.25)
+        self.assertEqual(self.bot._Bot__cache_statistics(),
+                         {'hits': 3, 'misses': 1, 'negative_hits': 3, 'latency': 0.75})
+
+    @test.skip_redis()
+    def test_statistics(self):
+        """ Test if the statistics are written in one pipeline. """
+        self.run_bot()
+        stats_cache = Cache(test.BOT_CONFIG['redis_cache_host'], test.BOT_CONFIG['redis_cache_port'],
+                            test.BOT_CONFIG['redis_cache_db'], ttl=None,
+                            password=test.BOT_CONFIG['redis_cache_password'])
+        stats_cache.flush()
+        self.bot._Bot__stats_cache = stats_cache
+        self.bot._Bot__message_counter["path"]["_default"] = 2
+        with mock.patch.object(stats_cache.redis, 'execute_command') as execute_command:
+            self.bot._Bot__stats(force=True)
+        execute_command.assert_not_called()
+        try:
+            self.assertEqual(stats_cache.get_many(['test-bot.stats.success', 'test-bot.stats.failure',
+                                                   'test-bot.total._default', 'test-bot.temporary._default']),
+                             ['1', '0', '2', '2'])
+            self.assertTrue(0 < stats_cache.redis.ttl('test-bot.temporary._default') <= 2)
+            self.assertEqual(stats_cache.redis.ttl('test-bot.total._default'), -1)
+        finally:
+            stats_cache.flush()
+
+
+class DummyBatchExpertBot(Bot):
+
+    def init(self):
+        self.batches = []
+
+    def process(self):
+        event = self.receive_message()
+        if event.get('feed.code') == 'poison':
+            raise ValueError('Poisoned message.')
+        self.send_message(event)
+        self.acknowledge_message()
+
+    def process_batch(self, messages):
+        self.batches.append(len(messages))
+        if any(event.get('feed.code') == 'poison' for event in messages):
+            raise ValueError('Poisoned batch.')
+        self.send_message(*messages)
+        self.acknowledge_messages()
+
+
+POISONED = EXAMPLE.copy()
+POISONED['feed.code'] = 'poison'
+
+
+class TestDummyBatchExpertBot(test.BotTestCase, unittest.TestCase):
+    """ Testing the processing of batches. """
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = DummyBatchExpertBot
+        cls.default_input_message = EXAMPLE.copy()
+        cls.sysconfig = {'source_pipeline_batch_size': 10}
+
+    def test_batch(self):
+        """ Test if all messages are processed in one batch. """
+        self.input_message = [EXAMPLE] * 3
+        self.run_bot()
+        self.assertEqual(self.bot.batches, [3])
+        self.assertOutputQueueLen(3)
+        self.assertEqual(self.pipe.state['test-bot-input-internal'], [])
+
+    def test_batch_size_one(self):
+        """ Test if process is used with the default batch size. """
+        self.input_message = [EXAMPLE] * 2
+        self.run_bot(iterations=2, parameters={'source_pipeline_batch_size': 1})
+        self.assertEqual(self.bot.batches, [])
+        self.assertOutputQueueLen(2)
+
+    def test_poisoned_batch(self):
+        """ Test if the messages of a failed batch are processed individually and only the faulty one is dumped. """
+        self.input_message = [EXAMPLE, POISONED, EXAMPLE]
+        self.run_bot(iterations=4, allowed_error_count=2)
+        self.assertEqual(self.bot.batches, [3])
+        self.assertLogMatches(pattern='Processing a batch failed, processing the 3 unacknowledged messages individually now.',
+                              levelname='ERROR')
+        self.assertLogMatches(pattern='Dumping message to dump file.', levelname='INFO')
+        self.assertOutputQueueLen(2)
+        self.assertEqual(self.pipe.state['test-bot-input-internal'], [])
+        self.assertEqual(self.bot._Bot__batch_fallback, 0)
+
+    def test_batch_after_fallback(self):
+        """ Test if the bot processes batches again after the failed batch. """
+        self.input_message = [POISONED, EXAMPLE, EXAMPLE, EXAMPLE]
+        self.prepare_bot(parameters={'source_pipeline_batch_size': 2})
+        self.run_bot(iterations=4, prepare=False, allowed_error_count=2)
+        self.assertEqual(self.bot.batches, [2, 2])
+        self.assertOutputQueueLen(3)
+
+    def test_max_wait(self):
+        """ Test if the bot waits for more messages up to source_pipeline_batch_max_wait. """
+        self.input_message = [EXAMPLE]
+        with mock.patch('intelmq.lib.bot.time.sleep') as sleep:
+            self.run_bot(parameters={'source_pipeline_batch_max_wait': 0.05})
+        self.assertTrue(sleep.called)
+        self.assertLessEqual(max(call[0][0] for call in sleep.call_args_list), 0.05)
+        self.assertEqual(self.bot.batches, [1])
+
+
+class TestBatchNotSupported(test.BotTestCase, unittest.TestCase):
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = DummyExpertBot
+        cls.default_input_message = EXAMPLE.copy()
+        cls.sysconfig = {'source_pipeline_batch_size': 10}
+
+    def test_process(self):
+        """ Test if bots without process_batch ignore the batch size. """
+        self.run_bot(allowed_warning_count=1)
+        self.assertLogMatches(pattern='Batches are configured, but are not supported by this bot.',
+                              levelname='WARNING')
+        self.assertMessageEqual(0, EXAMPLE)
+
+
+class DummyAsyncExpertBot(AsyncBot):
+
+    def init(self):
+        self.in_flight = self.max_in_flight = 0
+
+    async def process_async(self, event):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.1 if event.get('feed.code') == 'slow' else 0.01)
+        self.in_flight -= 1
+        if event.get('feed.code') == 'drop':
+            return None
+        if event.get('feed.code') == 'poison':
+            raise ValueError('Poisoned message.')
+        if event.get('feed.code') == 'other-way':
+            return [event], 'other-way'
+        return event
+
+
+class TestDummyAsyncExpertBot(test.BotTestCase, unittest.TestCase):
+
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = DummyAsyncExpertBot
+        cls.default_input_message = EXAMPLE.copy()
+
+    def test_concurrency(self):
+        """ Test if the messages are processed concurrently, limited by the parameter concurrency. """
+        dropped = EXAMPLE.copy()
+        dropped['feed.code'] = 'drop'
+        self.input_message = [dict(EXAMPLE, **{'feed.name': str(i)}) for i in range(10)] + [dropped]
+        self.run_bot(parameters={'concurrency': 4})
+        self.assertEqual(self.bot.max_in_flight, 4)
+        self.assertOutputQueueLen(10)
+        self.assertCountEqual([json.loads(event) for event in self.get_output_queue()],
+                              [dict(EXAMPLE, **{'feed.name': str(i)}) for i in range(10)])
+
+    def test_sliding_window(self):
+        """ Test if finished messages are sent at once and replaced by the next ones. """
+        slow = dict(EXAMPLE, **{'feed.code': 'slow'})
+        self.input_message = [slow] + [dict(EXAMPLE, **{'feed.name': str(i)}) for i in range(5)]
+        self.run_bot(parameters={'concurrency': 2})
+        self.assertEqual(self.bot.max_in_flight, 2)
+        self.assertOutputQueueLen(6)
+        self.assertMessageEqual(5, slow)
+        self.assertEqual(self.pipe.state['test-bot-input-internal'], [])
+
+    def test_failure(self):
+        """ Test if only the failed message is processed again and dumped. """
+        self.input_message = [POISONED, EXAMPLE, EXAMPLE]
+        self.run_bot(iterations=2, allowed_error_count=2)
+        self.assertLogMatches(pattern='Processing a batch failed, processing the 1 unacknowledged messages individually now.',
+                              levelname='ERROR')
+        self.assertLogMatches(pattern='Dumping message to dump file.', levelname='INFO')
+        self.assertOutputQueueLen(2)
+        self.assertEqual(self.pipe.state['test-bot-input-internal'], [])
+        self.assertEqual(self.bot._Bot__message_counter['success'], 2)
+        self.assertEqual(self.bot._Bot__message_counter['failure'], 1)
+
+    def test_path(self):
+        """ Test if process_async can return the path. """
+        other = dict(EXAMPLE, **{'feed.code': 'other-way'})
+        self.input_message = [EXAMPLE, other]
+        self.prepare_bot(destination_queues=QUEUES)
+        self.run_bot(prepare=False)
+        self.assertMessageEqual(0, EXAMPLE)
+        self.assertMessageEqual(0, other, path='other-way')
+
+    def test_single(self):
+        """ Test if process handles single messages. """
+        self.run_bot(parameters={'source_pipeline_batch_size': 1})
+        self.assertEqual(self.bot.max_in_flight, 1)
+        self.assertMessageEqual(0, EXAMPLE)
+
 
 if __name__ == '__main__':  # pragma: no cover
     unittest.main()
@@ -2,8 +2,15 @@
 """
 Testing harmonization classes
 """
+import datetime
 import ipaddress
+import threading
 import unittest
+from unittest import mock
+
+import dateutil.parser
+import dns.reversename
+import pytz
 
 import intelmq.lib.harmonization as harmonization
 import intelmq.lib.test as test
@@ -142,6 +149,43 @@ def test_ipaddress_sanitize_invalid(self):
         self.assertFalse(harmonization.IPAddress.is_valid(b'2001:DB8::1/32',
                                                           sanitize=True))
 
+    def test_ipaddress_conversions(self):
+        """ Test IPAddress.to_int, version and to_reverse. """
+        for value in ('192.0.2.1', '2001:db8::1', '::ffff:192.0.2.1', '::'):
+            with self.subTest(value=value):
+                address = ipaddress.ip_address(value)
+                self.assertEqual(harmonization.IPAddress.to_int(value), int(address))
+                self.assertEqual(harmonization.IPAddress.version(value), address.version)
+                self.assertEqual(harmonization.IPAddress.to_reverse(value),
+                                 str(dns.reversename.from_address(value)))
+        self.assertIsNone(harmonization.IPAddress.to_int('192.0.2.256'))
+        self.assertEqual(harmonization.IPAddress.version(ipaddress.ip_address('192.0.2.1')), 4)
+        with self.assertRaises(ValueError):
+            harmonization.IPAddress.version('localhost')
+
+    def test_ipaddress_sanitize_normalized(self):
+        """ Test if IPAddress.sanitize normalizes the addresses. """
+        self.assertEqual(harmonization.IPAddress.sanitize('2001:DB8:0::1/128'), '2001:db8::1')
+        self.assertEqual(harmonization.IPAddress.sanitize('192.0.2.1/32'), '192.0.2.1')
+        self.assertIsNone(harmonization.IPAddress.sanitize('192.0.2.01'))
+        self.assertFalse(harmonization.IPAddress.is_valid('0.0.0.0'))
+        self.assertTrue(harmonization.IPAddress.is_valid('::'))
+
+    def test_ipaddress_sanitize_many(self):
+        """ Test IPAddress.sanitize_many with a column of valid and invalid values. """
+        self.assertEqual(harmonization.IPAddress.sanitize_many([' 192.0.2.1', '2001:DB8::1', 'localhost',
+                                                                 '192.0.2.1', None, '0.0.0.0']),
+                         ['192.0.2.1', '2001:db8::1', None, '192.0.2.1', None, None])
+        self.assertEqual(harmonization.IPAddress.sanitize_many([]), [])
+
+    def test_sanitize_many_types(self):
+        """ Test if sanitize_many distinguishes equal values of different types. """
+        self.assertEqual(harmonization.Boolean.sanitize_many([True, 1.0, 'true', 'foo']),
+                         [True, None, True, None])
+        self.assertEqual(harmonization.Integer.sanitize_many(['1', 1, 'a']), [1, 1, None])
+        self.assertEqual(harmonization.JSONDict.sanitize_many([{'a': 1}, {'a': 1}]),
+                         ['{"a": 1}', '{"a": 1}'])
+
     def test_ipnetwork_valid(self):
         """ Test IPNetwork.is_valid with valid arguments. """
         self.assertTrue(harmonization.IPNetwork.is_valid('192.0.2.1'))
@@ -230,6 +274,73 @@ def test_datetime_sanitize(self):
                          harmonization.DateTime.sanitize(
                          '2016-07-19 13:08:38 UTC'))
 
+    def test_datetime_layouts(self):
+        """ Test if the fast paths for common layouts give the same results as dateutil. """
+        for value in ('2020-01-01T10:00:00+00:00', '2020-01-01T10:00:00.000000+00:00',
+                      '2020-01-01T10:00:00Z', '2020-01-01 10:00:00', '2020-01-01T10:00:00.5+02:00',
+                      '2020-01-01 10:00:00.123456-0530', '2020-01-01T10:00:00-00:00', '2020-01-01',
+                      '2020-1-1T1:00:00+00:00', '2020-01-01T10:00:00.1234567Z'):
+            with self.subTest(value=value):
+                expected = dateutil.parser.parse(value, fuzzy=True)
+                self.assertEqual(harmonization.DateTime.convert_fuzzy(value), expected.isoformat())
+                harmonization.DateTime._DateTime__parse_cached.cache_clear()
+                if value.endswith('+00:00'):  # parse_utc_isoformat
+                    expected = value
+                else:
+                    expected = expected.astimezone(pytz.utc).isoformat()
+                self.assertEqual(harmonization.DateTime.sanitize(value), expected)
+        for value in ('2020-02-30 10:00:00', '2020-01-01T24:00:00Z'):
+            self.assertIsNone(harmonization.DateTime.sanitize(value))
+
+    def test_datetime_digits(self):
+        """ Test if plain digits are not taken for epoch timestamps by the sanitation. """
+        for value in ('2020010110', '1577872800'):
+            with self.subTest(value=value):
+                self.assertIsNone(harmonization.DateTime.sanitize(value))
+
+    def test_datetime_layout_learning(self):
+        """ Test if the last matching layout is tried first. """
+        harmonization.DateTime.convert_fuzzy('2020-01-01')
+        layouts = harmonization.DateTime._DateTime__local.layouts
+        self.assertEqual(layouts[0][0].pattern, r'(\d{4})-(\d{2})-(\d{2})$')
+        with mock.patch('dateutil.parser.parse') as parse:
+            harmonization.DateTime.convert_fuzzy('2020-01-01 10:00:00')
+        parse.assert_not_called()
+        self.assertEqual(layouts[1][0].pattern, r'(\d{4})-(\d{2})-(\d{2})$')
+
+    def test_datetime_layout_learning_threads(self):
+        """ Test if every thread has its own order of the layouts. """
+        harmonization.DateTime.convert_fuzzy('2020-01-01')
+        thread = threading.Thread(target=harmonization.DateTime.convert_fuzzy, args=('2020-01-01 10:00:00', ))
+        thread.start()
+        thread.join()
+        self.assertEqual(harmonization.DateTime._DateTime__local.layouts[0][0].pattern,
+                         r'(\d{4})-(\d{2})-(\d{2})$')
+
+    def test_datetime_cache(self):
+        """ Test if sanitized values are cached and the cache is cleared on the next day. """
+        harmonization.DateTime.sanitize('2020-01-01 10:00:00')
+        cache_info = harmonization.DateTime._DateTime__parse_cached.cache_info
+        hits = cache_info().hits
+        self.assertEqual(harmonization.DateTime.sanitize('2020-01-01 10:00:00'),
+                         '2020-01-01T10:00:00+00:00')
+        self.assertEqual(cache_info().hits, hits + 1)
+        harmonization.DateTime._DateTime__cache_date = datetime.date(2000, 1, 1)
+        harmonization.DateTime.sanitize('2020-01-01 10:00:00')
+        self.assertEqual(cache_info().currsize, 1)
+
+    def test_datetime_parse_many(self):
+        """ Test DateTime.parse_many with different formats. """
+        self.assertEqual(harmonization.DateTime.parse_many(['2020-01-01 10:00:00', 'foobar',
+                                                            '2020-01-01 10:00:00', None]),
+                         ['2020-01-01T10:00:00+00:00', None, '2020-01-01T10:00:00+00:00', None])
+        self.assertEqual(harmonization.DateTime.parse_many([1577872800, '1577872800', 1577872800],
+                                                           format='timestamp'),
+                         ['2020-01-01T10:00:00+00:00', None, '2020-01-01T10:00:00+00:00'])
+        self.assertEqual(harmonization.DateTime.parse_many(['01.01.2020', '2020-01-01'],
+                                                           format='from_format_midnight|%d.%m.%Y'),
+                         ['2020-01-01T00:00:00+00:00', None])
+
     def test_datetime_from_timestamp_invalid(self):
         """ Test DateTime.from_timestamp method with invalid inputs. """
         with self.assertRaises(TypeError):
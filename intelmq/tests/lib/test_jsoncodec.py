@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the JSON backends for messages.
+
+All available backends must produce the same messages, hashes and dumps.
+"""
+import json
+import unittest
+
+import pkg_resources
+
+import intelmq.lib.exceptions as exceptions
+import intelmq.lib.jsoncodec as jsoncodec
+import intelmq.lib.message as message
+from intelmq.lib.utils import load_configuration
+
+HARM = load_configuration(pkg_resources.resource_filename('intelmq',
+                                                          'etc/harmonization.conf'))
+EVENT = {'feed.name': 'Grüße / Test',
+         'source.ip': '192.0.2.1',
+         'source.port': 53,
+         'time.source': '2020-01-01T00:00:00+00:00',
+         'extra.score': 0.1,
+         'extra.tags': ['a', 'ä'],
+         'extra.flag': True,
+         'comment': 'quote " and \\ and  ',
+         }
+EVENT_HASH = '5432c4ba6d75171a421a9222ea7a2efb98b255b4e601332272e8238e13a7f7f2'
+EVENT_JSON = ('{"comment": "quote \\" and \\\\ and  ", "extra.flag": true, '
+              '"extra.score": 0.1, "extra.tags": ["a", "ä"], "feed.name": "Grüße / Test", '
+              '"source.ip": "192.0.2.1", "source.port": 53, '
+              '"time.source": "2020-01-01T00:00:00+00:00"}')
+DUMP = {'2020-01-01T00:00:00': {'bot_id': 'test-bot',
+                                'message': 'Grüße',
+                                'source_queue': 'test-bot-input',
+                                'traceback': ['Traceback', 'ValueError']}}
+DUMP_FORMATTED = '''{
+    "2020-01-01T00:00:00": {
+        "bot_id": "test-bot",
+        "message": "Gr\\u00fc\\u00dfe",
+        "source_queue": "test-bot-input",
+        "traceback": [
+            "Traceback",
+            "ValueError"
+        ]
+    }
+}'''
+
+
+class TestJsonCodec(unittest.TestCase):
+    """
+    Runs the tests with all available backends.
+    """
+
+    def tearDown(self):
+        jsoncodec.set_backend(next(iter(jsoncodec.BACKENDS)))
+
+    def test_default_backend(self):
+        """ Test if the fastest available backend is used. """
+        self.assertEqual(jsoncodec.BACKEND, next(iter(jsoncodec.BACKENDS)))
+        self.assertIn('json', jsoncodec.BACKENDS)
+
+    def test_set_backend(self):
+        """ Test if unknown and missing backends are rejected. """
+        with self.assertRaises(exceptions.InvalidArgument):
+            jsoncodec.set_backend('simplejson')
+        jsoncodec.set_backend('json')
+        jsoncodec.set_backend('auto')
+        self.assertEqual(jsoncodec.BACKEND, next(iter(jsoncodec.BACKENDS)))
+        for backend in ('orjson', 'ujson'):
+            if backend not in jsoncodec.BACKENDS:
+                with self.assertRaises(exceptions.MissingDependencyError):
+                    jsoncodec.set_backend(backend)
+
+    def test_event_round_trip(self):
+        """ Test if events are decoded unchanged, also by all other backends. """
+        event = message.Event(EVENT, harmonization=HARM)
+        for writer in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(writer)
+            raw = message.MessageFactory.serialize(event)
+            for reader in jsoncodec.BACKENDS:
+                jsoncodec.set_backend(reader)
+                with self.subTest(writer=writer, reader=reader):
+                    decoded = message.MessageFactory.unserialize(raw, harmonization=HARM)
+                    self.assertEqual(decoded, event)
+                    self.assertEqual(decoded.hash(), EVENT_HASH)
+                    lazy = message.MessageFactory.unserialize(raw, harmonization=HARM, lazy=True)
+                    self.assertEqual(lazy.hash(), EVENT_HASH)
+
+    def test_event_lazy_changes(self):
+        """ Test if changes to lazy messages are spliced in the format of the document. """
+        event = message.Event(EVENT, harmonization=HARM)
+        del event['extra.tags']
+        for writer in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(writer)
+            raw = message.MessageFactory.serialize(event)
+            for reader in jsoncodec.BACKENDS:
+                jsoncodec.set_backend(reader)
+                with self.subTest(writer=writer, reader=reader):
+                    lazy = message.MessageFactory.unserialize(raw, harmonization=HARM, lazy=True)
+                    del lazy['comment']
+                    lazy.add('source.asn', 64496)
+                    self.assertFalse(lazy.materialized)
+                    self.assertEqual(', "' in lazy.serialize(), ', "' in raw)
+                    self.assertEqual(json.loads(lazy.serialize())['source.asn'], 64496)
+
+    def test_event_to_json(self):
+        """ Test if the output format does not depend on the backend. """
+        event = message.Event(EVENT, harmonization=HARM)
+        for backend in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(event.to_json(), EVENT_JSON)
+                self.assertEqual(event['extra'],
+                                 '{"score": 0.1, "tags": ["a", "\\u00e4"], "flag": true}')
+
+    def test_dump_format(self):
+        """ Test if the dump format does not depend on the backend. """
+        for backend in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(jsoncodec.dumps(DUMP, indent=4, sort_keys=True), DUMP_FORMATTED)
+                self.assertEqual(jsoncodec.loads(DUMP_FORMATTED), DUMP)
+
+    def test_fallback(self):
+        """ Test if values not supported by the backends are handled by the standard library. """
+        for backend in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(jsoncodec.loads(jsoncodec.dumps({'big': 2 ** 70, 1: 'int key'})),
+                                 {'big': 2 ** 70, '1': 'int key'})
+                self.assertEqual(jsoncodec.loads('[NaN, 18446744073709551616]')[1], 2 ** 64)
+                with self.assertRaises(json.JSONDecodeError):
+                    jsoncodec.loads('{"foo": ')
+                with self.assertRaises(TypeError):
+                    jsoncodec.dumps({'foo': object()})
+
+
+if __name__ == '__main__':  # pragma: no cover
+    unittest.main()
@@ -6,12 +6,14 @@
 Most tests are performed on Report, as it is formally the same as Message,
 but has a valid Harmonization configuration.
 """
+import collections.abc
 import json
 import unittest
 
 import pkg_resources
 
 import intelmq.lib.exceptions as exceptions
+import intelmq.lib.jsoncodec as jsoncodec
 import intelmq.lib.message as message  # noqa
 from intelmq.lib.utils import load_configuration
 
@@ -366,6 +368,123 @@ def test_factory_serialize(self):
         self.assertDictEqual(json.loads(expected),
                              json.loads(actual))
 
+    def test_factory_unserialize_pass_through(self):
+        """ Test if unchanged messages are serialized as received. """
+        raw = '{"source.ip": "192.0.2.1", "__type": "Event"}'
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM)
+        self.assertIs(message.MessageFactory.serialize(event), raw)
+        event.add('source.port', 53)
+        self.assertEqual(json.loads(message.MessageFactory.serialize(event)),
+                         {'source.ip': '192.0.2.1', 'source.port': 53, '__type': 'Event'})
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_unserialize_pass_through_msgpack(self):
+        """ Test if unchanged msgpack messages are serialized as received. """
+        event = message.Event({'source.ip': '192.0.2.1'}, harmonization=HARM)
+        raw = message.MessageFactory.serialize(event, format='msgpack')
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM)
+        self.assertIs(message.MessageFactory.serialize(event, format='msgpack'), raw)
+        self.assertEqual(json.loads(message.MessageFactory.serialize(event)),
+                         {'source.ip': '192.0.2.1', '__type': 'Event'})
+
+    def test_factory_unserialize_pass_through_copy(self):
+        """ Test if copy and serialize keep the received message of the original and an unmodified copy. """
+        raw = '{"source.ip": "192.0.2.1", "__type": "Event"}'
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM)
+        copy = event.copy()
+        self.assertIs(message.MessageFactory.serialize(event), raw)
+        self.assertIs(message.MessageFactory.serialize(copy), raw)
+        self.assertIs(event.serialize(), raw)
+        copy.add('source.port', 53)
+        self.assertIsNot(message.MessageFactory.serialize(copy), raw)
+        self.assertIs(message.MessageFactory.serialize(event), raw)
+
+    def test_factory_unserialize_pass_through_modified(self):
+        """ Test if all kinds of modifications prevent the pass-through. """
+        raw = '{"source.ip": "192.0.2.1", "source.port": 53, "__type": "Event"}'
+        for modification in (lambda event: event.change('source.port', 54),
+                             lambda event: event.update({'source.port': 54}),
+                             lambda event: event.__delitem__('source.port'),
+                             lambda event: event.pop('source.port'),
+                             lambda event: event.clear()):
+            event = message.MessageFactory.unserialize(raw, harmonization=HARM)
+            modification(event)
+            self.assertIsNot(message.MessageFactory.serialize(event), raw)
+
+    def test_factory_unserialize_pass_through_sanitized(self):
+        """ Test if messages changed by the sanitation are not passed through. """
+        raw = '{"source.ip": "192.0.2.1", "source.port": "53", "__type": "Event"}'
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM)
+        self.assertEqual(json.loads(message.MessageFactory.serialize(event)),
+                         {'source.ip': '192.0.2.1', 'source.port': 53, '__type': 'Event'})
+
+    def test_factory_unserialize_trusted(self):
+        """ Test if trusted messages are taken without validation. """
+        raw = '{"__type": "Event", "source.ip": "192.0.2.999", "extra.foo": "bar"}'
+        with self.assertRaises(exceptions.InvalidValue):
+            message.MessageFactory.unserialize(raw, harmonization=HARM)
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM, trusted=True)
+        self.assertIsInstance(event, message.Event)
+        self.assertEqual(event['source.ip'], '192.0.2.999')
+        self.assertEqual(event['extra.foo'], 'bar')
+        with self.assertRaises(exceptions.InvalidValue):
+            event.change('source.ip', '192.0.2.256')
+
+    def test_factory_unserialize_trusted_jsondict(self):
+        """ Test if trusted messages with extra as a whole are split up. """
+        raw = '{"__type": "Event", "extra": "{\\"foo\\": \\"bar\\"}"}'
+        event = message.MessageFactory.unserialize(raw, harmonization=HARM, trusted=True)
+        self.assertEqual(dict(event), {'extra.foo': 'bar'})
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_serialize_msgpack(self):
+        """ Test MessageFactory serialize and unserialize with msgpack. """
+        event = self.add_event_examples(self.new_event())
+        event.add('extra.mail_subject', 'This is a test')
+        actual = message.MessageFactory.serialize(event, format='msgpack')
+        self.assertIsInstance(actual, bytes)
+        self.assertTrue(actual.startswith(message.MSGPACK_PREFIX))
+        self.assertLess(len(actual), len(event.serialize()))
+        self.assertNotIn(b'feed.name', actual)
+        self.assertIn(b'mail_subject', actual)
+        unserialized = message.MessageFactory.unserialize(actual, harmonization=HARM)
+        self.assertIsInstance(unserialized, message.Event)
+        self.assertDictEqual(event, unserialized)
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_unserialize_msgpack_report(self):
+        """ Test that the message type survives the msgpack format. """
+        report = self.new_report(examples=True)
+        actual = message.MessageFactory.serialize(report, format='msgpack')
+        unserialized = message.MessageFactory.unserialize(actual, harmonization=HARM)
+        self.assertIsInstance(unserialized, message.Report)
+        self.assertDictEqual(report, unserialized)
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_unserialize_msgpack_harmonization_mismatch(self):
+        """ Test that differing harmonization configurations are detected. """
+        event = self.add_event_examples(self.new_event())
+        actual = message.MessageFactory.serialize(event, format='msgpack')
+        harm = {'event': dict(HARM['event']), 'report': HARM['report']}
+        harm['event']['zzz.new_field'] = {'type': 'String', 'description': ''}
+        with self.assertRaises(exceptions.DecodingError):
+            message.MessageFactory.unserialize(actual, harmonization=harm)
+
+    @unittest.skipIf(message.msgpack is None, 'msgpack is not installed.')
+    def test_factory_unserialize_msgpack_invalid(self):
+        """ Test that malformed msgpack payloads raise DecodingError. """
+        event = self.add_event_examples(self.new_event())
+        header = message.MessageFactory.serialize(event, format='msgpack')[:7]
+        for payload in ({100000: 'foo'}, {-1: 'foo'}, ['foo'], 'foo'):
+            with self.assertRaises(exceptions.DecodingError):
+                message.MessageFactory.unserialize(header + message.msgpack.packb(payload),
+                                                   harmonization=HARM)
+
+    def test_factory_serialize_invalid_format(self):
+        """ Test MessageFactory serialize with an unknown format. """
+        with self.assertRaises(exceptions.InvalidArgument):
+            message.MessageFactory.serialize(self.new_report(), format='xml')
+
     def test_deep_copy_content(self):
         """ Test if deep_copy does return the same items. """
         report = self.new_report(examples=True)
@@ -471,6 +590,45 @@ def test_event_hash_method_whitelist(self):
                          event2.hash(filter_type="whitelist",
                                      filter_keys={"feed.url", "raw"}))
 
+    def test_event_hash_cached(self):
+        """ Test if hashes are cached until the event is modified. """
+        event = self.add_event_examples(self.new_event())
+        expected = event.hash()
+        self.assertIs(event.hash(), expected)
+        self.assertIsNot(event.hash(filter_keys={'raw'}), expected)
+        for modification in (lambda event: event.add('source.port', 53),
+                             lambda event: event.change('feed.name', 'Other'),
+                             lambda event: event.__delitem__('raw'),
+                             lambda event: event.pop('feed.url')):
+            modification(event)
+            self.assertNotEqual(event.hash(), expected)
+            expected = event.hash()
+            self.assertEqual(expected, event.deep_copy().hash())
+
+    def test_event_hash_cached_serialize(self):
+        """ Test if serialize and copy keep the cached hashes. """
+        event = self.add_event_examples(self.new_event())
+        expected = event.hash()
+        event.serialize()
+        self.assertIs(event.hash(), expected)
+        self.assertIs(event.copy().hash(), expected)
+
+    def test_event_hash_digest(self):
+        """ Test the selectable digests. """
+        event = self.add_event_examples(self.new_event())
+        self.assertEqual(event.hash(digest='sha256'),
+                         'd04aa050afdc58a39329c78c3b59ce6fb6f11effe180fe8084b4f1e89007de71')
+        self.assertEqual(event.hash(digest='blake2b'), 'a6313b8142435ccbd0fc924d0e29b7aa')
+        self.assertNotEqual(event.hash(digest='blake2b', filter_keys={'raw'}),
+                            event.hash(digest='blake2b'))
+        with self.assertRaises(exceptions.InvalidArgument):
+            event.hash(digest='md5')
+        if message.xxhash is None:
+            with self.assertRaises(exceptions.MissingDependencyError):
+                event.hash(digest='xxhash')
+        else:
+            self.assertEqual(len(event.hash(digest='xxhash')), 32)
+
     def test_event_dict(self):
         """ Test Event to_dict. """
         event = self.new_event()
@@ -517,20 +675,20 @@ def test_event_json_hierarchical(self):
     def test_event_serialize(self):
         """ Test Event serialize. """
         event = self.new_event()
-        self.assertEqual('{"__type": "Event"}',
-                         event.serialize())
+        self.assertEqual({"__type": "Event"},
+                         json.loads(event.serialize()))
 
     def test_event_string(self):
         """ Test Event serialize. """
         event = self.new_event()
-        self.assertEqual('{"__type": "Event"}',
-                         event.serialize())
+        self.assertEqual({"__type": "Event"},
+                         json.loads(event.serialize()))
 
     def test_event_unicode(self):
         """ Test Event serialize. """
         event = self.new_event()
-        self.assertEqual('{"__type": "Event"}',
-                         event.serialize())
+        self.assertEqual({"__type": "Event"},
+                         json.loads(event.serialize()))
 
     def test_event_from_report(self):
         """ Data from report should be in event, except for extra. """
@@ -759,6 +917,267 @@ def test_invalid_harm_key(self):
         with self.assertRaises(exceptions.InvalidKey):
             message.Event(harmonization={'event': {'foo.bar.': {}}})
 
+    def test_schema_cached(self):
+        """ Test if the compiled harmonization schema is shared by all messages. """
+        event1 = self.new_event()
+        event2 = self.new_event()
+        self.assertIs(event1._schema, event2._schema)
+        self.assertIs(message.HarmonizationSchema.get(HARM['event']), event1._schema)
+
+    def test_schema_lookup(self):
+        """ Test the lookup of keys and subitems in the compiled harmonization schema. """
+        schema = message.HarmonizationSchema.get(HARM['event'])
+        self.assertEqual(schema.lookup('source.ip'), (schema.fields['source.ip'], False))
+        self.assertEqual(schema.lookup('extra.foo.bar'), (schema.fields['extra'], True))
+        with self.assertRaises(KeyError):
+            schema.lookup('source.foo')
+
+    def test_schema_regex(self):
+        """ Test if the regular expressions of the harmonization are applied. """
+        harmonization = {'event': {'comment': {'type': 'String', 'regex': '^[a-z]+$'},
+                                   'feed.code': {'type': 'String', 'iregex': '^[a-z]+$',
+                                                 'length': 3}}}
+        event = message.Event(harmonization=harmonization)
+        event.add('comment', 'foo')
+        self.assertFalse(event.add('comment', 'Foo', overwrite=True, raise_failure=False))
+        event.add('feed.code', 'FOO')
+        with self.assertRaises(exceptions.InvalidValue):
+            event.add('feed.code', 'FOOO', overwrite=True)
+
+
+class TestCompactMessageFactory(TestMessageFactory):
+    """
+    Runs the tests of the Message API with CompactMessage objects.
+    """
+
+    def new_report(self, auto=False, examples=False):
+        report = message.CompactMessage(message.Report(harmonization=HARM, auto=auto))
+        if examples:
+            return self.add_report_examples(report)
+        else:
+            return report
+
+    def new_event(self):
+        return message.CompactMessage(message.Event(harmonization=HARM))
+
+    def assertDictEqual(self, first, second, msg=None):
+        super().assertDictEqual(dict(first), dict(second), msg)
+
+    def test_report_type(self):
+        """ Test if the Report type is kept. """
+        report = self.new_report()
+        self.assertIs(type(report), message.CompactMessage)
+        self.assertIs(type(report.to_message()), message.Report)
+
+    def test_event_type(self):
+        """ Test if the Event type is kept. """
+        event = self.new_event()
+        self.assertIs(type(event), message.CompactMessage)
+        self.assertIs(type(event.to_message()), message.Event)
+
+    def test_report_subclass(self):
+        """ Test if CompactMessage is a mapping. """
+        self.assertIsInstance(self.new_report(), collections.abc.MutableMapping)
+
+    def test_event_subclass(self):
+        """ Test if CompactMessage is a mapping. """
+        self.assertIsInstance(self.new_event(), collections.abc.MutableMapping)
+
+    def test_deep_copy_items(self):
+        """ Test if deep_copy does not return the same values, the keys are shared. """
+        report = self.new_report(examples=True)
+        report.add('extra.list', [1, 2])
+        self.assertIsNot(report.deep_copy()['extra.list'], report['extra.list'])
+
+
+class TestLazyMessage(unittest.TestCase):
+    """
+    Testing the lazy view on JSON-encoded messages.
+    """
+
+    def new_lazy(self):
+        event = message.Event(harmonization=HARM)
+        event.add('source.ip', '192.0.2.1')
+        event.add('source.port', 53)
+        event.add('extra.foo', 'bar, "baz": 1')
+        event.add('raw', LOREM_BASE64, sanitize=False)
+        return message.MessageFactory.unserialize(event.serialize(), harmonization=HARM, lazy=True)
+
+    def test_access(self):
+        """ Test if fields are decoded without materializing the message. """
+        lazy = self.new_lazy()
+        self.assertEqual(lazy['source.ip'], '192.0.2.1')
+        self.assertEqual(lazy['source.port'], 53)
+        self.assertEqual(lazy.get('extra.foo'), 'bar, "baz": 1')
+        self.assertIsNone(lazy.get('source.fqdn'))
+        self.assertNotIn('__type', lazy)
+        self.assertNotIn('extra.baz', lazy)
+        self.assertCountEqual(lazy.keys(), ['source.ip', 'source.port', 'extra.foo', 'raw'])
+        self.assertFalse(lazy.materialized)
+
+    def test_nested(self):
+        """ Test if documents with nested values are decoded completely. """
+        event = message.Event({'extra.tags': ['a', 'b'], 'extra.foo': {'source.ip': 'baz'},
+                               'source.ip': '192.0.2.1'}, harmonization=HARM)
+        lazy = message.MessageFactory.unserialize(event.serialize(), harmonization=HARM, lazy=True)
+        self.assertTrue(lazy.materialized)
+        self.assertEqual(lazy['extra.tags'], ['a', 'b'])
+        self.assertEqual(lazy['source.ip'], '192.0.2.1')
+        self.assertEqual(lazy, event)
+
+    def test_unchanged_serialize(self):
+        """ Test if the unchanged document is returned as is. """
+        lazy = self.new_lazy()
+        raw = lazy.serialize()
+        self.assertIs(message.MessageFactory.serialize(lazy), raw)
+
+    def test_changes(self):
+        """ Test if changes are validated and spliced into the document. """
+        lazy = self.new_lazy()
+        with self.assertRaises(exceptions.InvalidValue):
+            lazy.add('source.asn', 'foo')
+        with self.assertRaises(exceptions.KeyExists):
+            lazy.add('source.ip', '192.0.2.2')
+        lazy.change('source.ip', '192.0.2.2')
+        lazy.add('source.asn', '64496')
+        del lazy['source.port']
+        self.assertFalse(lazy.materialized)
+        self.assertEqual(json.loads(lazy.serialize()),
+                         {'__type': 'Event', 'source.ip': '192.0.2.2', 'source.asn': 64496,
+                          'extra.foo': 'bar, "baz": 1', 'raw': LOREM_BASE64})
+
+    def test_delete_first(self):
+        """ Test if the separators are removed correctly. """
+        lazy = self.new_lazy()
+        for key in ('source.ip', 'source.port', 'extra.foo', 'raw'):
+            del lazy[key]
+        self.assertEqual(json.loads(lazy.serialize()), {"__type": "Event"})
+
+    def test_materialize(self):
+        """ Test if other operations convert the view into an Event. """
+        lazy = self.new_lazy()
+        lazy.add('comment', 'foo')
+        self.assertEqual(lazy['extra'], '{"foo": "bar, \\"baz\\": 1"}')
+        self.assertTrue(lazy.materialized)
+        self.assertIsInstance(lazy.materialize(), message.Event)
+        self.assertEqual(lazy.to_dict()['comment'], 'foo')
+
+    def test_other_format(self):
+        """ Test if documents not written by IntelMQ are decoded completely. """
+        lazy = message.MessageFactory.unserialize('{ "__type": "Event", "source.ip": "192.0.2.1" }',
+                                                  harmonization=HARM, lazy=True)
+        self.assertTrue(lazy.materialized)
+        self.assertEqual(lazy['source.ip'], '192.0.2.1')
+
+    def test_non_ascii_key(self):
+        """ Test if non-ASCII keys are found in documents of writers escaping them. """
+        event = message.Event({'extra.\xe4': 'foo', 'source.ip': '192.0.2.1'}, harmonization=HARM)
+        jsoncodec.set_backend('json')
+        try:
+            raw = event.serialize()
+        finally:
+            jsoncodec.set_backend('auto')
+        self.assertIn('\\u00e4', raw)
+        for backend in jsoncodec.BACKENDS:
+            jsoncodec.set_backend(backend)
+            try:
+                lazy = message.MessageFactory.unserialize(raw, harmonization=HARM, lazy=True)
+                self.assertIn('extra.\xe4', lazy)
+                self.assertEqual(lazy['extra.\xe4'], 'foo')
+                self.assertEqual(lazy, event)
+            finally:
+                jsoncodec.set_backend('auto')
+
+    def test_separators(self):
+        """ Test if documents with and without spaces after the separators are handled lazily. """
+        for raw in ('{"source.ip": "192.0.2.1", "source.port": 53, "__type": "Event"}',
+                    '{"source.ip":"192.0.2.1","source.port":53,"__type":"Event"}'):
+            lazy = message.MessageFactory.unserialize(raw, harmonization=HARM, lazy=True)
+            self.assertEqual(lazy['source.port'], 53)
+            self.assertCountEqual(lazy.keys(), ['source.ip', 'source.port'])
+            del lazy['source.ip']
+            lazy.add('source.asn', 64496)
+            self.assertFalse(lazy.materialized)
+            self.assertEqual(json.loads(lazy.serialize()),
+                             {'source.port': 53, 'source.asn': 64496, '__type': 'Event'})
+            self.assertEqual(lazy.serialize().count(' '), raw.count(' '))
+
+
+class TestCompactMessage(unittest.TestCase):
+    """
+    Testing the compact representation of messages.
+    """
+
+    def new_event(self):
+        event = message.Event(FEED_FIELDS, harmonization=HARM)
+        event.add('source.ip', '192.0.2.1')
+        event.add('source.port', 53)
+        return event
+
+    def test_mapping(self):
+        """ Test the dict API. """
+        event = self.new_event()
+        compact = message.CompactMessage(event)
+        self.assertEqual(compact, event)
+        self.assertEqual(event, compact)
+        self.assertEqual(dict(compact), dict(event))
+        self.assertEqual(len(compact), len(event))
+        self.assertEqual(compact['extra.mail_subject'], 'This is a test')
+        self.assertEqual(compact.get('source.port'), 53)
+        self.assertIsNone(compact.get('source.fqdn'))
+        self.assertIn('source.ip', compact)
+        self.assertNotIn('source.fqdn', compact)
+        self.assertEqual(list(compact)[-1], 'extra.mail_subject')
+        with self.assertRaises(KeyError):
+            compact['source.fqdn']
+        compact['source.fqdn'] = 'example.com'
+        self.assertEqual(compact['source.fqdn'], 'example.com')
+        del compact['source.port']
+        self.assertNotIn('source.port', compact)
+        with self.assertRaises(exceptions.InvalidValue):
+            compact['source.asn'] = 'foo'
+        self.assertNotIn('source.asn', compact)
+
+    def test_to_message(self):
+        """ Test if the message is restored with type and harmonization. """
+        event = self.new_event()
+        restored = message.CompactMessage(event).to_message()
+        self.assertIsInstance(restored, message.Event)
+        self.assertEqual(restored, event)
+        restored.add('source.fqdn', 'example.com')
+        self.assertNotIn('source.fqdn', event)
+        report = message.Report(FEED_FIELDS, harmonization=HARM)
+        self.assertEqual(message.CompactMessage(report).to_message(), report)
+        self.assertEqual(message.Event(message.CompactMessage(report), harmonization=HARM),
+                         message.Event(report, harmonization=HARM))
+
+    def test_shared_layout(self):
+        """ Test if messages with the same fields share the position table. """
+        first = message.CompactMessage(self.new_event())
+        event = self.new_event()
+        event.change('source.port', 80)
+        second = message.CompactMessage(event)
+        self.assertIs(first._CompactMessage__layout, second._CompactMessage__layout)
+        self.assertEqual(second['source.port'], 80)
+        event.add('source.fqdn', 'example.com')
+        self.assertIsNot(first._CompactMessage__layout,
+                         message.CompactMessage(event)._CompactMessage__layout)
+
+    def test_serialize(self):
+        """ Test if the output is the same as for the original message. """
+        event = self.new_event()
+        compact = message.CompactMessage(event)
+        self.assertEqual(json.loads(message.MessageFactory.serialize(compact)),
+                         json.loads(message.MessageFactory.serialize(event)))
+        self.assertEqual(compact.to_json(hierarchical=True), event.to_json(hierarchical=True))
+        self.assertEqual(compact.hash(), event.hash())
+
+    def test_lazy(self):
+        """ Test if lazy messages are converted. """
+        event = self.new_event()
+        lazy = message.MessageFactory.unserialize(event.serialize(), harmonization=HARM, lazy=True)
+        self.assertEqual(message.CompactMessage(lazy), event)
+
 
 class TestReport(unittest.TestCase):
     """
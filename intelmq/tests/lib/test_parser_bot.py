@@ -182,6 +182,76 @@ def test_event(self):
         self.assertMessageEqual(0, EXAMPLE_EVE_1)
 
 
+RAW_COLUMNS = """ip,port,time,type
+192.0.2.3,80,1577872800,malware
+192.0.2.3,,1577872800,malware
+foobar,80,1577872800,malware
+"""
+EXAMPLE_COLUMNS_REPORT = {"feed.name": "Example",
+                          "raw": utils.base64_encode(RAW_COLUMNS),
+                          "__type": "Report",
+                          "time.observation": "2015-08-11T13:03:40+00:00"}
+EXAMPLE_COLUMNS_EVENT = {"feed.name": "Example",
+                         "time.observation": "2015-08-11T13:03:40+00:00",
+                         "source.ip": "192.0.2.3",
+                         "source.port": 80,
+                         "time.source": "2020-01-01T10:00:00+00:00",
+                         "classification.type": "malware",
+                         "__type": "Event",
+                         "raw": utils.base64_encode('ip,port,time,type\r\n'
+                                                    '192.0.2.3,80,1577872800,malware')}
+EXAMPLE_COLUMNS_EVENT_2 = EXAMPLE_COLUMNS_EVENT.copy()
+del EXAMPLE_COLUMNS_EVENT_2['source.port']
+EXAMPLE_COLUMNS_EVENT_2['raw'] = utils.base64_encode('ip,port,time,type\r\n'
+                                                     '192.0.2.3,,1577872800,malware')
+
+
+class DummyColumnsParserBot(bot.ParserBot):
+    """
+    A csv parser bot validating the columns in chunks.
+    """
+    parse_rows = bot.ParserBot.parse_csv_dict
+    recover_line = bot.ParserBot.recover_line_csv_dict
+
+    def parse(self, report):
+        yield from self.sanitize_columns(self.parse_rows(report),
+                                         {'source.ip': 'ip', 'source.port': 'port',
+                                          'time.source': 'time', 'classification.type': 'type'},
+                                         time_formats={'time.source': 'epoch_millis'},
+                                         chunk_size=2)
+
+    def parse_line(self, line, report):
+        row, values = line
+        event = self.new_event_from_columns(values, report)
+        event['raw'] = self.recover_line(row)
+        yield event
+
+
+class TestDummyColumnsParserBot(test.BotTestCase, unittest.TestCase):
+    @classmethod
+    def set_bot(cls):
+        cls.bot_reference = DummyColumnsParserBot
+        cls.default_input_message = EXAMPLE_COLUMNS_REPORT
+        cls.allowed_error_count = 1
+
+    def test_event(self):
+        """ Test sanitize_columns and new_event_from_columns. """
+        self.run_bot()
+        self.assertMessageEqual(0, EXAMPLE_COLUMNS_EVENT)
+        self.assertMessageEqual(1, EXAMPLE_COLUMNS_EVENT_2)
+        self.assertOutputQueueLen(2)
+        self.assertLogMatches(pattern="Failed to parse line.", levelname="ERROR")
+        self.assertRegexpMatchesLog("InvalidValue: invalid value 'foobar'")
+
+    def test_timestamp_column(self):
+        """ Test if sanitize_columns keeps the time formats, invalid times. """
+        self.input_message = EXAMPLE_COLUMNS_REPORT.copy()
+        self.input_message['raw'] = utils.base64_encode('ip,port,time,type\n192.0.2.3,80,foo,malware\n')
+        self.run_bot()
+        self.assertOutputQueueLen(0)
+        self.assertRegexpMatchesLog("InvalidValue: invalid value 'foo'")
+
+
 EXAMPLE_JSON_STREAM_REPORT = {'__type': 'Report',
                               'raw': utils.base64_encode('''{"a": 1}
 {"a": 2}''')}
@@ -9,12 +9,15 @@
 """
 import logging
 import os
+import socket
 import time
 import unittest
+from unittest import mock
 
 import intelmq.lib.pipeline as pipeline
 import intelmq.lib.test as test
 import intelmq.lib.exceptions as exceptions
+from intelmq.lib.message import BINARY_MESSAGE_PREFIX
 
 SAMPLES = {'normal': [b'Lorem ipsum dolor sit amet',
                       'Lorem ipsum dolor sit amet'],
@@ -129,6 +132,109 @@ def test_bad_encoding_and_pop(self):
         self.assertEqual(self.pipe.count_queued_messages('test-bot-input')['test-bot-input'], 0)
         self.assertEqual(self.pipe.count_queued_messages('test-bot-input-internal')['test-bot-input-internal'], 0)
 
+    def test_receive_batch(self):
+        self.pipe.state['test-bot-input'] = [SAMPLES['normal'][0], SAMPLES['unicode'][0],
+                                             SAMPLES['normal'][0]]
+        self.assertEqual([SAMPLES['normal'][1], SAMPLES['unicode'][1]],
+                         self.pipe.receive_batch(2))
+        self.assertEqual(self.pipe.count_queued_messages('test-bot-input', 'test-bot-input-internal'),
+                         {'test-bot-input': 1, 'test-bot-input-internal': 2})
+        self.pipe.acknowledge_batch()
+        self.assertEqual(self.pipe.count_queued_messages('test-bot-input', 'test-bot-input-internal'),
+                         {'test-bot-input': 1, 'test-bot-input-internal': 0})
+
+    def test_receive_batch_replay(self):
+        """ Unacknowledged messages in the internal queue are received again. """
+        self.pipe.state['test-bot-input'] = [SAMPLES['normal'][0], SAMPLES['unicode'][0]]
+        self.pipe.receive_batch(5)
+        self.pipe.reject_message()
+        self.assertEqual([SAMPLES['normal'][1], SAMPLES['unicode'][1]],
+                         self.pipe.receive_batch(5))
+
+    def test_acknowledge_batch_indices(self):
+        """ Messages are removed in order, acknowledged messages behind a rejected one on rejection. """
+        self.pipe.state['test-bot-input'] = [SAMPLES['normal'][0], SAMPLES['unicode'][0], b'foo', b'bar']
+        self.pipe.receive_batch(5)
+        self.pipe.acknowledge_batch([1, 3])
+        self.assertEqual(len(self.pipe.state['test-bot-input-internal']), 4)
+        self.pipe.acknowledge_batch([0])
+        self.assertEqual(self.pipe.state['test-bot-input-internal'], [b'foo', b'bar'])
+        with self.assertRaises(exceptions.InvalidArgument):
+            self.pipe.acknowledge_batch([4])
+        self.pipe.reject_message()
+        self.assertEqual(['foo'], self.pipe.receive_batch(5))
+
+    def test_send_batch(self):
+        self.pipe.send_batch([SAMPLES['normal'][1], SAMPLES['unicode'][1]])
+        self.assertEqual([SAMPLES['normal'][0], SAMPLES['unicode'][0]],
+                         self.pipe.state['test-bot-output'])
+
+    def test_send_sharded(self):
+        """ Messages with the same shard key are sent to the same queue. """
+        self.pipe.set_queues(['test-bot-output', 'test-bot-output-2'], 'destination')
+        self.pipe.send_batch([SAMPLES['normal'][1]] * 3,
+                             shard_keys=['192.0.2.1', '198.51.100.1', '192.0.2.1'])
+        self.pipe.send(SAMPLES['unicode'][1], shard_key='198.51.100.1')
+        self.assertEqual([SAMPLES['normal'][0], SAMPLES['unicode'][0]],
+                         self.pipe.state['test-bot-output'])
+        self.assertEqual([SAMPLES['normal'][0]] * 2,
+                         self.pipe.state['test-bot-output-2'])
+
+    def test_select_queues_stable(self):
+        """ The shard hash does not depend on the process, unlike hash(). """
+        queues = ['a', 'b', 'c']
+        self.assertEqual(self.pipe._select_queues(queues, 'example.com'), ['c'])
+        self.assertEqual(self.pipe._select_queues(queues, 'example.org'), ['a'])
+
+    def test_receive_batch_bad_encoding(self):
+        self.pipe.state['test-bot-input'] = [SAMPLES['badencoding'], SAMPLES['normal'][0]]
+        self.assertEqual([SAMPLES['badencoding'], SAMPLES['normal'][1]],
+                         self.pipe.receive_batch(2))
+
+    def test_receive_binary(self):
+        """ Binary encoded messages are passed through undecoded. """
+        binary = BINARY_MESSAGE_PREFIX + b'\x01\xff'
+        self.pipe.state['test-bot-input'] = [binary, SAMPLES['normal'][0]]
+        self.assertEqual(binary, self.pipe.receive())
+        self.pipe.acknowledge()
+        self.pipe.state['test-bot-input'] = [binary, SAMPLES['normal'][0]]
+        self.assertEqual([binary, SAMPLES['normal'][1]],
+                         self.pipe.receive_batch(2))
+
+    def test_compression_zlib(self):
+        """ Messages above the threshold are compressed transparently. """
+        self.pipe.parameters.destination_pipeline_compression = 'zlib'
+        self.pipe.parameters.destination_pipeline_compression_threshold = 100
+        self.pipe.set_queues('test-bot-input', 'destination')
+        large = SAMPLES['unicode'][1] * 100
+        self.pipe.send(large)
+        self.pipe.send(SAMPLES['normal'][1])
+        compressed, uncompressed = self.pipe.state['test-bot-input']
+        self.assertTrue(compressed.startswith(pipeline.ZLIB_PREFIX))
+        self.assertLess(len(compressed), len(large.encode()))
+        self.assertEqual(SAMPLES['normal'][0], uncompressed)
+        self.assertEqual([large, SAMPLES['normal'][1]],
+                         self.pipe.receive_batch(2))
+
+    @unittest.skipIf(pipeline.lz4 is None, 'lz4 is not installed.')
+    def test_compression_lz4(self):
+        self.pipe.parameters.destination_pipeline_compression = 'lz4'
+        self.pipe.parameters.destination_pipeline_compression_threshold = 0
+        self.pipe.set_queues('test-bot-input', 'destination')
+        self.pipe.send(SAMPLES['unicode'][1])
+        self.assertTrue(self.pipe.state['test-bot-input'][0].startswith(pipeline.LZ4_PREFIX))
+        self.assertEqual(SAMPLES['unicode'][1], self.pipe.receive())
+
+    def test_compression_invalid(self):
+        self.pipe.parameters.destination_pipeline_compression = 'rar'
+        with self.assertRaises(exceptions.InvalidArgument):
+            self.pipe.set_queues('test-bot-output', 'destination')
+
+    def test_decompression_error(self):
+        self.pipe.state['test-bot-input'] = [pipeline.ZLIB_PREFIX + b'foo']
+        with self.assertRaises(exceptions.DecodingError):
+            self.pipe.receive()
+
     def tearDown(self):
         self.pipe.state = {}
 
@@ -169,6 +275,22 @@ def test_send_receive_unicode(self):
         self.pipe.send(SAMPLES['unicode'][1])
         self.assertEqual(SAMPLES['unicode'][1], self.pipe.receive())
 
+    def test_process_instance_internal_queue(self):
+        """ Worker processes of bots use separate internal queues. """
+        class Bot:
+            process_instance_id = '1'
+        pipe = pipeline.Redis(self.pipe.parameters, self.pipe.logger, Bot())
+        pipe.set_queues('test', 'source')
+        self.assertEqual(pipe.internal_queue, 'test-internal.1')
+
+    def test_send_receive_compressed(self):
+        self.clear()
+        self.pipe.compression = 'zlib'
+        self.pipe.compression_threshold = 10
+        self.pipe.send(SAMPLES['unicode'][1] * 10)
+        self.assertTrue(self.pipe.pipe.lindex('test', 0).startswith(pipeline.ZLIB_PREFIX))
+        self.assertEqual(SAMPLES['unicode'][1] * 10, self.pipe.receive())
+
     def test_count(self):
         self.clear()
         self.pipe.send(SAMPLES['normal'][0])
@@ -176,6 +298,20 @@ def test_count(self):
         self.pipe.send(SAMPLES['unicode'][0])
         self.assertEqual(self.pipe.count_queued_messages('test'), {'test': 3})
 
+    def test_count_multi(self):
+        self.clear()
+        self.pipe.clear_queue('test2')
+        self.pipe.send(SAMPLES['normal'][0])
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test2'),
+                         {'test': 1, 'test2': 0})
+
+    def test_nonempty_queues(self):
+        self.clear()
+        self.pipe.send(SAMPLES['normal'][0])
+        self.assertIn('test', self.pipe.nonempty_queues())
+        self.pipe.clear_queue('test')
+        self.assertNotIn('test', self.pipe.nonempty_queues())
+
     def test_has_message(self):
         self.assertFalse(self.pipe._has_message)
         self.pipe.send(SAMPLES['normal'][0])
@@ -205,6 +341,211 @@ def test_bad_encoding_and_pop(self):
         self.assertEqual(self.pipe.count_queued_messages('test-bot-input')['test-bot-input'], 0)
         self.assertEqual(self.pipe.count_queued_messages('test-bot-input-internal')['test-bot-input-internal'], 0)
 
+    def test_send_multiple_destinations(self):
+        self.clear()
+        self.pipe.set_queues(['test', 'test-2'], 'destination')
+        self.pipe.clear_queue('test-2')
+        self.pipe.send(SAMPLES['normal'][0])
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-2'),
+                         {'test': 1, 'test-2': 1})
+        self.pipe.clear_queue('test-2')
+
+    def test_send_batch(self):
+        self.clear()
+        self.pipe.send_batch([SAMPLES['normal'][0], SAMPLES['unicode'][1]])
+        self.assertEqual(self.pipe.count_queued_messages('test'), {'test': 2})
+        self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
+        self.pipe.acknowledge()
+        self.assertEqual(SAMPLES['unicode'][1], self.pipe.receive())
+
+    def test_send_batch_load_balance(self):
+        self.clear()
+        self.pipe.set_queues(['test', 'test-2'], 'destination')
+        self.pipe.load_balance = True
+        self.pipe.clear_queue('test-2')
+        self.pipe.send_batch([SAMPLES['normal'][0]] * 3)
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-2'),
+                         {'test': 2, 'test-2': 1})
+        self.pipe.clear_queue('test-2')
+
+    def test_send_batch_sharded(self):
+        self.clear()
+        self.pipe.set_queues(['test', 'test-2'], 'destination')
+        self.pipe.load_balance = True
+        self.pipe.clear_queue('test-2')
+        self.pipe.send_batch([SAMPLES['normal'][0]] * 3, shard_keys=['a', 'a', 'a'])
+        counts = self.pipe.count_queued_messages('test', 'test-2')
+        self.assertEqual(sorted(counts.values()), [0, 3])
+        self.pipe.clear_queue('test-2')
+
+    def test_receive_batch(self):
+        self.clear()
+        for _ in range(3):
+            self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.assertEqual([SAMPLES['normal'][1]] * 2,
+                         self.pipe.receive_batch(2))
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-internal'),
+                         {'test': 2, 'test-internal': 2})
+        self.pipe.acknowledge_batch()
+        self.assertEqual([SAMPLES['normal'][1], SAMPLES['unicode'][1]],
+                         self.pipe.receive_batch(5))
+        self.pipe.acknowledge_batch()
+        self.assertEqual(self.pipe.count_queued_messages('test', 'test-internal'),
+                         {'test': 0, 'test-internal': 0})
+
+    def test_receive_batch_replay(self):
+        """ Unacknowledged messages in the internal queue are received again. """
+        self.clear()
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.pipe.receive_batch(5)
+        self.pipe.reject_message()
+        self.assertEqual([SAMPLES['normal'][1], SAMPLES['unicode'][1]],
+                         self.pipe.receive_batch(5))
+        self.pipe.acknowledge_batch()
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'),
+                         {'test-internal': 0})
+
+    def test_acknowledge_batch_indices(self):
+        """ Messages are removed in order, acknowledged messages behind a rejected one on rejection. """
+        self.clear()
+        for message in (SAMPLES['normal'][0], SAMPLES['unicode'][0], 'foo', 'bar'):
+            self.pipe.send(message)
+        self.pipe.receive_batch(5)
+        self.pipe.acknowledge_batch([1, 3])
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'), {'test-internal': 4})
+        self.pipe.acknowledge_batch([0])
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'), {'test-internal': 2})
+        self.pipe.reject_message()
+        self.assertEqual(['foo'], self.pipe.receive_batch(5))
+        self.pipe.acknowledge_batch()
+        self.assertEqual(self.pipe.count_queued_messages('test-internal'), {'test-internal': 0})
+
+    def tearDown(self):
+        self.pipe.disconnect()
+        self.clear()
+
+
+@test.skip_redis()
+class TestRedisstreams(unittest.TestCase):
+    """
+    We use the stream 'test' for both source and destination
+    """
+
+    def setUp(self):
+        self.params = Parameters()
+        self.params.broker = 'Redisstreams'
+        setattr(self.params, 'source_pipeline_password', os.getenv('INTELMQ_TEST_REDIS_PASSWORD'))
+        setattr(self.params, 'source_pipeline_db', 4)
+        setattr(self.params, 'destination_pipeline_password', os.getenv('INTELMQ_TEST_REDIS_PASSWORD'))
+        setattr(self.params, 'destination_pipeline_db', 4)
+        self.logger = logging.getLogger('foo')
+        self.logger.addHandler(logging.NullHandler())
+        self.pipe = self.new_pipe()
+        self.pipe.connect()
+        self.clear()
+        self.pipe.connect()  # re-creates the consumer group
+
+    def new_pipe(self):
+        pipe = pipeline.PipelineFactory.create(self.params, self.logger)
+        pipe.set_queues('test', 'source')
+        pipe.set_queues('test', 'destination')
+        return pipe
+
+    def clear(self):
+        self.pipe.clear_queue(self.pipe.source_queue)
+
+    def test_send_receive(self):
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][1])
+        self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
+        self.pipe.acknowledge()
+        self.assertEqual(SAMPLES['unicode'][1], self.pipe.receive())
+
+    def test_count(self):
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['normal'][1])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.assertEqual(self.pipe.count_queued_messages('test'), {'test': 3})
+
+    def test_nonempty_queues(self):
+        """ Empty streams still exist but are not reported. """
+        self.assertNotIn('test', self.pipe.nonempty_queues())
+        self.pipe.send(SAMPLES['normal'][0])
+        self.assertIn('test', self.pipe.nonempty_queues())
+
+    def test_acknowledge(self):
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.receive()
+        self.pipe.acknowledge()
+        self.assertEqual(self.pipe.count_queued_messages('test')['test'], 0)
+
+    def test_reject(self):
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.pipe.receive()
+        self.pipe.reject_message()
+        self.assertEqual(SAMPLES['normal'][1], self.pipe.receive())
+
+    def test_receive_batch(self):
+        for _ in range(3):
+            self.pipe.send(SAMPLES['normal'][0])
+        self.assertEqual([SAMPLES['normal'][1]] * 2,
+                         self.pipe.receive_batch(2))
+        self.pipe.acknowledge_batch()
+        self.assertEqual(self.pipe.count_queued_messages('test')['test'], 1)
+
+    def test_acknowledge_batch_indices(self):
+        """ Messages of a batch are acknowledged individually. """
+        for message in (SAMPLES['normal'][0], SAMPLES['unicode'][0], 'foo'):
+            self.pipe.send(message)
+        self.pipe.receive_batch(5)
+        self.pipe.acknowledge_batch([1])
+        self.assertEqual(self.pipe.count_queued_messages('test')['test'], 2)
+        self.pipe.reject_message()
+        self.assertEqual([SAMPLES['normal'][1], 'foo'], self.pipe.receive_batch(5))
+
+    def test_pending_recovery(self):
+        """ Messages of a crashed consumer are delivered to the same consumer again. """
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.pipe.receive()
+        restarted = self.new_pipe()
+        restarted.connect()
+        self.assertEqual(SAMPLES['normal'][1], restarted.receive())
+
+    def test_claim_idle(self):
+        """ Idle pending messages of another consumer are claimed. """
+        self.pipe.send(SAMPLES['normal'][0])
+        self.pipe.send(SAMPLES['unicode'][0])
+        self.pipe.receive()
+        setattr(self.params, 'source_pipeline_stream_claim_idle_time', 0)
+        other = self.new_pipe()
+        other.connect()
+        other.consumer = 'other-consumer'
+        self.assertEqual(SAMPLES['normal'][1], other.receive())
+        other.acknowledge()
+        self.assertEqual(SAMPLES['unicode'][1], other.receive())
+
+    def test_claim_interval(self):
+        """ The check for idle pending messages has its own interval. """
+        setattr(self.params, 'source_pipeline_stream_claim_idle_time', 600)
+        self.assertEqual(self.new_pipe().claim_interval, 60)
+        setattr(self.params, 'source_pipeline_stream_claim_idle_time', 10)
+        self.assertEqual(self.new_pipe().claim_interval, 10)
+        setattr(self.params, 'source_pipeline_stream_claim_interval', 5)
+        self.assertEqual(self.new_pipe().claim_interval, 5)
+
+    def test_consumer_name(self):
+        """ The consumer name consists of the host name and the bot ID. """
+        bot = mock.Mock(bot_id='test-bot.1')
+        pipe = pipeline.PipelineFactory.create(self.params, self.logger, bot=bot)
+        pipe.set_queues('test', 'source')
+        pipe.connect()
+        self.assertEqual(pipe.consumer, '%s:test-bot.1' % socket.gethostname())
+        pipe.disconnect()
+
     def tearDown(self):
         self.pipe.disconnect()
         self.clear()